@@ -1,148 +1,98 @@
 import os
-import requests
+import time
 import datetime
-import dateparser
+import logging
 import re
-from flask import Flask, request
-from twilio.twiml.messaging_response import MessagingResponse
-from langdetect import detect
-from transformers import pipeline
+import threading
+from functools import lru_cache
+from flask import Flask, request, Response, jsonify
 from dotenv import load_dotenv
 
-
+# .env antes que los módulos del proyecto: leen su configuración al importarse
 load_dotenv()
 
+import http_client
+import intent_engine
+from intent_engine import detect_intent
+from keywords import INTENT_MATCHER
+from session_store import create_session_store
+from date_parsing import LayeredDateParser
+from language_id import identify_language, get_identifier
+from entity_extraction import extract_entities
+import metrics
+from structured_logging import setup_logging
+from dedup import IdempotencyIndex
+from availability import SlotIndex, BusinessHours, parse_slots, apply_cal_event
+from dispatcher import Dispatcher, DispatchTimeout
+from lifecycle import start_background
+from responses import ResponseCatalog
+from signatures import WebhookVerifier, TWILIO_SIGNATURE_HEADER, CAL_SIGNATURE_HEADER
+from booking_queue import (BookingQueue, CircuitBreaker, RetryableBookingError, UncertainBookingError,
+                           METADATA_BOOKING_KEY)
+from webhook import get_outbound_queue
+from tenants import Tenant, TenantRegistry, DEFAULT_TENANT_ID
+from booking_index import get_booking_index, signed_metadata, METADATA_PHONE, METADATA_LANG, METADATA_SOURCE
+import timezones
+import faq_cache
+from faq_cache import FAQCache, FAQ_INTENTS
+
+# Logs JSON fuera del hilo de la petición (ver structured_logging.py)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # --- Configuración de Cal.com ---
-CAL_API_KEY = os.getenv("CAL_API_KEY").strip()
+CAL_API_KEY = (os.getenv("CAL_API_KEY") or "").strip()
 CAL_USER = "call-me-please-2tibhe"
 CAL_EVENT_TYPE = "agente-demo"
 CAL_EVENT_TYPE_ID = 3836552
+CAL_API_BASE = os.getenv("CAL_API_BASE", "https://api.cal.com/v2")
 EVENT_DURATION_MINUTES = 30
 
 # --- Configuración de zona horaria ---
-# Para mayor precisión, usaremos UTC como base y convertiremos según Cal.com
+# Zona del negocio; la del cliente se resuelve por sesión o prefijo (ver timezones.py)
 DEFAULT_TIMEZONE = "America/New_York"
 
-# --- Datos del cliente (estado en memoria) ---
-CLIENTS_DATA = {}  # {phone: {name, email, phone}}
-
-# --- Respuestas por idioma ---
-RESPONSES = {
-    "es": {
-        "greeting": "¡Hola! Soy tu asistente virtual. ¿En qué puedo ayudarte hoy?",
-        "help": "¿Necesitas ayuda con algo específico? Puedo agendar citas, dar información de precios, ubicación, horarios, etc.",
-        "pricing": "Nuestros planes empiezan en $10/mes.",
-        "location": "Estamos ubicados en Queens, NY.",
-        "hours": "Nuestro horario es de lunes a sábado de 7 AM a 5 PM.",
-        "delivery": "Sí, realizamos entregas locales dentro de Queens.",
-        "appointment": "¡Perfecto! ¿Podrías decirme tu nombre y email? También me ayudaría conocer tu número de teléfono.",
-        "appointment_next_step": "Ahora dime cuándo quieres tu cita (ej: mañana a las 3 PM o hoy a las 4 PM).",
-        "appointment_confirmed": "✅ Cita reservada para {date} a las {time}! Revisa tu email.",
-        "appointment_error": "Lo siento, hubo un error al reservar. ¿Puedes intentar con otra fecha?",
-        "ask_email": "Por favor, proporciona tu email para agendar la cita.",
-        "ask_name": "Por favor, proporciona tu nombre completo.",
-        "ask_phone": "Por favor, proporciona tu número de teléfono.",
-        "ask_time": "¿Cuándo te gustaría tu cita? (ej: mañana a las 3 PM)",
-        "default": "Gracias por tu mensaje. ¿En qué más puedo ayudarte?",
-        "debug_info": "🕐 Información de debug: Fecha parseada: {parsed}, Fecha objetivo: {target}"
-    },
-    "en": {
-        "greeting": "Hello! I'm your virtual assistant. How can I help you today?",
-        "help": "Do you need help with something specific? I can schedule appointments, provide pricing info, location, hours, etc.",
-        "pricing": "Our plans start at $10/month.",
-        "location": "We are located in Queens, NY.",
-        "hours": "We're open Monday to Saturday from 7 AM to 5 PM.",
-        "delivery": "Yes, we offer local deliveries within Queens.",
-        "appointment": "Great! Could you please tell me your name and email? It would also help to know your phone number.",
-        "appointment_next_step": "Now tell me when you'd like your appointment (e.g., tomorrow at 3 PM or today at 4 PM).",
-        "appointment_confirmed": "✅ Appointment scheduled for {date} at {time}! Check your email.",
-        "appointment_error": "Sorry, there was an error booking your appointment. Could you try another date?",
-        "ask_email": "Please provide your email to schedule the appointment.",
-        "ask_name": "Please provide your full name.",
-        "ask_phone": "Please provide your phone number.",
-        "ask_time": "When would you like your appointment? (e.g., tomorrow at 3 PM)",
-        "default": "Thank you for your message. How else can I help you?",
-        "debug_info": "🕐 Debug info: Parsed date: {parsed}, Target date: {target}"
-    },
-    "fr": {
-        "greeting": "Bonjour ! Je suis votre assistant virtuel. Comment puis-je vous aider aujourd'hui ?",
-        "help": "Avez-vous besoin d'aide avec quelque chose de spécifique ? Je peux prendre des rendez-vous, fournir des informations de tarification, localisation, horaires, etc.",
-        "pricing": "Nos formules commencent à 10 $/mois.",
-        "location": "Nous sommes situés à Queens, NY.",
-        "hours": "Nous sommes ouverts du lundi au samedi de 7h à 17h.",
-        "delivery": "Oui, nous effectuons des livraisons locales dans Queens.",
-        "appointment": "Parfait ! Pourriez-vous me dire votre nom et votre email ? Il serait également utile de connaître votre numéro de téléphone.",
-        "appointment_next_step": "Maintenant dites-moi quand vous souhaitez votre rendez-vous (par exemple : demain à 15h ou aujourd'hui à 16h).",
-        "appointment_confirmed": "✅ Rendez-vous programmé pour le {date} à {time} ! Vérifiez votre email.",
-        "appointment_error": "Désolé, une erreur s'est produite lors de la réservation. Pourriez-vous essayer une autre date ?",
-        "ask_email": "Veuillez fournir votre email pour prendre rendez-vous.",
-        "ask_name": "Veuillez fournir votre nom complet.",
-        "ask_phone": "Veuillez fournir votre numéro de téléphone.",
-        "ask_time": "Quand souhaitez-vous votre rendez-vous ? (par exemple : demain à 15h)",
-        "default": "Merci pour votre message. En quoi d'autre puis-je vous aider ?",
-        "debug_info": "🕐 Info debug: Date parsée: {parsed}, Date cible: {target}"
-    },
-    "de": {
-        "greeting": "Hallo! Ich bin Ihr virtueller Assistent. Wie kann ich Ihnen heute helfen?",
-        "help": "Benötigen Sie Hilfe bei etwas Bestimmtem? Ich kann Termine vereinbaren, Preise, Standort, Öffnungszeiten, usw. mitteilen.",
-        "pricing": "Unsere Pläne beginnen bei 10 $/Monat.",
-        "location": "Wir befinden uns in Queens, NY.",
-        "hours": "Wir haben montags bis samstags von 7 bis 17 Uhr geöffnet.",
-        "delivery": "Ja, wir liefern lokal innerhalb von Queens.",
-        "appointment": "Großartig! Könnten Sie mir bitte Ihren Namen und Ihre E-Mail mitteilen? Es wäre auch hilfreich, Ihre Telefonnummer zu kennen.",
-        "appointment_next_step": "Sagen Sie mir jetzt, wann Sie Ihren Termin möchten (z.B.: morgen um 15:00 oder heute um 16:00).",
-        "appointment_confirmed": "✅ Termin gebucht für den {date} um {time}! Prüfen Sie Ihre E-Mail.",
-        "appointment_error": "Entschuldigung, beim Buchen ist ein Fehler aufgetreten. Können Sie bitte ein anderes Datum versuchen?",
-        "ask_email": "Bitte geben Sie Ihre E-Mail für den Termin an.",
-        "ask_name": "Bitte geben Sie Ihren vollständigen Namen an.",
-        "ask_phone": "Bitte geben Sie Ihre Telefonnummer an.",
-        "ask_time": "Wann möchten Sie Ihren Termin? (z.B.: morgen um 15:00)",
-        "default": "Danke für Ihre Nachricht. Wie kann ich Ihnen sonst noch helfen?",
-        "debug_info": "🕐 Debug-Info: Datum geparst: {parsed}, Zieldatum: {target}"
-    },
-    "it": {
-        "greeting": "Ciao! Sono il tuo assistente virtuale. Come posso aiutarti oggi?",
-        "help": "Hai bisogno di aiuto con qualcosa di specifico? Posso prenotare appuntamenti, fornire informazioni sui prezzi, posizione, orari, ecc.",
-        "pricing": "I nostri piani partono da $10/mese.",
-        "location": "Siamo a Queens, NY.",
-        "hours": "Siamo aperti dal lunedì al sabato dalle 7:00 alle 17:00.",
-        "delivery": "Sì, effettuiamo consegne locali a Queens.",
-        "appointment": "Perfetto! Potresti dirmi il tuo nome e la tua email? Sarebbe utile anche conoscere il tuo numero di telefono.",
-        "appointment_next_step": "Ora dimmi quando vuoi il tuo appuntamento (es.: domani alle 15:00 oggi alle 16:00).",
-        "appointment_confirmed": "✅ Appuntamento fissato per il {date} alle {time}! Controlla la tua email.",
-        "appointment_error": "Spiacenti, si è verificato un errore durante la prenotazione. Potresti provare un'altra data?",
-        "ask_email": "Per favore fornisci la tua email per prenotare l'appuntamento.",
-        "ask_name": "Per favore fornisci il tuo nome completo.",
-        "ask_phone": "Per favore fornisci il tuo numero di telefono.",
-        "ask_time": "Quando vuoi il tuo appuntamento? (es.: domani alle 15:00)",
-        "default": "Grazie per il tuo messaggio. Come posso aiutarti ancora?",
-        "debug_info": "🕐 Info debug: Data analizzata: {parsed}, Data obiettivo: {target}"
-    },
-    "pt": {
-        "greeting": "Olá! Sou seu assistente virtual. Como posso ajudá-lo hoje?",
-        "help": "Precisa de ajuda com algo específico? Posso agendar consultas, fornecer informações de preços, localização, horários, etc.",
-        "pricing": "Nossos planos começam em US$ 10/mês.",
-        "location": "Estamos localizados em Queens, NY.",
-        "hours": "Estamos abertos de segunda a sábado das 7h às 18h.",
-        "delivery": "Sim, fazemos entregas locais em Queens.",
-        "appointment": "Ótimo! Poderia me dizer seu nome e email? Também ajudaria conhecer seu número de telefone.",
-        "appointment_next_step": "Agora me diga quando você quer sua consulta (ex.: amanhã às 15h ou hoje às 16h).",
-        "appointment_confirmed": "✅ Consulta agendada para {date} às {time}! Verifique seu email.",
-        "appointment_error": "Desculpe, ocorreu um erro ao agendar. Você pode tentar outra data?",
-        "ask_email": "Por favor forneça seu email para agendar a consulta.",
-        "ask_name": "Por favor forneça seu nome completo.",
-        "ask_phone": "Por favor forneça seu número de telefone.",
-        "ask_time": "Quando você quer sua consulta? (ex.: amanhã às 15h)",
-        "default": "Obrigado pela sua mensagem. Como mais posso ajudá-lo?",
-        "debug_info": "🕐 Info debug: Data analisada: {parsed}, Data alvo: {target}"
-    }
-}
+# --- Negocios servidos por este despliegue, por número To (ver tenants.py) ---
+# El tenant por defecto es la configuración de arriba
+DEFAULT_TENANT = Tenant(
+    DEFAULT_TENANT_ID,
+    twilio_number=os.getenv("TWILIO_PHONE_NUMBER"),
+    cal_api_key=CAL_API_KEY,
+    cal_api_base=CAL_API_BASE,
+    cal_user=CAL_USER,
+    event_type_id=CAL_EVENT_TYPE_ID,
+    event_type_slug=CAL_EVENT_TYPE,
+    duration_minutes=EVENT_DURATION_MINUTES,
+    timezone=DEFAULT_TIMEZONE,
+    hours=BusinessHours(),
+)
+TENANTS = TenantRegistry(DEFAULT_TENANT)
+
+# --- Datos del cliente (almacén de sesiones, ver session_store.py) ---
+SESSION_STORE = create_session_store()  # {phone: {name, email, phone, appointment_stage}}
+
+# --- Métricas (ver metrics.py): GET /metrics, profiler con SIGUSR2 ---
+metrics.gauge("active_sessions", SESSION_STORE.count, app="conversation")
+metrics.install_profiler_signal()
 
-print("Cargando modelo de IA...")
-intent_classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli", device=-1)
-print("Modelo listo.")
+# --- Reintentos de Twilio: una respuesta por MessageSid (ver dedup.py) ---
+MESSAGE_DEDUP = IdempotencyIndex("messages", store=SESSION_STORE)
+
+# --- Un buzón por teléfono: mensajes del mismo número en orden (ver dispatcher.py) ---
+DISPATCHER = start_background(Dispatcher())
+
+# --- Firmas de Twilio y Cal.com: lo falsificado no llega a la conversación (ver signatures.py) ---
+WEBHOOK_VERIFIER = WebhookVerifier(os.getenv("TWILIO_AUTH_TOKEN"), os.getenv("CAL_WEBHOOK_SECRET"))
+
+# --- Respuestas por idioma (locales/<idioma>.json, ver responses.py) ---
+CATALOG = ResponseCatalog("conversation", default_lang="en")
+
+# --- Preguntas frecuentes sin reserva en curso: salida temprana (ver faq_cache.py) ---
+FAQ_CACHE = FAQCache()
+metrics.gauge("faq_cache_hit_ratio", lambda: FAQ_CACHE.stats()['hit_ratio'] or 0)
+metrics.gauge("faq_cache_saved_seconds", lambda: FAQ_CACHE.saved_ms() / 1000)
 
 def is_valid_email(email):
     """Validar formato de email"""
@@ -156,113 +106,83 @@ def is_valid_phone(phone):
 
 def extract_email_from_text(text):
     """Extraer email del texto"""
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    matches = re.findall(email_pattern, text)
-    return matches[0] if matches else None
+    return extract_entities(text)['email']
 
 def extract_phone_from_text(text):
     """Extraer teléfono del texto"""
-    phone_patterns = [
-        r'\+?1?[\s\-\.]?\(?([0-9]{3})\)?[\s\-\.]?([0-9]{3})[\s\-\.]?([0-9]{4})',  # US/Canada
-        r'\+?[\d\s\-\(\)]{10,}',  # General international
-    ]
-    
-    for pattern in phone_patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            if isinstance(matches[0], tuple):
-                # Si es una tupla (3 grupos), unir
-                return ''.join(matches[0])
-            else:
-                # Si es una cadena simple, limpiar
-                phone = re.sub(r'[^\d+]', '', str(matches[0]))
-                if len(phone) >= 10:
-                    return phone
-    return None
+    return extract_entities(text)['phone']
 
 def extract_name_from_text(text):
     """Extraer nombre del texto"""
-    # Remover palabras clave comunes en todos los idiomas
-    keywords_to_remove = [
-        'mi nombre es', 'me llamo', 'soy', 'my name is', 'i am', 'i\'m',
-        'mon nom est', 'je suis', 'mein name ist', 'ich bin', 
-        'il mio nome è', 'io sono', 'meu nome é', 'eu sou',
-        'mein name ist', 'ich bin', 'ich heiße',
-        'o meu nome é', 'eu sou', 'me chamo',
-        'mon nom est', 'je m\'appelle'
-    ]
-    
-    name_text = text.lower()
-    for keyword in keywords_to_remove:
-        name_text = name_text.replace(keyword, '').strip()
-    
-    # Remover emails, teléfonos y otros patrones
-    name_text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', name_text)
-    name_text = re.sub(r'\+?[\d\s\-\(\)]{10,}', '', name_text)
-    name_text = re.sub(r'[^\w\s]', ' ', name_text)
-    
-    # Limpiar espacios
-    name_text = re.sub(r'\s+', ' ', name_text).strip()
-    
-    # Si hay palabras, tomar las primeras 2-3 como nombre
-    words = name_text.split()
-    if len(words) >= 2:
-        return ' '.join(words[:2])  # Primer nombre + apellido
-    elif len(words) == 1 and len(words[0]) > 2:
-        return words[0]
-    
-    return None
+    return extract_entities(text)['name']
 
-def get_responses_for_lang(lang):
-    """Obtener respuestas para un idioma, con fallback a inglés"""
-    if lang in RESPONSES:
-        return RESPONSES[lang]
-    else:
-        return RESPONSES["en"]  # Fallback a inglés
+def get_responses_for_lang(lang, tenant=DEFAULT_TENANT):
+    """Obtener respuestas para un idioma (con los textos del negocio), con fallback a inglés"""
+    return tenant.catalog("conversation", CATALOG).get(lang)
+
+# Configuración base de dateparser (RELATIVE_BASE se fija en cada llamada)
+DATEPARSER_SETTINGS = {
+    "PREFER_DATES_FROM": "future",
+    "RETURN_AS_TIMEZONE_AWARE": True
+}
+DATEPARSER_LANGUAGES = {"es", "en", "fr", "de", "it", "pt"}
 
-def parse_user_date_time(text):
+@lru_cache(maxsize=None)
+def get_dateparser():
+    """dateparser se importa en el primer uso: es lo más lento del arranque"""
+    import dateparser
+    return dateparser
+
+def dateparser_parse(text, lang, now):
+    """Último recurso del parser por capas: dateparser con el idioma como pista"""
+    settings = dict(DATEPARSER_SETTINGS, RELATIVE_BASE=now.replace(tzinfo=None))
+    if getattr(now.tzinfo, "key", None):
+        # Horas sin zona en el texto = hora de pared del cliente
+        settings["TIMEZONE"] = now.tzinfo.key
+    languages = [lang] if lang in DATEPARSER_LANGUAGES else None
+    return get_dateparser().parse(text, languages=languages, settings=settings)
+
+# Caché + ruta rápida + dateparser (ver date_parsing.py)
+DATE_PARSER = LayeredDateParser(slow_parse=dateparser_parse)
+
+@metrics.timed("date_parsing")
+def parse_user_date_time(text, lang=None, zone=DEFAULT_TIMEZONE):
     """
-    Parsear fecha y hora del mensaje del usuario de forma mejorada
+    Parsear fecha y hora del mensaje del usuario (hora de pared en su zona)
     """
-    # Configuraciones mejoradas para dateparser
-    date_settings = {
-        "PREFER_DATES_FROM": "future",
-        "RELATIVE_BASE": datetime.datetime.now(),
-        "RETURN_AS_TIMEZONE_AWARE": True
-    }
-    
-    # Primera intento con dateparser
-    parsed = dateparser.parse(text, settings=date_settings)
+    zone = timezones.get_zone(zone) if isinstance(zone, str) else zone
+    now = timezones.now(zone)
+
+    # Caché, ruta rápida precompilada y, como último recurso, dateparser
+    parsed = DATE_PARSER.parse(text, lang, now=now)
     
     # Si dateparser falla, usar heurísticas mejoradas
     if not parsed:
-        print(f"🔍 dateparser falló para: {text}")
-        
-        # Obtener la fecha actual en UTC
-        now_utc = datetime.datetime.now(datetime.timezone.utc)
+        logger.debug("🔍 dateparser falló para: %s", text)
         
         # Detectar palabras clave de tiempo en todos los idiomas
         msg_lower = text.lower()
-        target_date = now_utc
+        target_date = now
         
         # Manejar casos específicos para todos los idiomas
         if any(word in msg_lower for word in [
             "hoy", "today", "aujourd'hui", "oggi", "hoje", "heute", "heute"
         ]):
             # Para "hoy", usar la fecha actual
-            target_date = now_utc
+            target_date = now
         elif any(word in msg_lower for word in [
             "mañana", "tomorrow", "demain", "morgen", "domani", "amanhã"
         ]):
             # Para "mañana", sumar un día
-            target_date = now_utc + datetime.timedelta(days=1)
+            target_date = now + datetime.timedelta(days=1)
         else:
             # Por defecto, asumir mañana para ser más conservador
-            target_date = now_utc + datetime.timedelta(days=1)
+            target_date = now + datetime.timedelta(days=1)
         
         # Buscar hora específica
         hour_match = re.search(r'(\d{1,2})\s*(?::\s*(\d{2}))?\s*(am|pm|AM|PM|a\.m\.|p\.m\.?)?', text, re.IGNORECASE)
         
+        hour = None
         if hour_match:
             hour = int(hour_match.group(1))
             minute = int(hour_match.group(2)) if hour_match.group(2) else 0
@@ -275,52 +195,58 @@ def parse_user_date_time(text):
                     hour += 12
                 elif am_pm in ['am', 'a.m.', 'a'] and hour == 12:
                     hour = 0
-            
+            if hour > 23 or minute > 59:
+                hour = None  # "98", "15pm": no es una hora
+        
+        if hour is not None:
             # Crear datetime con la hora específica
             target_date = target_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            print(f"🕐 Fecha construida manualmente: {target_date}")
+            if target_date <= now:
+                # "Hoy" a una hora que ya pasó: el día siguiente (como la ruta rápida)
+                target_date += datetime.timedelta(days=1)
+            logger.debug("🕐 Fecha construida manualmente: %s", target_date)
         else:
             # Si no se encuentra hora, usar 2:00 PM por defecto
             target_date = target_date.replace(hour=14, minute=0, second=0, microsecond=0)
-            print(f"🕐 Usando hora por defecto (2:00 PM): {target_date}")
+            logger.debug("🕐 Usando hora por defecto (2:00 PM): %s", target_date)
         
         parsed = target_date
     
-    print(f"✅ Fecha final parseada: {parsed}")
+    # Una sola normalización: zona del cliente, sin horas inexistentes ni ambiguas
+    parsed = timezones.normalize(parsed, zone)
+    logger.debug("✅ Fecha final parseada: %s", parsed)
     return parsed
 
-def create_cal_booking(start_time, client_name, client_email, client_phone):
-    """Crear reserva en Cal.com"""
-    if not CAL_API_KEY:
-        return False
-
-    # Usar zona horaria específica para Cal.com
-    time_zone = "America/New_York"
+def build_cal_booking(start_time, client_name, client_email, client_phone, tenant=DEFAULT_TENANT, time_zone=None,
+                      metadata=None):
+    """Preparar la petición de reserva para Cal.com: (url, payload, headers)"""
+    # Zona del asistente (la del cliente); por defecto, la del negocio
+    time_zone = time_zone or tenant.timezone
     
-    # Asegurar que start_time tenga zona horaria
+    # Desfase real de esa fecha en la zona (horario de verano incluido);
+    # una hora naive es hora de pared del negocio
     if start_time.tzinfo is None:
-        start_time = start_time.replace(tzinfo=datetime.timezone.utc)
-    
-    # Convertir a la zona horaria de Cal.com
-    if start_time.tzinfo == datetime.timezone.utc:
-        start_time = start_time.astimezone(datetime.timezone(datetime.timedelta(hours=-5)))  # EST
+        start_time = timezones.normalize(start_time, tenant.timezone)
+    start_time = timezones.to_local(start_time, time_zone)
     
     start_iso = start_time.isoformat()
-    end_time = start_time + datetime.timedelta(minutes=EVENT_DURATION_MINUTES)
+    # Duración en tiempo real (no de pared): correcta aunque la cita cruce un cambio de hora
+    end_time = timezones.to_local(start_time.astimezone(timezones.UTC)
+                                  + datetime.timedelta(minutes=tenant.duration_minutes), time_zone)
     end_iso = end_time.isoformat()
 
-    url = "https://api.cal.com/v2/bookings"
+    url = f"{tenant.cal_api_base}/bookings"
     headers = {
         "Content-Type": "application/json",
-        "Authorization": f"Bearer {CAL_API_KEY}"
+        "Authorization": f"Bearer {tenant.cal_api_key}"
     }
 
     payload = {
-        "eventTypeId": CAL_EVENT_TYPE_ID,
+        "eventTypeId": tenant.event_type_id,
         "start": start_iso,
         "end": end_iso,
         "timeZone": time_zone,
-        "metadata": {},
+        "metadata": metadata or {},  # Vuelve en los webhooks de Cal.com (ver booking_index.py)
         "language": "en",
         "responses": {
             "name": client_name,
@@ -330,39 +256,235 @@ def create_cal_booking(start_time, client_name, client_email, client_phone):
         }
     }
 
+    logger.info("📤 Enviando booking a Cal.com", extra={
+        "tenant": tenant.id,
+        "event_type_id": tenant.event_type_id,
+        "start": start_iso,
+        "end": end_iso,
+        "time_zone": time_zone,
+        "client_name": client_name,
+        "client_email": client_email,
+    })
+    return url, payload, headers
+
+def booking_succeeded(status_code, body):
+    """Interpretar la respuesta de Cal.com"""
+    logger.info("📥 Respuesta de Cal.com: %s", status_code, extra={"status": status_code})
+    if status_code in (200, 201):
+        return True
+    logger.error("❌ Error de Cal.com: %s", body, extra={"status": status_code})
+    return False
+
+@metrics.timed("cal_booking")
+def create_cal_booking(start_time, client_name, client_email, client_phone, tenant=DEFAULT_TENANT,
+                       time_zone=None, metadata=None):
+    """
+    Crear reserva en Cal.com.
+
+    RetryableBookingError si el fallo es transitorio y la petición no llegó;
+    UncertainBookingError si pudo llegar sin respuesta (el booking puede existir).
+    """
+    if not tenant.cal_api_key:
+        return False
+
+    url, payload, headers = build_cal_booking(start_time, client_name, client_email, client_phone, tenant,
+                                              time_zone, metadata)
     try:
-        print(f"📤 Enviando booking a Cal.com:")
-        print(f"   Event Type ID: {CAL_EVENT_TYPE_ID}")
-        print(f"   Start: {start_iso}")
-        print(f"   End: {end_iso}")
-        print(f"   Time Zone: {time_zone}")
-        print(f"   Cliente: {client_name} ({client_email})")
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        print(f"📥 Respuesta de Cal.com: {response.status_code}")
-        if response.status_code not in (200, 201):
-            print(f"❌ Error: {response.text}")
-        
-        if response.status_code in (200, 201):
-            return True
-        else:
-            return False
-            
+        response = http_client.post(url, json=payload, headers=headers)
+    except Exception as e:
+        logger.error("❌ Excepción al crear booking: %s", e)
+        if http_client.not_sent(e):
+            raise RetryableBookingError(str(e)) from e
+        raise UncertainBookingError(str(e)) from e
+    if response.status_code == 429 or response.status_code >= 500:
+        logger.error("❌ Cal.com no disponible: %s", response.status_code, extra={"status": response.status_code})
+        raise RetryableBookingError(f"Cal.com respondió {response.status_code}")
+    success = booking_succeeded(response.status_code, response.text)
+    if success and metadata and metadata.get(METADATA_PHONE):
+        # uid y email -> conversación: los avisos de reprogramación o cancelación llegan a este cliente
+        data = response.json().get('data') or {}
+        get_booking_index().remember(metadata[METADATA_PHONE], uid=data.get('uid'), email=client_email,
+                                     tenant=tenant.id, lang=metadata.get(METADATA_LANG), tz=time_zone)
+    return success
+
+def find_cal_booking(start_time, client_email, key, tenant=DEFAULT_TENANT):
+    """
+    ¿Existe ya en Cal.com el booking de este trabajo? (la creación anterior
+    quedó sin respuesta). Busca los bookings del email en ese hueco y compara
+    la clave de idempotencia de su metadata, o el mismo inicio.
+    """
+    try:
+        response = http_client.get(
+            f"{tenant.cal_api_base}/bookings",
+            params={
+                "attendeeEmail": client_email,
+                "afterStart": (start_time - datetime.timedelta(minutes=1)).isoformat(),
+                "beforeEnd": (start_time + datetime.timedelta(minutes=tenant.duration_minutes + 1)).isoformat(),
+            },
+            headers={
+                "Authorization": f"Bearer {tenant.cal_api_key}",
+                "cal-api-version": "2024-08-13"
+            }
+        )
     except Exception as e:
-        print(f"❌ Excepción al crear booking: {e}")
+        logger.error("❌ Excepción al buscar el booking: %s", e)
+        raise RetryableBookingError(str(e)) from e
+    if response.status_code != 200:
+        raise RetryableBookingError(f"Cal.com respondió {response.status_code} al buscar la reserva")
+    for booking in response.json().get('data') or []:
+        if booking.get('status') in ("cancelled", "rejected"):
+            continue
+        metadata = booking.get('metadata') or {}
+        start = booking.get('start') or booking.get('startTime')
+        same_start = bool(start) and datetime.datetime.fromisoformat(start.replace("Z", "+00:00")) == start_time
+        if metadata.get(METADATA_BOOKING_KEY) == key or same_start:
+            return True
+    return False
+
+def fetch_cal_slots(start, end, tenant=DEFAULT_TENANT):
+    """Huecos libres del tipo de evento entre start y end (lo usa el índice de disponibilidad)"""
+    response = http_client.get(
+        f"{tenant.cal_api_base}/slots",
+        params={
+            "eventTypeId": tenant.event_type_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "timeZone": "UTC"
+        },
+        headers={
+            "Authorization": f"Bearer {tenant.cal_api_key}",
+            "cal-api-version": "2024-09-04"
+        }
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Error API Cal.com {response.status_code}: {response.text}")
+    return parse_slots(response.json())
+
+# Disponibilidad local: se valida antes de llamar a Cal.com (ver availability.py).
+# Los hilos de fondo arrancan en los workers, no en el master de gunicorn (ver lifecycle.py)
+SLOT_INDEX = SlotIndex(fetch_cal_slots, CAL_EVENT_TYPE_ID, EVENT_DURATION_MINUTES, hours=DEFAULT_TENANT.hours)
+if CAL_API_KEY:
+    start_background(SLOT_INDEX)
+DEFAULT_TENANT.slot_index = SLOT_INDEX
+_slot_index_lock = threading.Lock()
+
+def slot_index_for(tenant):
+    """Índice de disponibilidad del negocio (se crea con su primera conversación)"""
+    if tenant.slot_index is None:
+        with _slot_index_lock:
+            if tenant.slot_index is None:
+                index = SlotIndex(lambda start, end: fetch_cal_slots(start, end, tenant),
+                                  tenant.event_type_id, tenant.duration_minutes, hours=tenant.hours)
+                if tenant.cal_api_key:
+                    index.start()
+                tenant.slot_index = index
+    return tenant.slot_index
+
+# --- Reservas en cola: el webhook responde al momento y la confirmación llega
+# después por WhatsApp (ver booking_queue.py) ---
+def book_queued(payload, key):
+    """Reserva de un trabajo de la cola (su clave de idempotencia viaja en la metadata)"""
+    start_time = datetime.datetime.fromisoformat(payload['start_time'])
+    # Negocio eliminado del archivo: el trabajo falla (no se reserva en la cuenta por defecto)
+    tenant = TENANTS.require(payload.get('tenant', DEFAULT_TENANT_ID))
+    metadata = dict(signed_metadata(payload['from_number'], tenant.id, payload['lang']),
+                    **{METADATA_SOURCE: 'conversation',  # La confirmación la envía notify_booking_result
+                       METADATA_BOOKING_KEY: key})
+    return create_cal_booking(start_time, payload['name'], payload['email'], payload['phone'], tenant,
+                              payload.get('tz'), metadata)
+
+def find_queued(payload, key):
+    """¿Ya creó Cal.com la reserva de un trabajo cuyo intento anterior quedó sin respuesta?"""
+    tenant = TENANTS.require(payload.get('tenant', DEFAULT_TENANT_ID))
+    if not tenant.cal_api_key:
         return False
+    return find_cal_booking(datetime.datetime.fromisoformat(payload['start_time']), payload['email'], key, tenant)
+
+def notify_booking_result(job, success):
+    """Actualizar la sesión y enviar la confirmación (o el error) por WhatsApp"""
+    booking = dict(job['payload'], start_time=datetime.datetime.fromisoformat(job['payload']['start_time']))
+    tenant = TENANTS.require(booking.get('tenant', DEFAULT_TENANT_ID))
+    text = finish_conversation(booking['from_number'], booking, success, tenant)
+    get_outbound_queue().enqueue(booking['from_number'], text, sender=tenant.twilio_number)
+
+BOOKING_QUEUE = start_background(BookingQueue(book_queued, notify_booking_result, find_queued))
+metrics.gauge("booking_queue_depth", BOOKING_QUEUE.journal.pending)
+metrics.gauge("booking_circuit_state", lambda: CircuitBreaker.STATES[BOOKING_QUEUE.breaker.state])
+
+def enqueue_booking(client_data, responses, booking, from_number, tenant=DEFAULT_TENANT):
+    """Encolar la reserva y devolver la respuesta inmediata"""
+    payload = dict(booking, start_time=booking['start_time'].isoformat(), from_number=from_number, tenant=tenant.id)
+    status = BOOKING_QUEUE.submit(tenant.session_key(from_number), booking['start_time'], payload)
+    if status == 'duplicate':
+        # Mismo teléfono y mismo hueco: ya está en curso o reservado
+        client_data['appointment_stage'] = 'collecting_info'
+        return responses.render('booking_duplicate', date=booking['date'], time=booking['time'])
+    return responses.render('booking_processing', date=booking['date'], time=booking['time'])
+
+def format_slots(slots, zone=DEFAULT_TIMEZONE):
+    """Huecos sugeridos en la hora local del cliente"""
+    return ", ".join(timezones.to_local(slot, zone).strftime("%Y-%m-%d %I:%M %p") for slot in slots)
+
+def new_client(phone):
+    """Datos iniciales de un cliente nuevo"""
+    return {
+        'name': None,
+        'email': None,
+        'phone': phone,
+        'appointment_stage': 'collecting_info',  # collecting_info, waiting_time, booking
+        'lang': None,  # Idioma de la conversación (ver language_id.py)
+        'tz': None  # Zona horaria del cliente (ver timezones.py)
+    }
 
 def get_or_create_client(phone):
     """Obtener o crear datos del cliente"""
-    if phone not in CLIENTS_DATA:
-        CLIENTS_DATA[phone] = {
-            'name': None,
-            'email': None,
-            'phone': phone,
-            'appointment_stage': 'collecting_info'  # collecting_info, waiting_time
-        }
-    return CLIENTS_DATA[phone]
+    client_data = SESSION_STORE.load(phone)
+    if client_data is None:
+        client_data = new_client(phone)
+        SESSION_STORE.save(phone, client_data)
+    return client_data
+
+def step_conversation(msg, from_number, tenant=DEFAULT_TENANT, intent=None):
+    """Avanzar la conversación y devolver el texto de respuesta (la reserva queda en cola)"""
+    # Procesar el mensaje con la sesión bloqueada (se guarda al salir)
+    with SESSION_STORE.session(tenant.session_key(from_number), lambda _: new_client(from_number)) as client_data:
+        # Detectar idioma (se mantiene el de la conversación en mensajes cortos o ambiguos)
+        with metrics.span("language_detection"):
+            detected = identify_language(msg, sticky=client_data.get('lang'), default=None)
+        # Un idioma por defecto (sin pistas) no se fija como el de la conversación
+        client_data['lang'] = detected
+        lang = detected or "en"
+        logger.debug("🌍 Idioma detectado: %s", lang, extra={"phone": from_number})
+
+        # Obtener respuestas para el idioma detectado (con fallback a inglés)
+        responses = get_responses_for_lang(lang, tenant)
+        text, booking = handle_message(msg, client_data, responses, lang, tenant, intent)
+        if booking:
+            text = enqueue_booking(client_data, responses, booking, from_number, tenant)
+        return text
+
+def finish_conversation(from_number, booking, success, tenant=DEFAULT_TENANT):
+    """Registrar el resultado de la reserva (desde la cola) y devolver el texto de seguimiento"""
+    metrics.inc("bookings_total", result="success" if success else "failed")
+    if success:
+        slot_index_for(tenant).occupy(booking['start_time'])
+    with SESSION_STORE.session(tenant.session_key(from_number), lambda _: new_client(from_number)) as client_data:
+        responses = get_responses_for_lang(booking['lang'], tenant)
+        return complete_booking(client_data, responses, booking, success)
+
+@app.before_request
+def verify_webhook_signature():
+    """Rechazar peticiones sin firma válida antes de tocar sesiones, modelos o Cal.com"""
+    if request.method != "POST":
+        return None
+    if request.path == "/webhook":
+        valid = WEBHOOK_VERIFIER.verify_twilio(request.url, request.form,
+                                               request.headers.get(TWILIO_SIGNATURE_HEADER))
+    elif request.path == "/webhook/cal":
+        valid = WEBHOOK_VERIFIER.verify_cal(request.get_data(), request.headers.get(CAL_SIGNATURE_HEADER))
+    else:
+        return None
+    return None if valid else Response("Forbidden", status=403)
 
 @app.route("/webhook", methods=["POST"])
 def whatsapp_webhook():
@@ -370,62 +492,192 @@ def whatsapp_webhook():
     from_number = request.values.get("From", "").strip()
     
     if not msg or not from_number:
-        return str(MessagingResponse().message("Invalid message."))
+        return CATALOG.twiml("Invalid message.")
+
+    logger.info("📱 Mensaje recibido de %s: %s", from_number, msg, extra={"phone": from_number})
 
-    print(f"📱 Mensaje recibido de {from_number}: {msg}")
+    # Un reintento de Twilio recibe la respuesta ya generada (sin reservar dos veces)
+    message_sid = request.values.get("MessageSid", "").strip()
+    tenant = TENANTS.get(request.values.get("To"))
 
-    # Detectar idioma
+    # FAQ fuera del flujo de reserva: sin sesión, buzón ni índice de MessageSid (es idempotente)
+    start = time.perf_counter()
+    twiml, intent = faq_reply(msg, from_number, tenant)
+    if twiml is not None:
+        return twiml
+
+    twiml, duplicate = MESSAGE_DEDUP.run_once(
+        message_sid, lambda: dispatch_reply(msg, from_number, tenant, intent)
+    )
+    if duplicate:
+        logger.info("🔁 Reintento de %s ignorado", message_sid, extra={"phone": from_number})
+    else:
+        FAQ_CACHE.record_full(start)
+    return twiml if twiml is not None else CATALOG.twiml()
+
+def dispatch_reply(msg, from_number, tenant=DEFAULT_TENANT, intent=None):
+    """conversation_reply() en el buzón del teléfono; None (ack vacío) si no termina a tiempo"""
     try:
-        lang = detect(msg)
-        print(f"🌍 Idioma detectado: {lang}")
-    except:
-        lang = "en"
-        print("🌍 Idioma no detectado, usando inglés por defecto")
-
-    # Obtener respuestas para el idioma detectado (con fallback a inglés)
-    responses = get_responses_for_lang(lang)
-    
-    # Obtener o crear datos del cliente
-    client_data = get_or_create_client(from_number)
-    
-    resp = MessagingResponse()
-
-    # Detectar intención
-    msg_lower = msg.lower()
-    appointment_keywords = [
-        # Español
-        "cita", "reservar", "agendar", "citas", "reservar", "agendar",
-        # Inglés
-        "appointment", "book", "schedule", "reserve", "schedule", "booking",
-        # Francés
-        "rendez-vous", "réserver", "prendre", "rendezvous",
-        # Alemán
-        "termin", "vereinbaren", "buchen", "terminen", "buche",
-        # Italiano
-        "appuntamento", "prenotare", "fissare", "prenotare", "fissare",
-        # Portugués
-        "consulta", "agendar", "marcar", "agendar", "marcar"
-    ]
+        return DISPATCHER.call(tenant.session_key(from_number), conversation_reply, msg, from_number, tenant, intent)
+    except DispatchTimeout:
+        # El mensaje sigue en su buzón: la clave de MessageSid queda registrada y un reintento
+        # de Twilio no lo procesa dos veces
+        logger.warning("⏳ Buzón de %s sin terminar en %ss: ack vacío", from_number, DISPATCHER.timeout,
+                       extra={"phone": from_number})
+        metrics.inc("dispatch_timeouts_total", app="conversation")
+        return None
+
+def conversation_reply(msg, from_number, tenant=DEFAULT_TENANT, intent=None):
+    """Procesar el mensaje; devuelve el TwiML de respuesta (sin esperar a Cal.com)"""
+    # Respuestas estáticas: TwiML pre-renderizado (por catálogo del negocio)
+    return tenant.catalog("conversation", CATALOG).twiml(step_conversation(msg, from_number, tenant, intent))
+
+def outside_booking_flow(from_number, tenant=DEFAULT_TENANT):
+    """¿El cliente no tiene sesión, o aún no ha dado ningún dato? (solo lee, no crea la sesión)"""
+    client_data = SESSION_STORE.load(tenant.session_key(from_number))
+    return client_data is None or (client_data['appointment_stage'] == 'collecting_info'
+                                   and not client_data['name'] and not client_data['email'])
+
+def faq_reply(msg, from_number, tenant=DEFAULT_TENANT):
+    """
+    Salida temprana de las preguntas frecuentes (ver faq_cache.py).
+
+    Devuelve (TwiML, None) si es una FAQ de un cliente fuera del flujo de
+    reserva; si no, (None, intención) para seguir por la conversación normal
+    sin volver a detectarla.
+    """
+    start = time.perf_counter()
+    key = (tenant.id, faq_cache.normalize(msg))
+    entry = FAQ_CACHE.get(key)
+    if entry is None:
+        metrics.inc("faq_cache_total", result="miss")
+        with metrics.span("language_detection"):
+            lang = identify_language(msg)
+        with metrics.span("intent"):
+            intent, definitive = detect_intent(msg, fallback=INTENT_MATCHER.first)
+        if definitive:
+            # Si el modelo no respondió (frío o caído) la intención es la de palabras clave: no se guarda
+            FAQ_CACHE.put(key, lang, intent)
+    else:
+        lang, intent = entry
+        metrics.inc("faq_cache_total", result="hit" if intent in FAQ_INTENTS else "pass")
+
+    if intent not in FAQ_INTENTS:
+        return None, intent
+    if not outside_booking_flow(from_number, tenant):
+        # A mitad de la reserva la FAQ sigue el flujo (handle_message pide el dato que falta)
+        metrics.inc("faq_cache_total", result="in_flow")
+        return None, intent
+
+    logger.debug("⚡ FAQ %s (%s) sin sesión", intent, lang, extra={"phone": from_number})
+    twiml = tenant.catalog("conversation", CATALOG).twiml(get_responses_for_lang(lang, tenant)[intent])
+    if entry is not None:
+        FAQ_CACHE.record_hit(start)
+    return twiml, None
+
+@app.route("/webhook/cal", methods=["POST"])
+def cal_webhook():
+    """Eventos de Cal.com: mantener al día el índice de disponibilidad"""
+    apply_cal_event(request.get_json(silent=True) or {})
+    return jsonify({'status': 'success'})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Métricas en formato Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# --- Arranque en caliente ---
+# Importar app.py no carga nada pesado (el proceso responde a /health enseguida).
+# preload() carga dateparser, entrena el identificador de idioma y, con
+# INTENT_MODE=inprocess, el modelo de intenciones. Con gunicorn se llama en el
+# master antes del fork (gunicorn.conf.py) y los workers lo heredan ya cargado.
+_warm = False
+_warm_lock = threading.Lock()
+_warm_thread = None
+
+def preload():
+    """Cargar en este proceso todo lo que es lento la primera vez (bloqueante, sin hilos)"""
+    global _warm
+    start = time.perf_counter()
+    get_dateparser().parse("tomorrow at 10am", languages=sorted(DATEPARSER_LANGUAGES))
+    get_identifier()
+    intent_engine.preload()
+    _warm = True
+    logger.info("🔥 Precarga completada en %.2fs", time.perf_counter() - start)
+
+def warm_up_async():
+    """preload() en un hilo de fondo (servidores sin precarga en el master)"""
+    global _warm_thread
+    with _warm_lock:
+        if _warm or _warm_thread is not None:
+            return
+        _warm_thread = threading.Thread(target=preload, name="preload", daemon=True)
+        _warm_thread.start()
+
+def readiness():
+    """(listo, comprobaciones) del worker: distinto de /health, que solo indica que vive"""
+    if _warm and not intent_engine.ready():
+        # Sin master que haga fork (python app.py, uvicorn) nadie arranca el bucle de lotes
+        intent_engine.warm_up()
+    checks = {
+        'preloaded': _warm,
+        'intent_model': intent_engine.ready(),
+        'dispatcher': DISPATCHER.alive(),
+        'booking_workers': BOOKING_QUEUE.alive(),
+    }
+    return all(checks.values()), checks
+
+@app.route("/health", methods=["GET"])
+def health_check():
+    """Liveness: el proceso atiende peticiones"""
+    return jsonify({'status': 'alive'})
+
+@app.route("/ready", methods=["GET"])
+def ready_check():
+    """Readiness: 503 hasta que el worker está precargado (y lanza la precarga si falta)"""
+    ready, checks = readiness()
+    if not ready:
+        warm_up_async()
+    return jsonify({'status': 'ready' if ready else 'warming', 'checks': checks}), 200 if ready else 503
+
+def handle_message(msg, client_data, responses, lang=None, tenant=DEFAULT_TENANT, intent=None):
+    """
+    Avanzar la conversación del cliente.
     
-    is_appointment_request = any(word in msg_lower for word in appointment_keywords)
+    Devuelve (texto, None), o (None, reserva) cuando hay que reservar en Cal.com;
+    en ese caso el llamador la encola y el worker llama a complete_booking().
+    """
+    # Reserva en cola: la confirmación llegará por WhatsApp (sin pasar por el modelo)
+    if client_data['appointment_stage'] == 'booking':
+        return responses['booking_pending'], None
+
+    # Detectar intención: modelo compartido si está caliente (ver intent_engine.py),
+    # si no el matcher precompilado de palabras clave (ver keywords.py); faq_reply
+    # ya la trae detectada
+    if intent is None:
+        with metrics.span("intent"):
+            intent, _ = detect_intent(msg, fallback=INTENT_MATCHER.first)
+    is_appointment_request = intent == 'appointment'
 
     # Si es la primera vez o se solicita cita
     if is_appointment_request or client_data['appointment_stage'] == 'collecting_info':
-        # Extraer datos del mensaje actual
-        extracted_email = extract_email_from_text(msg)
-        extracted_phone = extract_phone_from_text(msg)
-        extracted_name = extract_name_from_text(msg)
+        # Extraer datos del mensaje actual (una sola pasada, ver entity_extraction.py)
+        with metrics.span("extraction"):
+            entities = extract_entities(msg)
+        extracted_email = entities['email']
+        extracted_phone = entities['phone']
+        extracted_name = entities['name']
         
         # Actualizar datos del cliente si se extrajeron
         if extracted_email and not client_data['email']:
             client_data['email'] = extracted_email
-            print(f"📧 Email extraído: {extracted_email}")
+            logger.debug("📧 Email extraído: %s", extracted_email, extra={"phone": client_data['phone']})
         if extracted_phone and not client_data['phone']:
             client_data['phone'] = extracted_phone
-            print(f"📞 Teléfono extraído: {extracted_phone}")
+            logger.debug("📞 Teléfono extraído: %s", extracted_phone, extra={"phone": client_data['phone']})
         if extracted_name and not client_data['name']:
             client_data['name'] = extracted_name
-            print(f"👤 Nombre extraído: {extracted_name}")
+            logger.debug("👤 Nombre extraído: %s", extracted_name, extra={"phone": client_data['phone']})
         
         # Verificar qué datos faltan
         missing_info = []
@@ -447,74 +699,85 @@ def whatsapp_webhook():
             elif 'phone' in missing_info:
                 text = responses['ask_phone']
             
-            resp.message(text)
-            return str(resp)
+            return text, None
         else:
             # Todos los datos están disponibles, ahora pedir fecha/hora
             client_data['appointment_stage'] = 'waiting_time'
             text = responses['appointment_next_step']
-            resp.message(text)
-            return str(resp)
+            return text, None
 
     # Si ya tenemos todos los datos y esperamos la fecha/hora
     elif client_data['appointment_stage'] == 'waiting_time':
-        print(f"🕐 Parseando fecha/hora: {msg}")
+        logger.debug("🕐 Parseando fecha/hora: %s", msg, extra={"phone": client_data['phone']})
         
-        # Usar la función mejorada de parsing
-        parsed = parse_user_date_time(msg)
+        # Usar la función mejorada de parsing, en la zona horaria del cliente
+        zone = timezones.resolve_user_zone(client_data, client_data['phone'], tenant.timezone)
+        parsed = parse_user_date_time(msg, lang, zone)
         
         if parsed:
+            # Fuera de horario u ocupado: no se llama a Cal.com, se sugieren huecos
+            available, reason, suggestions = slot_index_for(tenant).check(parsed)
+            if not available:
+                reason_key = 'slot_taken' if reason == 'taken' else 'outside_hours'
+                if suggestions:
+                    text = responses.join((reason_key, 'slot_suggestions'), " ",
+                                          slots=format_slots(suggestions, zone))
+                else:
+                    text = responses.join((reason_key, 'ask_time'), " ")
+                return text, None
+            
             date_str = parsed.strftime("%Y-%m-%d")
             time_str = parsed.strftime("%I:%M %p")
             
-            print(f"📅 Fecha objetivo: {date_str}")
-            print(f"🕐 Hora objetivo: {time_str}")
-            
-            # Crear la reserva
-            success = create_cal_booking(
-                parsed, 
-                client_data['name'], 
-                client_data['email'], 
-                client_data['phone']
-            )
+            logger.debug("📅 Fecha objetivo: %s %s", date_str, time_str, extra={"phone": client_data['phone']})
             
-            if success:
-                text = responses['appointment_confirmed'].format(date=date_str, time=time_str)
-            else:
-                text = responses['appointment_error']
-            
-            # Reset para la próxima vez
-            client_data['appointment_stage'] = 'collecting_info'
-            resp.message(text)
-            return str(resp)
+            # La reserva se encola; un worker la crea en Cal.com (ver booking_queue.py)
+            client_data['appointment_stage'] = 'booking'
+            return None, {
+                'start_time': parsed,
+                'date': date_str,
+                'time': time_str,
+                'lang': lang,
+                'tz': zone.key,
+                'name': client_data['name'],
+                'email': client_data['email'],
+                'phone': client_data['phone']
+            }
         else:
             text = responses['ask_time']
-            resp.message(text)
-            return str(resp)
+            return text, None
 
     # Para otras intenciones
-    elif any(word in msg_lower for word in ["precio", "price", "prix", "preis", "preço", "preise"]):
-        text = responses['pricing']
-    elif any(word in msg_lower for word in ["ubicación", "location", "sitio", "lugar", "standort", "posizione", "localização"]):
-        text = responses['location']
-    elif any(word in msg_lower for word in ["horario", "hours", "heures", "horário", "stunden", "orari", "horário"]):
-        text = responses['hours']
-    elif any(word in msg_lower for word in ["entrega", "delivery", "livraison", "entrega", "lieferung", "consegna", "entrega"]):
-        text = responses['delivery']
-    elif any(word in msg_lower for word in ["ayuda", "help", "aide", "hilfe", "aiuto", "ajuda", "hilfe"]):
-        text = responses['help']
+    elif intent in FAQ_INTENTS:
+        text = responses[intent]
     else:
         text = responses['default']
     
-    resp.message(text)
-    return str(resp)
+    return text, None
+
+def complete_booking(client_data, responses, booking, success):
+    """Texto de respuesta según el resultado de la reserva"""
+    if success:
+        text = responses.render('appointment_confirmed', date=booking['date'], time=booking['time'])
+        # Reset para la próxima vez
+        client_data['appointment_stage'] = 'collecting_info'
+    else:
+        text = responses['appointment_error']
+        # Los datos del cliente se conservan: basta con otra fecha
+        client_data['appointment_stage'] = 'waiting_time'
+    return text
 
 if __name__ == "__main__":
-    print("Iniciando agente de WhatsApp con Cal.com (versión completa multilingüe)...")
-    print("🕐 Hora actual del servidor:", datetime.datetime.now())
-    print("🌍 Idiomas soportados: ES, EN, FR, DE, IT, PT")
-    print("Servidor corriendo en http://0.0.0.0:5000")
-    print("Webhook URL: http://0.0.0.0:5000/webhook")
-    print("Usa ngrok para exponer el webhook a internet")
+    logger.info("Iniciando agente de WhatsApp con Cal.com (versión completa multilingüe)...")
+    logger.info("🕐 Hora actual del servidor: %s", datetime.datetime.now())
+    logger.info("🌍 Idiomas soportados: ES, EN, FR, DE, IT, PT")
+    logger.info("Servidor corriendo en http://0.0.0.0:5000")
+    logger.info("Webhook URL: http://0.0.0.0:5000/webhook")
+    logger.info("Usa ngrok para exponer el webhook a internet")
+    logger.info("🧠 Para intenciones con IA, inicia el motor compartido: python intent_engine.py")
+    logger.info("📊 Métricas en http://0.0.0.0:5000/metrics (profiler: kill -USR2 <pid>; con gunicorn, el de un worker)")
+    logger.info("⚡ Para producción usa el modo ASGI: python asgi.py (o uvicorn asgi:app --workers N)")
+    logger.info("🔥 Workers precargados: gunicorn -c gunicorn.conf.py")
     
+    preload()
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
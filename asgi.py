@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Modo de servicio ASGI (asyncio) para los webhooks.
+
+Sirve en un solo proceso los endpoints de app.py y de webhook.py:
+
+- POST /webhook            conversación con reserva directa (TwiML)
+- POST /webhook/whatsapp   flujo con enlace de reserva (respuesta por la cola saliente)
+- POST /webhook/cal        eventos de Cal.com
+- GET  /health             estado del agente (liveness)
+- GET  /ready              503 hasta que el worker está precargado (readiness)
+- GET  /metrics            métricas en formato Prometheus
+
+La reserva en Cal.com no se espera: queda en la cola de reservas
+(booking_queue.py) y la confirmación llega después por WhatsApp. El estado de
+la sesión se lee y escribe en un hilo (el almacén puede ser SQLite/Redis) y
+los mensajes de un mismo teléfono se procesan en orden.
+
+Ninguna petición espera a un upstream: Cal.com y Twilio se llaman desde los
+pools acotados de la cola de reservas y de la cola saliente
+(outbound_queue.py), compartidos con el modo WSGI, con el cliente HTTP con
+pool de http_client.py. Por eso no hay cliente HTTP asíncrono: un hilo
+ocupado por llamada upstream no crece con las peticiones concurrentes, y el
+rendimiento del webhook no depende de la latencia de Cal.com (compárese con
+benchmarks/load_webhook.py --mode wsgi|asgi --cal-latency N).
+
+Uso:
+    python asgi.py                               # ASGI_HOST, ASGI_PORT, ASGI_WORKERS
+    WEB_CONCURRENCY=4 uvicorn asgi:app
+    WEB_CONCURRENCY=4 gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+WEB_CONCURRENCY (y no --workers/-w) para que la cola saliente de cada worker
+use su parte de TWILIO_MPS (ver outbound_queue.py).
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qsl
+from dotenv import load_dotenv
+
+# .env antes que los módulos del proyecto: leen su configuración al importarse
+load_dotenv()
+
+import app as bot
+import metrics
+from webhook import WhatsAppWebhookAgent
+from dispatcher import AsyncDispatcher
+from signatures import TWILIO_SIGNATURE_HEADER, CAL_SIGNATURE_HEADER
+
+logger = logging.getLogger(__name__)
+
+ASGI_HOST = os.getenv("ASGI_HOST", "0.0.0.0")
+ASGI_PORT = int(os.getenv("ASGI_PORT", "8000"))
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+
+agent = WhatsAppWebhookAgent(tenants=bot.TENANTS, store=bot.SESSION_STORE)  # Mismo registro y almacén que app.py
+
+
+# Un buzón por teléfono: mensajes del mismo número en orden (ver dispatcher.py)
+conversations = AsyncDispatcher()
+
+
+def _header(scope, name):
+    name = name.lower().encode("latin-1")
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _url(scope):
+    """URL de la petición tal como la ve el cliente (la que firma Twilio)"""
+    host = _header(scope, "host") or "localhost"
+    query = scope.get("query_string", b"").decode("latin-1")
+    return f"{scope.get('scheme', 'http')}://{host}{scope['path']}" + (f"?{query}" if query else "")
+
+
+def _signature_valid(scope, body):
+    """Firma de Twilio (/webhook, /webhook/whatsapp) o de Cal.com (/webhook/cal)"""
+    verifier = bot.WEBHOOK_VERIFIER
+    if scope["path"] == "/webhook/cal":
+        return verifier.verify_cal(body, _header(scope, CAL_SIGNATURE_HEADER))
+    return verifier.verify_twilio(_url(scope), _form(body), _header(scope, TWILIO_SIGNATURE_HEADER))
+
+
+def _json(body, status=200):
+    return status, "application/json", json.dumps(body).encode("utf-8")
+
+
+def _form(body):
+    return dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+
+async def conversation_webhook(body):
+    """POST /webhook: misma conversación que app.whatsapp_webhook, sin bloquear en Cal.com"""
+    form = _form(body)
+    msg = form.get("Body", "").strip()
+    from_number = form.get("From", "").strip()
+
+    if not msg or not from_number:
+        return 200, "text/xml", bot.CATALOG.twiml("Invalid message.")
+
+    logger.info("📱 Mensaje recibido de %s: %s", from_number, msg, extra={"phone": from_number})
+
+    tenant = bot.TENANTS.get(form.get("To"))
+
+    # FAQ fuera del flujo de reserva: sin sesión ni buzón (ver app.faq_reply)
+    start = time.perf_counter()
+    twiml, intent = await asyncio.to_thread(bot.faq_reply, msg, from_number, tenant)
+    if twiml is not None:
+        return 200, "text/xml", twiml
+
+    async def reply():
+        # La reserva queda en la cola (booking_queue.py): no se espera a Cal.com
+        text = await asyncio.to_thread(bot.step_conversation, msg, from_number, tenant, intent)
+        return tenant.catalog("conversation", bot.CATALOG).twiml(text)
+
+    # Mismo índice de MessageSid que el modo WSGI
+    twiml, duplicate = await bot.MESSAGE_DEDUP.run_once_async(
+        form.get("MessageSid", "").strip(), lambda: conversations.call(tenant.session_key(from_number), reply)
+    )
+    if not duplicate:
+        bot.FAQ_CACHE.record_full(start)
+    return 200, "text/xml", twiml if twiml is not None else bot.CATALOG.twiml()
+
+
+async def whatsapp_webhook(body):
+    """POST /webhook/whatsapp: el agente solo encola la respuesta"""
+    # En un hilo: un reintento de Twilio puede esperar al original (dedup.py)
+    payload, status = await asyncio.to_thread(agent.handle_whatsapp, _form(body))
+    return _json(payload, status)
+
+
+async def cal_webhook(body):
+    """POST /webhook/cal"""
+    try:
+        booking_data = json.loads(body or b"{}")
+    except ValueError:
+        return _json({'status': 'error', 'message': 'Invalid JSON'}, 400)
+    payload, status = await asyncio.to_thread(agent.handle_cal_event, booking_data)
+    return _json(payload, status)
+
+
+async def health_check(body):
+    """GET /health"""
+    return _json(agent.health())
+
+
+async def ready_check(body):
+    """GET /ready: conversación precargada y workers del agente vivos"""
+    bot_ready, bot_checks = bot.readiness()
+    agent_ready, agent_checks = agent.readiness()
+    ready = bot_ready and agent_ready
+    if not ready:
+        bot.warm_up_async()
+    return _json({'status': 'ready' if ready else 'warming', 'checks': {**bot_checks, **agent_checks}},
+                 200 if ready else 503)
+
+
+async def metrics_endpoint(body):
+    """GET /metrics"""
+    return 200, metrics.CONTENT_TYPE, metrics.render().encode("utf-8")
+
+
+ROUTES = {
+    ("POST", "/webhook"): conversation_webhook,
+    ("POST", "/webhook/whatsapp"): whatsapp_webhook,
+    ("POST", "/webhook/cal"): cal_webhook,
+    ("GET", "/health"): health_check,
+    ("GET", "/ready"): ready_check,
+    ("GET", "/metrics"): metrics_endpoint,
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            bot.warm_up_async()  # Sin esperar: /health responde ya, /ready cuando termine
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI"""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    body = await _read_body(receive)
+    if handler is None:
+        status, content_type, payload = _json({'status': 'error', 'message': 'Not found'}, 404)
+    elif scope["method"] == "POST" and not _signature_valid(scope, body):
+        status, content_type, payload = _json({'status': 'error', 'message': 'Invalid signature'}, 403)
+    else:
+        try:
+            status, content_type, payload = await handler(body)
+        except Exception as e:
+            logger.error("❌ Error en %s: %s", scope['path'], e)
+            status, content_type, payload = _json({'status': 'error', 'message': str(e)}, 500)
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(payload)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+def main():
+    """Ejecutar con uvicorn"""
+    import uvicorn
+
+    logger.info("🚀 Modo ASGI en http://%s:%s con %s workers", ASGI_HOST, ASGI_PORT, ASGI_WORKERS)
+    # Cada worker importa de nuevo la app: su cola saliente usa TWILIO_MPS / WEB_CONCURRENCY
+    os.environ["WEB_CONCURRENCY"] = str(ASGI_WORKERS)
+    uvicorn.run("asgi:app", host=ASGI_HOST, port=ASGI_PORT, workers=ASGI_WORKERS)
+
+
+if __name__ == "__main__":
+    main()
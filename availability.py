@@ -0,0 +1,301 @@
+"""
+Índice local de disponibilidad de Cal.com para validar antes de reservar.
+
+- Carga masiva periódica de los huecos libres del tipo de evento
+  (GET /v2/slots) para los próximos AVAILABILITY_HORIZON_DAYS días, en un hilo
+  de fondo cada AVAILABILITY_REFRESH segundos.
+- Actualización incremental con los eventos de /webhook/cal: un booking creado
+  o reprogramado ocupa su hueco; uno cancelado o rechazado lo libera. Una
+  reprogramación libera además el hueco anterior (rescheduleStartTime, o el
+  inicio visto con el uid de rescheduleUid/fromReschedule).
+- check(start) se resuelve en el proceso: fuera del horario comercial o hueco
+  ocupado -> no se llama a Cal.com y se sugieren los huecos libres más cercanos.
+
+Si el índice está frío, caducado o la fecha cae fuera del horizonte, la
+disponibilidad es desconocida y la reserva sigue adelante (Cal.com decide).
+"""
+
+import os
+import bisect
+import logging
+import datetime
+import threading
+
+from timezones import UTC, get_zone, to_utc
+
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_REFRESH = float(os.getenv("AVAILABILITY_REFRESH", "60"))
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "14"))
+AVAILABILITY_SUGGESTIONS = int(os.getenv("AVAILABILITY_SUGGESTIONS", "3"))
+
+# Horario comercial (el de RESPONSES[...]["hours"]: lunes a sábado de 7 AM a 5 PM)
+BUSINESS_TIMEZONE = os.getenv("BUSINESS_TIMEZONE", "America/New_York")
+BUSINESS_DAYS = frozenset(int(d) for d in os.getenv("BUSINESS_DAYS", "0,1,2,3,4,5").split(","))  # 0 = lunes
+BUSINESS_OPEN_HOUR = int(os.getenv("BUSINESS_OPEN_HOUR", "7"))
+BUSINESS_CLOSE_HOUR = int(os.getenv("BUSINESS_CLOSE_HOUR", "17"))
+
+OCCUPY_EVENTS = frozenset({"BOOKING_CREATED", "BOOKING_RESCHEDULED"})
+RELEASE_EVENTS = frozenset({"BOOKING_CANCELLED", "BOOKING_REJECTED"})
+RESCHEDULE_EVENT = "BOOKING_RESCHEDULED"
+
+
+def _to_utc(value):
+    """datetime (naive = UTC) o ISO 8601 -> datetime UTC sin segundos"""
+    value = to_utc(value)
+    if value.second or value.microsecond:
+        value = value.replace(second=0, microsecond=0)
+    return value
+
+
+def parse_slots(body):
+    """Inicios de hueco de una respuesta de /v2/slots (formato nuevo y antiguo)"""
+    data = body.get("data", {})
+    if "slots" in data:  # /v2/slots/available: {"slots": {"fecha": [{"time": ...}]}}
+        data = data["slots"]
+    starts = []
+    for day_slots in data.values():
+        for slot in day_slots:
+            start = (slot.get("start") or slot.get("time")) if isinstance(slot, dict) else slot
+            if start:
+                starts.append(_to_utc(start))
+    return starts
+
+
+class BusinessHours:
+    """Días y horas de apertura en la zona horaria del negocio"""
+
+    def __init__(self, tz=BUSINESS_TIMEZONE, days=BUSINESS_DAYS,
+                 open_hour=BUSINESS_OPEN_HOUR, close_hour=BUSINESS_CLOSE_HOUR):
+        self.tz = get_zone(tz)
+        self.days = days
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+
+    def contains(self, start, duration):
+        """¿La cita [start, start + duration) cae entera dentro del horario?"""
+        local = start.astimezone(self.tz)
+        end = local + duration
+        opening = local.replace(hour=self.open_hour, minute=0, second=0, microsecond=0)
+        closing = local.replace(hour=self.close_hour, minute=0, second=0, microsecond=0)
+        return local.weekday() in self.days and opening <= local and end <= closing
+
+    def grid(self, after, duration, count):
+        """Próximos `count` inicios dentro del horario (cuando no hay índice de huecos)"""
+        minutes = max(1, int(duration.total_seconds() // 60))
+        # Redondear hacia arriba al siguiente múltiplo de la duración
+        local = after.astimezone(self.tz).replace(second=0, microsecond=0)
+        local += datetime.timedelta(minutes=-local.minute % minutes)
+        result = []
+        for _ in range(8 * 24 * 60 // minutes):  # Como mucho ocho días
+            if self.contains(local, duration):
+                result.append(local.astimezone(UTC))
+                if len(result) == count:
+                    break
+            local += duration
+        return result
+
+
+class SlotIndex:
+    """Huecos libres de un tipo de evento, ordenados, con refresco periódico"""
+
+    def __init__(self, fetch, event_type_id, duration_minutes, hours=None,
+                 refresh_interval=AVAILABILITY_REFRESH, horizon_days=AVAILABILITY_HORIZON_DAYS):
+        self._fetch = fetch  # Callable(start, end) -> lista de inicios (datetime UTC)
+        self.event_type_id = str(event_type_id)
+        self.duration = datetime.timedelta(minutes=duration_minutes)
+        self.hours = hours or BusinessHours()
+        self.refresh_interval = refresh_interval
+        self.horizon = datetime.timedelta(days=horizon_days)
+
+        self._slots = []  # Inicios libres ordenados (UTC)
+        self._booked = {}  # uid -> inicio de los bookings vistos por webhook (para reprogramaciones)
+        self._window = None  # (desde, hasta) cubierto por la última carga
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refreshes = 0
+        self.errors = 0
+        self.rejected = 0  # Reservas evitadas (ocupado o fuera de horario)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Cargar en segundo plano ahora y cada refresh_interval segundos"""
+        if self._thread is None:
+            _indexes.append(self)
+            self._thread = threading.Thread(target=self._run, name="slot-index", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self in _indexes:
+            _indexes.remove(self)
+
+    def _after_fork(self):
+        """El hilo de refresco no sobrevive al fork; los huecos ya cargados sí"""
+        self._lock = threading.Lock()
+        if self._thread is not None and not self._stop.is_set():
+            self._thread = threading.Thread(target=self._run, name="slot-index", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def refresh(self):
+        """Carga masiva de huecos (bloqueante); conserva los datos previos si falla"""
+        start = datetime.datetime.now(UTC)
+        end = start + self.horizon
+        try:
+            slots = sorted(set(self._fetch(start, end)))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error("❌ Error cargando huecos de Cal.com: %s", e)
+            return False
+
+        with self._lock:
+            self._slots = slots
+            self._window = (start, end)
+            # Los bookings ya pasados no se van a reprogramar
+            self._booked = {uid: booked for uid, booked in self._booked.items() if booked >= start}
+            self._loaded_at = start
+            self.refreshes += 1
+        logger.info("✅ Índice de disponibilidad actualizado (%s huecos)", len(slots))
+        return True
+
+    def _fresh(self, now):
+        return self._loaded_at is not None and now - self._loaded_at <= datetime.timedelta(
+            seconds=self.refresh_interval * 3)
+
+    def is_free(self, start):
+        """True/False si el índice lo sabe; None si no (índice frío o fuera del horizonte)"""
+        start = _to_utc(start)
+        with self._lock:
+            if not self._fresh(datetime.datetime.now(UTC)):
+                return None
+            if not (self._window[0] <= start <= self._window[1]):
+                return None
+            i = bisect.bisect_left(self._slots, start)
+            return i < len(self._slots) and self._slots[i] == start
+
+    def nearest(self, start, count=AVAILABILITY_SUGGESTIONS):
+        """Los `count` huecos libres futuros más cercanos a `start`, en orden cronológico"""
+        start = _to_utc(start)
+        now = datetime.datetime.now(UTC)
+        with self._lock:
+            if not self._fresh(now):
+                return self.hours.grid(max(start, now), self.duration, count)
+            i = bisect.bisect_left(self._slots, start)
+            after = self._in_hours(self._slots[i:], count)
+            before = self._in_hours((s for s in reversed(self._slots[:i]) if s > now), count)
+        candidates = sorted(after + before, key=lambda s: abs(s - start))[:count]
+        return sorted(candidates)
+
+    def _in_hours(self, slots, count):
+        """Los primeros `count` huecos que caen dentro del horario comercial"""
+        result = []
+        for slot in slots:
+            if len(result) == count:
+                break
+            if self.hours.contains(slot, self.duration):
+                result.append(slot)
+        return result
+
+    def check(self, start):
+        """(ok, motivo, sugerencias): motivo es 'closed', 'taken' o None"""
+        start = _to_utc(start)
+        if not self.hours.contains(start, self.duration):
+            reason = 'closed'
+        elif self.is_free(start) is False:
+            reason = 'taken'
+        else:
+            return True, None, []
+        with self._lock:
+            self.rejected += 1
+        return False, reason, self.nearest(start)
+
+    def occupy(self, start):
+        """Quitar un hueco (booking creado)"""
+        start = _to_utc(start)
+        with self._lock:
+            i = bisect.bisect_left(self._slots, start)
+            if i < len(self._slots) and self._slots[i] == start:
+                del self._slots[i]
+
+    def release(self, start):
+        """Devolver un hueco (booking cancelado) si está en horario y en la ventana"""
+        start = _to_utc(start)
+        if not self.hours.contains(start, self.duration):
+            return
+        with self._lock:
+            if self._window is None or not (self._window[0] <= start <= self._window[1]):
+                return
+            i = bisect.bisect_left(self._slots, start)
+            if i == len(self._slots) or self._slots[i] != start:
+                self._slots.insert(i, start)
+
+    def apply_event(self, event):
+        """Actualizar el índice con un evento de /webhook/cal; True si se aplicó"""
+        payload = event.get("payload") if isinstance(event.get("payload"), dict) else event
+        trigger = event.get("triggerEvent")
+        event_type_id = payload.get("eventTypeId")
+        start = payload.get("startTime")
+        uid = payload.get("uid")
+        if not start or (event_type_id is not None and str(event_type_id) != self.event_type_id):
+            return False
+        if trigger in OCCUPY_EVENTS:
+            if trigger == RESCHEDULE_EVENT:
+                self._release_previous(payload, _to_utc(start))
+            self.occupy(start)
+            if uid:
+                with self._lock:
+                    self._booked[uid] = _to_utc(start)
+        elif trigger in RELEASE_EVENTS:
+            self.release(start)
+            if uid:
+                with self._lock:
+                    self._booked.pop(uid, None)
+        else:
+            return False
+        return True
+
+    def _release_previous(self, payload, start):
+        """Reprogramación: devolver el hueco que ocupaba el booking original"""
+        previous_uid = payload.get("rescheduleUid") or payload.get("fromReschedule")
+        with self._lock:
+            previous = self._booked.pop(previous_uid, None) if previous_uid else None
+        if payload.get("rescheduleStartTime"):
+            previous = _to_utc(payload["rescheduleStartTime"])
+        if previous is not None and previous != start:
+            self.release(previous)
+
+    def stats(self):
+        """Contadores para /health"""
+        with self._lock:
+            age = None if self._loaded_at is None else round(
+                (datetime.datetime.now(UTC) - self._loaded_at).total_seconds(), 1)
+            return {
+                'slots': len(self._slots),
+                'age_seconds': age,
+                'refreshes': self.refreshes,
+                'errors': self.errors,
+                'rejected': self.rejected,
+            }
+
+
+_indexes = []  # Índices arrancados en este proceso
+
+
+def apply_cal_event(event):
+    """Propagar un evento de Cal.com a todos los índices del proceso"""
+    for index in list(_indexes):
+        try:
+            index.apply_event(event)
+        except Exception as e:
+            logger.error("❌ Error aplicando evento de Cal.com al índice: %s", e)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Eventos de Cal.com a volumen alto: índice teléfono <-> booking y cola acotada.
+
+- Indexa N bookings (uid + email) como lo hace create_cal_booking.
+- Resuelve el destinatario de eventos created/rescheduled/cancelled: en
+  memoria, desde SQLite (otro worker) y sin coincidencia.
+- Empuja una ráfaga de eventos por CalEventPipeline con un envío simulado y
+  mide el rendimiento, la espera en cola y los rechazos (503) con la cola llena.
+
+Uso:
+    python benchmarks/bench_cal_events.py [bookings]
+"""
+
+import os
+import sys
+import time
+import queue
+import timeit
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from booking_index import BookingIndex, CalEventPipeline, event_fields
+
+TRIGGERS = ("BOOKING_CREATED", "BOOKING_RESCHEDULED", "BOOKING_CANCELLED")
+
+
+def event(i, trigger="BOOKING_CANCELLED"):
+    return {"triggerEvent": trigger, "payload": {
+        "uid": f"uid-{i}", "title": "agente-demo", "startTime": "2026-10-20T15:00:00Z",
+        "attendees": [{"email": f"cliente{i}@example.com", "name": f"Cliente {i}", "timeZone": "America/New_York"}],
+    }}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    path = os.path.join(tempfile.mkdtemp(prefix="booking-index-"), "bookings.db")
+    index = BookingIndex(path=path, max_entries=count * 2)
+
+    start = time.perf_counter()
+    for i in range(count):
+        index.remember(f"whatsapp:+1555{i:07d}", uid=f"uid-{i}", email=f"cliente{i}@example.com", lang="es")
+    print(f"Indexar {count} bookings: {(time.perf_counter() - start) / count * 1e6:.1f} µs/booking (SQLite incluido)")
+
+    fields = [event_fields(event(i)) for i in range(count)]
+    other_worker = BookingIndex(path=path, max_entries=count * 2)
+    iterations = min(count, 5000)
+    for label, target, sample in (
+        ("en memoria", index, fields),
+        ("desde SQLite", other_worker, fields),
+        ("sin coincidencia", index, [event_fields(event(count + i)) for i in range(iterations)]),
+    ):
+        seconds = timeit.timeit(lambda: [target.resolve(f) for f in sample[:iterations]], number=1)
+        print(f"  resolver destinatario {label:18} {seconds / iterations * 1e6:8.2f} µs/evento")
+
+    # Ráfaga por la cola acotada: el envío real es la cola saliente (no bloquea)
+    sent = []
+    pipeline = CalEventPipeline(lambda e: sent.append(index.resolve(event_fields(e))), size=1000, workers=2).start()
+    rejected = 0
+    start = time.perf_counter()
+    for i in range(count):
+        try:
+            pipeline.submit(event(i % count, TRIGGERS[i % 3]))
+        except queue.Full:
+            rejected += 1
+            time.sleep(0.001)  # Cal.com reintentaría más tarde
+    while pipeline.depth():
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    stats = pipeline.stats()
+    print(f"\nRáfaga de {count} eventos: {stats['processed'] / elapsed:,.0f} eventos/s, "
+          f"espera en cola p50 {stats['queue_wait_ms_p50']} ms / p95 {stats['queue_wait_ms_p95']} ms, "
+          f"rechazados con la cola llena: {rejected}")
+    print(f"Destinatario encontrado: {sum(1 for c in sent if c)}/{len(sent)}")
+    print(f"Índice: {index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
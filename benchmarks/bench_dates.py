@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Latencia p50/p99 de parse de fecha/hora: parser por capas vs. dateparser.
+
+Uso:
+    python benchmarks/bench_dates.py [repeticiones]
+
+Si dateparser no está instalado, solo se mide la ruta rápida y la caché.
+"""
+
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_parsing import LayeredDateParser
+
+try:
+    import dateparser
+except ImportError:
+    dateparser = None
+
+# (texto, idioma) - mensajes típicos de la etapa waiting_time
+CORPUS = [
+    ("mañana a las 3 PM", "es"), ("hoy a las 4 PM", "es"), ("mañana 10:30", "es"),
+    ("pasado mañana a las 11 am", "es"), ("el viernes a las 3", "es"),
+    ("tomorrow 4pm", "en"), ("today at 2:30 pm", "en"), ("3pm tomorrow", "en"),
+    ("next monday at 10am", "en"), ("in 2 hours", "en"),
+    ("demain 15h", "fr"), ("demain à 9h30", "fr"), ("aujourd'hui à 16h", "fr"),
+    ("morgen um 15 Uhr", "de"), ("heute 14:00", "de"), ("übermorgen 9:15", "de"),
+    ("domani alle 15:00", "it"), ("oggi alle 11:30", "it"),
+    ("amanhã às 15h", "pt"), ("hoje às 10h", "pt"),
+]
+
+
+def _slow(text, lang, now):
+    settings = {"PREFER_DATES_FROM": "future", "RETURN_AS_TIMEZONE_AWARE": True,
+                "RELATIVE_BASE": now.replace(tzinfo=None)}
+    return dateparser.parse(text, languages=[lang], settings=settings)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct))] * 1000
+    return f"p50 {pick(0.50):8.3f} ms   p99 {pick(0.99):8.3f} ms"
+
+
+def measure(parse, repetitions):
+    samples = []
+    for _ in range(repetitions):
+        for text, lang in CORPUS:
+            start = time.perf_counter()
+            parse(text, lang)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    slow = _slow if dateparser else None
+
+    # Sin caché (tamaño 0): ruta rápida + dateparser para el resto
+    uncached = LayeredDateParser(slow_parse=slow, cache_size=0)
+    print(f"capas sin caché:   {percentiles(measure(uncached.parse, repetitions))}")
+
+    cached = LayeredDateParser(slow_parse=slow)
+    print(f"capas con caché:   {percentiles(measure(cached.parse, repetitions))}   {cached.stats()}")
+
+    if dateparser:
+        now = lambda: datetime.datetime.now().astimezone()
+        baseline = measure(lambda text, lang: _slow(text, lang, now()), repetitions)
+        print(f"dateparser solo:   {percentiles(baseline)}")
+    else:
+        print("dateparser no instalado: se omite la línea base")
+
+    print(f"corpus: {len(CORPUS)} frases, cubiertas por la ruta rápida: {uncached.fast_hits // repetitions}")
+
+
+if __name__ == "__main__":
+    main()
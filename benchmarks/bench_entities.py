@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Extractor de entidades en una pasada vs. las tres funciones anteriores.
+
+Comprueba primero el corpus de regresión (mensajes reales multilingües) y
+después mide el rendimiento en mensajes por segundo.
+
+Uso:
+    python benchmarks/bench_entities.py [iteraciones]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_extraction import extract_entities
+
+# Corpus de regresión: (mensaje, email, teléfono, nombre) esperados
+CORPUS = [
+    ("Mi nombre es Juan Pérez, juan.perez@gmail.com, +1 (347) 555-0123",
+     "juan.perez@gmail.com", "3475550123", "juan pérez"),
+    ("me llamo María López", None, None, "maría lópez"),
+    ("maria.lopez@hotmail.com", "maria.lopez@hotmail.com", None, None),
+    ("Mi teléfono es 718-555-0199", None, "7185550199", "mi teléfono"),
+    ("My name is John Smith and my email is john@example.com", "john@example.com", None, "john smith"),
+    ("I'm Sarah, sarah.connor@yahoo.com, 929 555 0147", "sarah.connor@yahoo.com", "9295550147", "sarah"),
+    ("Je m'appelle Pierre Dubois, pierre@orange.fr, +33 6 12 34 56 78",
+     "pierre@orange.fr", "+33612345678", "pierre dubois"),
+    ("Mein Name ist Hans Müller, hans.mueller@web.de", "hans.mueller@web.de", None, "hans müller"),
+    ("Ich heiße Anna, Telefon +49 151 23456789", None, "+4915123456789", "anna telefon"),
+    ("Il mio nome è Marco Rossi, marco.rossi@libero.it", "marco.rossi@libero.it", None, "marco rossi"),
+    ("Meu nome é João Silva, joao@uol.com.br, +55 11 91234-5678",
+     "joao@uol.com.br", "+5511912345678", "joão silva"),
+    ("Eu sou Ana", None, None, "ana"),
+    ("(646) 555-0100", None, "6465550100", None),
+    ("Carlos", None, None, "carlos"),
+    ("ok", None, None, None),
+]
+
+
+# --- Implementación anterior (referencia) ---
+def legacy_email(text):
+    matches = re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
+    return matches[0] if matches else None
+
+
+def legacy_phone(text):
+    for pattern in [r'\+?1?[\s\-\.]?\(?([0-9]{3})\)?[\s\-\.]?([0-9]{3})[\s\-\.]?([0-9]{4})',
+                    r'\+?[\d\s\-\(\)]{10,}']:
+        matches = re.findall(pattern, text)
+        if matches:
+            if isinstance(matches[0], tuple):
+                return ''.join(matches[0])
+            phone = re.sub(r'[^\d+]', '', str(matches[0]))
+            if len(phone) >= 10:
+                return phone
+    return None
+
+
+def legacy_name(text):
+    keywords_to_remove = [
+        'mi nombre es', 'me llamo', 'soy', 'my name is', 'i am', 'i\'m',
+        'mon nom est', 'je suis', 'mein name ist', 'ich bin',
+        'il mio nome è', 'io sono', 'meu nome é', 'eu sou',
+        'mein name ist', 'ich bin', 'ich heiße',
+        'o meu nome é', 'eu sou', 'me chamo',
+        'mon nom est', 'je m\'appelle'
+    ]
+    name_text = text.lower()
+    for keyword in keywords_to_remove:
+        name_text = name_text.replace(keyword, '').strip()
+    name_text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', name_text)
+    name_text = re.sub(r'\+?[\d\s\-\(\)]{10,}', '', name_text)
+    name_text = re.sub(r'[^\w\s]', ' ', name_text)
+    name_text = re.sub(r'\s+', ' ', name_text).strip()
+    words = name_text.split()
+    if len(words) >= 2:
+        return ' '.join(words[:2])
+    elif len(words) == 1 and len(words[0]) > 2:
+        return words[0]
+    return None
+
+
+def legacy(text):
+    return legacy_email(text), legacy_phone(text), legacy_name(text)
+
+
+def single_pass(text):
+    entities = extract_entities(text)
+    return entities['email'], entities['phone'], entities['name']
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    failures = 0
+    for text, *expected in CORPUS:
+        got, old = single_pass(text), legacy(text)
+        if list(got) != expected:
+            failures += 1
+            print(f"❌ {text!r}\n   esperado {tuple(expected)}\n   obtenido {got}")
+        elif got != old:
+            print(f"ℹ️ difiere de la versión anterior: {text!r}\n   antes {old}\n   ahora {got}")
+    print(f"corpus de regresión: {len(CORPUS) - failures}/{len(CORPUS)} correctos\n")
+
+    texts = [item[0] for item in CORPUS]
+    for name, fn in (("tres pasadas", legacy), ("una pasada", single_pass)):
+        elapsed = timeit.timeit(lambda: [fn(t) for t in texts], number=iterations)
+        print(f"{name:<13} {iterations * len(texts) / elapsed:>10,.0f} msg/s")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
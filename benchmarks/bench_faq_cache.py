@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Caché de FAQ (faq_cache.py) medida por el camino real: POST /webhook de app.py.
+
+- Corpus sintético: preguntas frecuentes con variantes de mayúsculas,
+  puntuación y espacios (la mayoría del tráfico) mezcladas con mensajes de
+  reserva y texto libre, con una distribución sesgada (pocas frases muy
+  repetidas), desde muchos teléfonos.
+- Cada mensaje entra por el cliente de pruebas de Flask: firma, faq_reply,
+  buzón, sesión y TwiML, como en producción. Las FAQ de clientes fuera del
+  flujo de reserva salen por el atajo (FAQ_CACHE.record_hit); el resto por la
+  conversación completa (FAQ_CACHE.record_full), así que served, hit_ms_p50,
+  full_ms_p50 y saved_ms son los que publica /metrics.
+- Misma carga con la caché desactivada (tamaño 0: cada mensaje se vuelve a
+  clasificar) como referencia.
+- Ratio de aciertos con distintos tamaños de caché, llamando a faq_reply.
+
+Sin Cal.com, Twilio ni modelo de intenciones (INTENT_MODE=off: las palabras
+clave son definitivas y se cachean); el estado en disco va a un directorio
+temporal.
+
+Uso:
+    python benchmarks/bench_faq_cache.py [mensajes]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar app.py: lee su configuración al importarse
+STATE = tempfile.mkdtemp(prefix="faq-")
+os.environ.update({
+    "INTENT_MODE": "off",
+    "SESSION_BACKEND": "memory",
+    "CAL_API_KEY": "",
+    "TWILIO_AUTH_TOKEN": "",  # Sin firma que verificar en el cliente de pruebas
+    "BOOKING_DB_PATH": os.path.join(STATE, "bookings.db"),
+    "BOOKING_INDEX_DB_PATH": os.path.join(STATE, "booking_index.db"),
+    "OUTBOUND_DEAD_LETTER_PATH": os.path.join(STATE, "outbound_dead_letter.jsonl"),
+})
+
+import app as bot
+import metrics
+from faq_cache import FAQCache
+
+FAQS = [
+    "What are your hours", "what are your hours?", "Hours?", "help", "Help!", "I need help",
+    "how much does it cost", "What's the price?", "precio", "¿Cuál es el precio?", "horario",
+    "¿Cuál es su horario?", "where are you", "do you do delivery", "delivery?", "ayuda",
+]
+OTHERS = [
+    "I want to book an appointment", "quiero una cita", "tomorrow at 3pm", "mañana a las 10",
+    "my name is Ana", "ana@example.com", "thanks!", "ok", "gracias",
+]
+PHONES = 2000
+
+
+def variant(text, rng):
+    """Misma pregunta escrita de otra forma (mayúsculas, puntuación, espacios)"""
+    choice = rng.random()
+    if choice < 0.2:
+        return text.upper()
+    if choice < 0.4:
+        return f"  {text.lower()}!! "
+    if choice < 0.5:
+        return text.replace(" ", "  ")
+    return text
+
+
+def corpus(count, rng):
+    weights = [1 / (rank + 1) for rank in range(len(FAQS))]
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            text = variant(rng.choices(FAQS, weights)[0], rng)
+        elif rng.random() < 0.9:
+            text = variant(rng.choice(OTHERS), rng)
+        else:
+            text = f"mensaje libre {rng.randrange(10 ** 6)}"  # Casi nunca se repite
+        messages.append((text, rng.randrange(PHONES)))
+    return messages
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_webhook(messages, cache, prefix):
+    """Enviar el corpus a POST /webhook con `cache` como FAQ_CACHE; latencias por mensaje (ms)"""
+    bot.FAQ_CACHE = cache
+    client = bot.app.test_client()
+    latencies = []
+    start = time.perf_counter()
+    for n, (text, phone) in enumerate(messages):
+        sent = time.perf_counter()
+        response = client.post("/webhook", data={
+            "Body": text, "From": f"whatsapp:{prefix}{phone:07d}", "MessageSid": f"SM{prefix}{n}",
+        })
+        latencies.append((time.perf_counter() - sent) * 1000)
+        assert response.status_code == 200, response.status_code
+    return latencies, time.perf_counter() - start
+
+
+def report(label, latencies, elapsed):
+    print(f"  {label:28} {len(latencies) / elapsed:8.0f} msg/s   p50 {percentile(latencies, 0.5):6.3f} ms"
+          f"   p95 {percentile(latencies, 0.95):6.3f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = corpus(count, random.Random(25))
+    bot.identify_language("warm up")
+
+    print(f"{count} mensajes a POST /webhook desde {PHONES} teléfonos")
+    cached = FAQCache(max_entries=10000)
+    latencies, elapsed = run_webhook(messages, cached, "+1555")
+    report("con caché", latencies, elapsed)
+    uncached = FAQCache(max_entries=0)
+    latencies_off, elapsed_off = run_webhook(messages, uncached, "+1666")
+    report("sin caché (tamaño 0)", latencies_off, elapsed_off)
+
+    stats = cached.stats()
+    print(f"\nFAQ_CACHE con caché: {stats}")
+    print(f"  atajo p50 {stats['hit_ms_p50']} ms frente a conversación completa p50 {stats['full_ms_p50']} ms:"
+          f" {stats['served']} respuestas, {stats['saved_ms'] / 1000:.2f} s ahorrados")
+    # Lo que verá Prometheus: los gauges de app.py leen el FAQ_CACHE vigente
+    bot.FAQ_CACHE = cached
+    for line in metrics.render().splitlines():
+        if line.startswith("faq_cache"):
+            print(f"  {line}")
+
+    print("\nRatio de aciertos por tamaño de caché (faq_reply, clientes fuera del flujo)")
+    for size in (16, 64, 1000, 10000):
+        bot.FAQ_CACHE = cache = FAQCache(max_entries=size)
+        for n, (text, _) in enumerate(messages):
+            bot.faq_reply(text, f"whatsapp:+1777{n:07d}")
+        stats = cache.stats()
+        print(f"  {size:6} entradas  hit_ratio {stats['hit_ratio']}  (pass {stats['passes']}, miss {stats['misses']},"
+              f" served {stats['served']})")
+
+
+if __name__ == "__main__":
+    main()
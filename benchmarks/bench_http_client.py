@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Conexiones abiertas y latencia: requests.post directo vs. http_client.
+
+Levanta un servidor stub local (HTTP/1.1 keep-alive) que cuenta las
+conexiones TCP aceptadas. El stub desactiva Nagle (TCP_NODELAY): escribe
+cabeceras y cuerpo por separado, y en una conexión reutilizada Nagle más el
+ACK retardado del cliente añadirían ~40 ms por petición que no son del pool.
+
+Uso:
+    python benchmarks/bench_http_client.py [peticiones]
+"""
+
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import http_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # TCP_NODELAY, como un servidor HTTP real
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"status": "ok"}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(server, url, post, requests_count):
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        post(url, json={"ping": True}).close()
+    elapsed = time.perf_counter() - start
+    return server.connections, elapsed
+
+
+def main():
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v2/bookings"
+
+    for name, post in (("requests.post", requests.post), ("http_client", http_client.post)):
+        connections, elapsed = measure(server, url, post, requests_count)
+        print(f"{name:<15} {requests_count} peticiones, {connections:>4} conexiones, "
+              f"{elapsed / requests_count * 1000:.2f} ms/petición")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
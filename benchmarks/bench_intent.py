@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Coste de un lote del modelo de intenciones (intent_engine.py) en CPU.
+
+Cada mensaje se compara con las 6 etiquetas candidatas: un lote de N mensajes
+son N x 6 pares de inferencia. Se mide la latencia de un lote para varios
+tamaños y se sugiere INTENT_CLIENT_TIMEOUT: el p95 del lote mayor
+(INTENT_MAX_BATCH) más la ventana de agrupación, con un 50 % de margen. Con
+un timeout menor el cliente descarta casi todas las respuestas y el modelo no
+se usa nunca.
+
+Necesita transformers y torch (no son dependencia de los workers):
+    pip install transformers torch
+
+Uso:
+    python benchmarks/bench_intent.py [repeticiones]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_engine import BatchingClassifier, INTENT_LABELS, INTENT_MAX_BATCH, INTENT_BATCH_WINDOW_MS
+
+MESSAGES = [
+    "Hi, I'd like to schedule an appointment on Thursday",
+    "¿Cuánto cuesta el servicio básico?",
+    "Where is your office?",
+    "¿A qué hora abren el sábado?",
+    "Do you deliver to Queens?",
+    "I need help with my booking",
+    "Je voudrais un rendez-vous demain",
+    "Was kostet der Basisdienst?",
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    classifier = BatchingClassifier()
+    start = time.perf_counter()
+    classifier.load()
+    print(f"Modelo {classifier.model} cargado en {time.perf_counter() - start:.1f}s "
+          f"({os.cpu_count()} CPU, {len(INTENT_LABELS)} etiquetas)")
+
+    pipeline, labels = classifier._pipeline, list(INTENT_LABELS.values())
+    pipeline(MESSAGES[:1], candidate_labels=labels)  # Calentar
+
+    sizes = sorted({1, 2, 4, 8, INTENT_MAX_BATCH})
+    p95 = {}
+    for size in sizes:
+        texts = (MESSAGES * (size // len(MESSAGES) + 1))[:size]
+        samples = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            pipeline(texts, candidate_labels=labels)
+            samples.append((time.perf_counter() - start) * 1000)
+        p95[size] = percentile(samples, 0.95)
+        print(f"  lote de {size:2}  p50 {percentile(samples, 0.5):8.1f} ms  p95 {p95[size]:8.1f} ms"
+              f"  ({percentile(samples, 0.5) / size:6.1f} ms/mensaje)")
+
+    suggested = (p95[INTENT_MAX_BATCH] + INTENT_BATCH_WINDOW_MS) * 1.5 / 1000
+    print(f"\nINTENT_MAX_BATCH={INTENT_MAX_BATCH}: INTENT_CLIENT_TIMEOUT sugerido {suggested:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: matcher precompilado vs. cadena de any(... in msg_lower).
+
+Uso:
+    python benchmarks/bench_keywords.py [iteraciones]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keywords import INTENT_MATCHER
+
+MESSAGES = [
+    "Hola, quiero agendar una cita para mañana",
+    "Hi! How much is the price of the basic plan?",
+    "Bonjour, quels sont vos heures d'ouverture ?",
+    "Ich möchte einen Termin vereinbaren, bitte",
+    "Ciao, fate consegna a domicilio a Queens?",
+    "Olá, qual é a localização da loja?",
+    "Mi nombre es Juan Pérez, juan@example.com, +1 555 123 4567",
+    "tomorrow at 3pm works for me",
+    "ok gracias",
+    "Necesito ayuda con mi pedido, no llegó la entrega de ayer y nadie me responde",
+]
+
+# Cadena original de whatsapp_webhook (referencia)
+_APPOINTMENT = [
+    "cita", "reservar", "agendar", "citas", "reservar", "agendar",
+    "appointment", "book", "schedule", "reserve", "schedule", "booking",
+    "rendez-vous", "réserver", "prendre", "rendezvous",
+    "termin", "vereinbaren", "buchen", "terminen", "buche",
+    "appuntamento", "prenotare", "fissare", "prenotare", "fissare",
+    "consulta", "agendar", "marcar", "agendar", "marcar",
+]
+
+
+def legacy_intent(msg):
+    msg_lower = msg.lower()
+    if any(word in msg_lower for word in _APPOINTMENT):
+        return 'appointment'
+    elif any(word in msg_lower for word in ["precio", "price", "prix", "preis", "preço", "preise"]):
+        return 'pricing'
+    elif any(word in msg_lower for word in ["ubicación", "location", "sitio", "lugar", "standort", "posizione", "localização"]):
+        return 'location'
+    elif any(word in msg_lower for word in ["horario", "hours", "heures", "horário", "stunden", "orari", "horário"]):
+        return 'hours'
+    elif any(word in msg_lower for word in ["entrega", "delivery", "livraison", "entrega", "lieferung", "consegna", "entrega"]):
+        return 'delivery'
+    elif any(word in msg_lower for word in ["ayuda", "help", "aide", "hilfe", "aiuto", "ajuda", "hilfe"]):
+        return 'help'
+    return None
+
+
+def run(fn, iterations):
+    elapsed = timeit.timeit(lambda: [fn(m) for m in MESSAGES], number=iterations)
+    return iterations * len(MESSAGES) / elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for msg in MESSAGES:
+        old, new = legacy_intent(msg), INTENT_MATCHER.first(msg)
+        flag = "" if old == new else "   <- difiere"
+        print(f"{msg[:50]:<52} {str(old):<12} {str(new):<12}{flag}")
+
+    legacy = run(legacy_intent, iterations)
+    matcher = run(INTENT_MATCHER.first, iterations)
+    print()
+    print(f"cadena any():      {legacy:>12,.0f} msg/s")
+    print(f"matcher compilado: {matcher:>12,.0f} msg/s  ({matcher / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Precisión y latencia de identificación de idioma: language_id vs. langdetect.
+
+Uso:
+    python benchmarks/bench_language.py [repeticiones]
+
+langdetect ya no es dependencia de la app; instálalo para la línea base
+(pip install langdetect==1.0.9). Sin él, solo se mide language_id.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language_id import get_identifier
+
+try:
+    from langdetect import detect as langdetect_detect
+except ImportError:
+    langdetect_detect = None
+
+# Conjunto de prueba (frases distintas del corpus semilla)
+TEST_SET = [
+    ("Hola, quisiera una cita para el jueves", "es"),
+    ("¿Cuánto cuesta el servicio básico?", "es"),
+    ("Me llamo Ana García, mi correo es ana@example.com", "es"),
+    ("¿Tienen entrega a domicilio en Queens?", "es"),
+    ("Necesito cambiar mi reserva", "es"),
+    ("Hi, I'd like to schedule an appointment on Thursday", "en"),
+    ("How much is the basic service?", "en"),
+    ("My name is Ann Smith, my email is ann@example.com", "en"),
+    ("Do you deliver to Queens?", "en"),
+    ("I need to change my booking", "en"),
+    ("Bonjour, je voudrais un rendez-vous jeudi", "fr"),
+    ("Combien coûte le service de base ?", "fr"),
+    ("Je m'appelle Anne Martin, mon email est anne@example.com", "fr"),
+    ("Vous livrez à Queens ?", "fr"),
+    ("Je dois changer ma réservation", "fr"),
+    ("Hallo, ich hätte gerne einen Termin am Donnerstag", "de"),
+    ("Was kostet der Basisdienst?", "de"),
+    ("Ich heiße Anna Müller, meine E-Mail ist anna@example.com", "de"),
+    ("Liefern Sie nach Queens?", "de"),
+    ("Ich muss meine Buchung ändern", "de"),
+    ("Ciao, vorrei un appuntamento giovedì", "it"),
+    ("Quanto costa il servizio base?", "it"),
+    ("Mi chiamo Anna Rossi, la mia email è anna@example.com", "it"),
+    ("Consegnate a Queens?", "it"),
+    ("Devo cambiare la mia prenotazione", "it"),
+    ("Olá, queria uma consulta na quinta-feira", "pt"),
+    ("Quanto custa o serviço básico?", "pt"),
+    ("Meu nome é Ana Silva, meu email é ana@example.com", "pt"),
+    ("Vocês entregam em Queens?", "pt"),
+    ("Preciso mudar minha reserva", "pt"),
+]
+
+
+def evaluate(detect, repetitions):
+    correct = 0
+    samples = []
+    for _ in range(repetitions):
+        for text, expected in TEST_SET:
+            start = time.perf_counter()
+            try:
+                lang = detect(text)
+            except Exception:
+                lang = None
+            samples.append(time.perf_counter() - start)
+            correct += lang == expected
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+    return correct / (len(TEST_SET) * repetitions), p50, p99
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    identifier = get_identifier()
+
+    candidates = [("language_id", identifier.detect)]
+    if langdetect_detect:
+        candidates.append(("langdetect", langdetect_detect))
+    else:
+        print("langdetect no instalado: se omite la línea base")
+
+    for name, detect in candidates:
+        accuracy, p50, p99 = evaluate(detect, repetitions)
+        print(f"{name:<12} precisión {accuracy:6.1%}   p50 {p50:.3f} ms   p99 {p99:.3f} ms")
+
+    for text, expected in TEST_SET:
+        lang = identifier.detect(text)
+        if lang != expected:
+            print(f"  fallo: {text!r} -> {lang} (esperado {expected})")
+
+
+if __name__ == "__main__":
+    main()
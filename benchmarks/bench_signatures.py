@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Coste de verificar las firmas de los webhooks (signatures.py).
+
+Compara, por petición:
+- Twilio: payload real de WhatsApp firmado; firma válida, falsificada y sin
+  cabecera. Con el HMAC precalculado (.copy()) y rehaciendo la clave cada vez.
+- Cal.com: cuerpo JSON de un BOOKING_CREATED; firma válida y falsificada.
+
+Uso:
+    python benchmarks/bench_signatures.py [iteraciones]
+"""
+
+import os
+import sys
+import hmac
+import json
+import base64
+import hashlib
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signatures import TwilioValidator, CalValidator, WebhookVerifier
+
+AUTH_TOKEN = "bench-auth-token-0123456789abcdef"
+CAL_SECRET = "bench-cal-secret"
+URL = "https://agente.example.com/webhook"
+
+FORM = {
+    "SmsMessageSid": "SM0000000100", "NumMedia": "0", "ProfileName": "Cliente 1",
+    "SmsSid": "SM0000000100", "WaId": "15550000001", "SmsStatus": "received",
+    "Body": "Hola, quiero agendar una cita para mañana a las 3 PM", "To": "whatsapp:+14155238886",
+    "NumSegments": "1", "MessageSid": "SM0000000100", "AccountSid": "AC" + "0" * 32,
+    "From": "whatsapp:+15550000001", "ApiVersion": "2010-04-01",
+}
+
+CAL_BODY = json.dumps({
+    "triggerEvent": "BOOKING_CREATED",
+    "createdAt": "2026-10-17T10:00:00.000Z",
+    "payload": {
+        "uid": "bench-uid-0001", "eventTypeId": 3836552, "title": "agente-demo",
+        "startTime": "2026-10-20T15:00:00Z", "endTime": "2026-10-20T15:30:00Z",
+        "attendees": [{"name": "Ana López", "email": "ana@example.com", "timeZone": "America/New_York"}],
+        "responses": {"notes": {"value": "x" * 1200}},
+    },
+}).encode()
+
+
+def naive_twilio(url, params):
+    """Referencia: clave procesada en cada petición y cadena concatenada"""
+    data = url + "".join(name + params[name] for name in sorted(params))
+    mac = hmac.new(AUTH_TOKEN.encode(), data.encode(), hashlib.sha1)
+    return base64.b64encode(mac.digest())
+
+
+def bench(label, fn, iterations):
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations
+    print(f"  {label:42} {seconds * 1e6:8.2f} µs")
+    return seconds
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    twilio = TwilioValidator(AUTH_TOKEN)
+    cal = CalValidator(CAL_SECRET)
+    verifier = WebhookVerifier(AUTH_TOKEN, CAL_SECRET, mode="auto")
+
+    valid = twilio.signature(URL, FORM).decode()
+    forged = base64.b64encode(b"\0" * 20).decode()
+    assert naive_twilio(URL, FORM).decode() == valid
+    assert verifier.verify_twilio(URL, FORM, valid) and not verifier.verify_twilio(URL, FORM, forged)
+
+    cal_valid = cal.signature(CAL_BODY)
+    assert verifier.verify_cal(CAL_BODY, cal_valid) and not verifier.verify_cal(CAL_BODY, "0" * 64)
+
+    print(f"Twilio ({len(FORM)} parámetros, {iterations} iteraciones)")
+    bench("firma rehaciendo la clave (referencia)", lambda: naive_twilio(URL, FORM), iterations)
+    bench("firma con HMAC precalculado", lambda: twilio.signature(URL, FORM), iterations)
+    bench("verificar: válida", lambda: verifier.verify_twilio(URL, FORM, valid), iterations)
+    bench("verificar: falsificada", lambda: verifier.verify_twilio(URL, FORM, forged), iterations)
+    bench("verificar: sin cabecera", lambda: verifier.verify_twilio(URL, FORM, None), iterations)
+
+    print(f"\nCal.com (cuerpo de {len(CAL_BODY)} bytes)")
+    bench("verificar: válida", lambda: verifier.verify_cal(CAL_BODY, cal_valid), iterations)
+    bench("verificar: falsificada", lambda: verifier.verify_cal(CAL_BODY, "0" * 64), iterations)
+    bench("verificar: sin cabecera", lambda: verifier.verify_cal(CAL_BODY, None), iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque: cuánto tarda un worker en importar app.py y en atender
+su primera conversación, en frío y precargado.
+
+Cada repetición es un intérprete nuevo (subproceso) que mide:
+
+    import_ms         import app (sin precarga: lo que espera /health)
+    preload_ms        app.preload() (lo que hace el master de gunicorn una vez)
+    first_request_ms  primer POST /webhook (test client de Flask)
+    first_date_ms     primera fecha que no resuelve la ruta rápida (dateparser)
+
+en dos variantes: "cold" (sin precarga: la primera fecha paga el import de
+dateparser) y "preloaded" (preload() antes de la primera petición, como un
+worker de gunicorn con preload_app). Además lista los módulos más lentos de
+importar según `python -X importtime`.
+
+Cada ejecución se añade a benchmarks/results/startup.jsonl (con el commit
+actual) y se compara con la anterior de mismos parámetros.
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 5] [--intent-mode off]
+"""
+
+import os
+import sys
+import json
+import argparse
+import datetime
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "startup.jsonl")
+
+CHILD = r"""
+import sys, json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+if sys.argv[1] == "preloaded":
+    app.preload()
+preloaded = time.perf_counter()
+client = app.app.test_client()
+client.post("/webhook", data={"Body": "Hola, quiero agendar una cita",
+                              "From": "whatsapp:+15550000001", "MessageSid": "SMstartup0001"})
+requested = time.perf_counter()
+app.parse_user_date_time("el próximo viernes por la tarde a las 3", "es")
+dated = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "preload_ms": (preloaded - imported) * 1000,
+    "first_request_ms": (requested - preloaded) * 1000,
+    "first_date_ms": (dated - requested) * 1000,
+}))
+"""
+
+METRICS = ("import_ms", "preload_ms", "first_request_ms", "first_date_ms")
+
+
+def child_env(intent_mode):
+    env = dict(os.environ)
+    env.update({
+        "INTENT_MODE": intent_mode,
+        "CAL_API_KEY": "",  # Sin índice de huecos ni llamadas a Cal.com
+        "SESSION_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+
+def run_child(variant, env):
+    out = subprocess.run([sys.executable, "-c", CHILD, variant], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top=10):
+    """Imports directos de app.py con más tiempo acumulado en `-X importtime` (ms)"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    totals, children = {}, {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Sangría de dos espacios por nivel; los hijos se imprimen antes que su padre
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            children[name] = children.get(name, 0) + int(cumulative) / 1000
+        elif depth == 0:
+            if name == "app":
+                totals = children  # Hijos directos de app (su tiempo incluye el de sus hijos)
+            children = {}
+    return sorted(((round(ms, 1), name) for name, ms in totals.items()), reverse=True)[:top]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def store_result(result):
+    """Añadir el resultado y devolver la ejecución anterior comparable (o None)"""
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    previous = None
+    if os.path.exists(RESULTS_PATH):
+        with open(RESULTS_PATH, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["params"] == result["params"]:
+                    previous = entry
+    with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--intent-mode", choices=("off", "server", "inprocess"), default="off")
+    parser.add_argument("--no-store", action="store_true", help="no guardar el resultado")
+    args = parser.parse_args()
+    env = child_env(args.intent_mode)
+
+    variants = {}
+    for variant in ("cold", "preloaded"):
+        samples = [run_child(variant, env) for _ in range(args.runs)]
+        variants[variant] = {metric: round(statistics.median(s[metric] for s in samples), 1)
+                             for metric in METRICS}
+
+    print(f"Arranque de app.py (mediana de {args.runs} intérpretes, INTENT_MODE={args.intent_mode})")
+    print(f"  {'':10} " + " ".join(f"{metric:>17}" for metric in METRICS))
+    for variant, values in variants.items():
+        print(f"  {variant:10} " + " ".join(f"{values[metric]:>17}" for metric in METRICS))
+
+    imports = slowest_imports(env)
+    print("\nImports más lentos (-X importtime, acumulado):")
+    for ms, name in imports:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if not args.no_store:
+        result = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "params": {"runs": args.runs, "intent_mode": args.intent_mode},
+            "variants": variants,
+            "slowest_imports": imports,
+        }
+        previous = store_result(result)
+        if previous:
+            before, after = previous["variants"]["cold"], variants["cold"]
+            print(f"\n  vs. {previous['commit']}: import {before['import_ms']} -> {after['import_ms']} ms, "
+                  f"primera fecha en frío {before['first_date_ms']} -> {after['first_date_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Registro de tenants con cientos de negocios en un solo proceso.
+
+Genera un TENANTS_FILE temporal con N negocios (la mitad con textos propios)
+y mide la carga inicial, la recarga en caliente tras un cambio, el coste de
+get(To) por petición y la memoria de los catálogos con textos propios.
+
+Uso:
+    python benchmarks/bench_tenants.py [negocios]
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from responses import ResponseCatalog
+from tenants import Tenant, TenantRegistry, DEFAULT_TENANT_ID
+
+
+def tenant_entries(count):
+    entries = []
+    for i in range(count):
+        entry = {
+            "id": f"negocio-{i}",
+            "numbers": [f"+1555{i:07d}"],
+            "cal": {"user": f"negocio-{i}", "event_type_id": 100000 + i, "event_type_slug": "cita"},
+            "timezone": ("America/New_York", "America/Chicago", "Europe/Madrid")[i % 3],
+        }
+        if i % 2 == 0:
+            entry["responses"] = {"conversation": {"en": {
+                "location": f"We are at {i} Main St, Queens.",
+                "hours": "We're open Monday to Friday from 9 AM to 6 PM.",
+            }}}
+        entries.append(entry)
+    return entries
+
+
+def write(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"tenants": entries}, f)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    base = ResponseCatalog("conversation", default_lang="en")
+    path = os.path.join(tempfile.mkdtemp(prefix="tenants-"), "tenants.json")
+    entries = tenant_entries(count)
+    write(path, entries)
+
+    start = time.perf_counter()
+    registry = TenantRegistry(Tenant(DEFAULT_TENANT_ID), path=path, reload_interval=0)
+    print(f"Carga inicial de {count} negocios: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    numbers = [f"whatsapp:+1555{i:07d}" for i in range(count)]
+    iterations = 200000
+    seconds = timeit.timeit(lambda: registry.get(numbers[iterations % count]), number=iterations)
+    print(f"get(To) con comprobación de mtime:  {seconds / iterations * 1e6:.2f} µs")
+    registry.reload_interval = 5
+    seconds = timeit.timeit(lambda: registry.get(numbers[iterations % count]), number=iterations)
+    print(f"get(To) entre comprobaciones:       {seconds / iterations * 1e6:.2f} µs")
+
+    tracemalloc.start()
+    catalogs = [registry.get(number).catalog("conversation", base) for number in numbers]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    custom = sum(1 for catalog in catalogs if catalog is not base)
+    print(f"Catálogos propios: {custom} ({current / 1024 / max(custom, 1):.1f} KiB cada uno); "
+          f"el resto comparte el catálogo base")
+
+    # Recarga en caliente: cambia un negocio, el resto conserva sus objetos
+    before = registry.get(numbers[1])
+    entries[0]["responses"]["conversation"]["en"]["location"] = "We moved to 2 Main St."
+    write(path, entries)
+    os.utime(path, ns=(time.time_ns() + 1_000_000, time.time_ns() + 1_000_000))
+    start = time.perf_counter()
+    assert registry.reload()
+    print(f"Recarga tras un cambio: {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"(objetos sin cambios reutilizados: {registry.get(numbers[1]) is before})")
+    print(registry.get(numbers[0]).catalog("conversation", base).get("es").render("location"))
+
+
+if __name__ == "__main__":
+    main()
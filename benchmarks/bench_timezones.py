@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Zonas horarias (timezones.py): comprobaciones en los cambios de hora y coste
+de la conversión masiva.
+
+1. Cambios de hora (termina con error si alguno falla):
+   - Salto de marzo y vuelta de noviembre en America/New_York, Europe/Madrid
+     y America/Santiago: horas inexistentes, repetidas y el desfase enviado a
+     Cal.com a cada lado del cambio.
+   - Parser por capas con "mañana a las 3 PM" la víspera de cada cambio.
+2. Coste por hueco de una respuesta de /v2/slots: texto ISO -> UTC (antes y
+   con to_utc_many) y UTC -> hora local (astimezone directo, que usa
+   app.format_slots, frente a un desfase fijo por día, que no compensa
+   frente a zoneinfo en C).
+
+Uso:
+    python benchmarks/bench_timezones.py [huecos]
+"""
+
+import os
+import sys
+import timeit
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timezones import UTC, get_zone, normalize, to_utc_many, zone_for_phone
+from date_parsing import LayeredDateParser
+
+# (zona, hora inexistente, hora repetida): salto y vuelta de 2026
+TRANSITIONS = [
+    ("America/New_York", datetime.datetime(2026, 3, 8, 2, 30), datetime.datetime(2026, 11, 1, 1, 30)),
+    ("Europe/Madrid", datetime.datetime(2026, 3, 29, 2, 30), datetime.datetime(2026, 10, 25, 2, 30)),
+    ("America/Santiago", datetime.datetime(2026, 9, 6, 0, 30), datetime.datetime(2026, 4, 4, 23, 30)),
+]
+
+failures = []
+
+
+def legacy_to_utc(value):
+    """availability._to_utc antes de timezones.to_utc"""
+    value = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(UTC).replace(second=0, microsecond=0)
+
+
+def check(label, got, expected):
+    if got != expected:
+        failures.append(f"{label}: {got!r} != {expected!r}")
+
+
+def check_transitions():
+    for name, gap, fold in TRANSITIONS:
+        zone = get_zone(name)
+        # Hora inexistente: se mueve hacia delante lo que dura el salto
+        moved = normalize(gap, zone)
+        check(f"{name} salto", moved.astimezone(UTC), gap.replace(tzinfo=zone, fold=0).astimezone(UTC))
+        check(f"{name} salto ida y vuelta", normalize(moved, zone), moved)
+        check(f"{name} salto hacia delante", moved.replace(tzinfo=None) > gap, True)
+        # Hora repetida: la primera (desfase de antes del cambio)
+        first = normalize(fold, zone)
+        earlier = (fold - datetime.timedelta(hours=3)).replace(tzinfo=zone)
+        check(f"{name} repetida", first.utcoffset(), earlier.utcoffset())
+        # Desfase de Cal.com: el de cada fecha, no uno fijo
+        for day in (gap.date(), fold.date()):
+            for hour in (0, 12, 23):
+                local = normalize(datetime.datetime.combine(day, datetime.time(hour)), zone)
+                check(f"{name} ida y vuelta {local}", local.astimezone(UTC).astimezone(zone), local)
+
+
+def check_parser():
+    parser = LayeredDateParser()
+    for name, gap, fold in TRANSITIONS:
+        zone = get_zone(name)
+        for day in (gap, fold):
+            eve = normalize(datetime.datetime.combine(day.date() - datetime.timedelta(days=1),
+                                                      datetime.time(20)), zone)
+            parsed = normalize(parser.parse("mañana a las 3 PM", "es", now=eve), zone)
+            check(f"{name} mañana 3 PM desde {eve}", (parsed.date(), parsed.hour, parsed.minute),
+                  (day.date(), 15, 0))
+            check(f"{name} desfase de mañana 3 PM", parsed.utcoffset(),
+                  datetime.datetime.combine(day.date(), datetime.time(15), tzinfo=zone).utcoffset())
+    # Misma frase y mismo instante en otra zona: no sale de la caché de la primera
+    instant = datetime.datetime(2026, 10, 17, 12, tzinfo=UTC)
+    ny = parser.parse("mañana a las 3 PM", "es", now=instant.astimezone(get_zone("America/New_York")))
+    madrid = parser.parse("mañana a las 3 PM", "es", now=instant.astimezone(get_zone("Europe/Madrid")))
+    check("caché por zona", ny.astimezone(UTC) - madrid.astimezone(UTC), datetime.timedelta(hours=6))
+    check("prefijo +34", zone_for_phone("whatsapp:+34600000000"), "Europe/Madrid")
+    check("prefijo +351", zone_for_phone("+351910000000"), "Europe/Lisbon")
+    check("prefijo +1", zone_for_phone("whatsapp:+14155238886"), None)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    check_transitions()
+    check_parser()
+    if failures:
+        print("❌ Fallos en los cambios de hora:")
+        for failure in failures:
+            print("  ", failure)
+        sys.exit(1)
+    print("✅ Cambios de hora: salto, hora repetida, desfase de Cal.com y parser")
+
+    # Huecos de 30 minutos de una ventana de disponibilidad, como los devuelve Cal.com
+    start = datetime.datetime(2026, 10, 20, 11, tzinfo=UTC)
+    slots = [start + datetime.timedelta(minutes=30 * i) for i in range(count)]
+    texts = [slot.strftime("%Y-%m-%dT%H:%M:%S.000Z") for slot in slots]
+    zone = get_zone("America/New_York")
+    assert to_utc_many(texts) == [legacy_to_utc(text) for text in texts] == slots
+
+    number = 50
+    per_slot = lambda fn: min(timeit.repeat(fn, number=number, repeat=5)) / number / count * 1e9
+    print(f"\n{count} huecos de /v2/slots")
+    print(f"  ISO -> UTC antes               {per_slot(lambda: [legacy_to_utc(t) for t in texts]):8.0f} ns/hueco")
+    print(f"  ISO -> UTC to_utc_many         {per_slot(lambda: to_utc_many(texts)):8.0f} ns/hueco")
+    print(f"  UTC -> local astimezone        {per_slot(lambda: [s.astimezone(zone) for s in slots]):8.0f} ns/hueco")
+    fixed = datetime.timezone(slots[0].astimezone(zone).utcoffset())
+    print(f"  UTC -> desfase fijo por día    {per_slot(lambda: [s.astimezone(fixed) for s in slots]):8.0f} ns/hueco"
+          f" (sin contar la búsqueda del día)")
+
+
+if __name__ == "__main__":
+    main()
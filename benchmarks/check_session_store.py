@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Comprobación de los backends de session_store.py con la misma batería.
+
+- memory: MemorySessionStore
+- sqlite: SQLiteSessionStore en un archivo temporal
+- redis:  RedisSessionStore sobre el cliente en memoria de fake_redis.py
+          (o sobre un servidor real con --redis-url)
+
+Para cada backend:
+    - load/save/delete y count() (también tras caducar el TTL)
+    - lectura-modificación-escritura con store.session() desde muchos hilos:
+      no debe perderse ningún incremento
+    - lock: un lease caducado se puede tomar, y al liberar no se borra el
+      lock de otro dueño
+    - claves de idempotencia: claim/complete/key_result/release y TTL
+
+Uso:
+    python benchmarks/check_session_store.py [--threads 16] [--increments 50]
+    python benchmarks/check_session_store.py --backend redis --redis-url redis://localhost:6379/15
+Sale con código 1 si algún backend falla.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore
+from fake_redis import FakeRedis
+
+TTL = 0.5  # Corto para comprobar la caducidad sin esperar mucho
+
+
+def make_store(backend, redis_url, tmpdir):
+    if backend == "memory":
+        return MemorySessionStore(ttl=TTL)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path=os.path.join(tmpdir, "sessions.db"), ttl=TTL, lease=TTL)
+    if redis_url:
+        import redis
+        client = redis.Redis.from_url(redis_url)
+        client.flushdb()
+    else:
+        client = FakeRedis()
+    # El TTL de Redis es entero: 1 s
+    return RedisSessionStore(client=client, ttl=1, lease=TTL)
+
+
+def check_basic(store):
+    store.save("+1", {'name': 'Ana'})
+    store.save("+2", {'name': 'Bo'})
+    assert store.load("+1") == {'name': 'Ana'}, store.load("+1")
+    assert store.count() == 2, store.count()
+    store.delete("+2")
+    assert store.load("+2") is None
+    assert store.count() == 1, store.count()
+    time.sleep(max(TTL, getattr(store, 'ttl', TTL)) + 0.1)
+    assert store.load("+1") is None, "la sesión no caducó"
+    assert store.count() == 0, store.count()
+
+
+def check_concurrency(store, threads, increments):
+    phones = [f"+34600{n:04}" for n in range(4)]
+
+    def worker(index):
+        phone = phones[index % len(phones)]
+        for _ in range(increments):
+            with store.session(phone, lambda p: {'count': 0}) as data:
+                data['count'] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    expected = (threads // len(phones)) * increments
+    counts = {phone: (store.load(phone) or {}).get('count') for phone in phones}
+    assert all(count == expected for count in counts.values()), f"esperado {expected}: {counts}"
+    for phone in phones:
+        store.delete(phone)
+
+
+def check_lock(store):
+    if isinstance(store, MemorySessionStore):
+        return  # Lock solo dentro del proceso, sin lease
+    with store.lock("+9"):
+        pass
+    # Un lease ajeno caducado se puede tomar
+    if isinstance(store, RedisSessionStore):
+        store.client.set(store.lock_prefix + "+9", "otro", px=int(TTL * 1000))
+    else:
+        store._conn().execute("INSERT OR REPLACE INTO session_locks (phone, owner, expires_at) VALUES (?, ?, ?)",
+                              ("+9", "otro", time.time() + TTL))
+    start = time.monotonic()
+    with store.lock("+9"):
+        waited = time.monotonic() - start
+    assert TTL * 0.5 < waited < TTL * 4, f"espera del lease: {waited:.2f}s"
+    # Liberar no borra el lock de otro dueño
+    if isinstance(store, RedisSessionStore):
+        store.client.set(store.lock_prefix + "+8", "otro", px=60000)
+        assert store.client.eval(store._RELEASE, 1, store.lock_prefix + "+8", "yo") == 0
+        assert store.client.get(store.lock_prefix + "+8") == b"otro"
+        store.client.delete(store.lock_prefix + "+8")
+
+
+def check_keys(store):
+    assert store.claim_key("messages:SM1", TTL), "primera entrega no registrada"
+    assert not store.claim_key("messages:SM1", TTL), "duplicado registrado como primera entrega"
+    assert store.key_result("messages:SM1") == (False, None), store.key_result("messages:SM1")
+    store.complete_key("messages:SM1", ["<Response/>", 200], TTL)
+    done, response = store.key_result("messages:SM1")
+    assert done and list(response) == ["<Response/>", 200], (done, response)
+    store.release_key("messages:SM1")
+    assert store.key_result("messages:SM1") is None, "la clave no se liberó"
+    assert store.claim_key("messages:SM1", 1)
+    time.sleep(1.1)
+    assert store.claim_key("messages:SM1", 1), "la clave no caducó"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "sqlite", "redis", "all"], default="all")
+    parser.add_argument("--redis-url", default=None, help="Servidor Redis real en vez de fake_redis.py")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--increments", type=int, default=50)
+    args = parser.parse_args()
+
+    backends = ["memory", "sqlite", "redis"] if args.backend == "all" else [args.backend]
+    failed = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for backend in backends:
+            store = make_store(backend, args.redis_url, tmpdir)
+            start = time.perf_counter()
+            try:
+                check_basic(store)
+                check_concurrency(store, args.threads, args.increments)
+                check_lock(store)
+                check_keys(store)
+            except AssertionError as e:
+                failed = True
+                print(f"❌ {backend}: {e}")
+                continue
+            extra = ""
+            if isinstance(getattr(store, 'client', None), FakeRedis):
+                before = store.client.calls
+                store.count()
+                extra = f", count() = {store.client.calls - before} comandos"
+            print(f"✅ {backend}: OK en {time.perf_counter() - start:.2f}s{extra}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Cliente Redis en memoria para probar RedisSessionStore sin servidor.
+
+Implementa solo los comandos que usa session_store.py, con la semántica de
+redis-py (valores en bytes, SET con ex/px/nx, TTL por clave):
+
+    get, set, delete, scan_iter, eval, zadd, zrem, zremrangebyscore, zcard,
+    pipeline(transaction=False)
+
+`eval` no interpreta Lua: ejecuta el equivalente en Python de los scripts
+conocidos (SCRIPTS). Es seguro entre hilos, no entre procesos.
+
+Uso:
+    store = RedisSessionStore(client=FakeRedis())
+"""
+
+import os
+import sys
+import time
+import fnmatch
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import RedisSessionStore
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class FakeRedis:
+    """Subconjunto de redis.Redis en un dict protegido por un lock"""
+
+    def __init__(self):
+        self._data = {}  # clave -> valor (bytes) o dict (sorted set)
+        self._expires = {}  # clave -> caducidad (time.monotonic)
+        self._lock = threading.RLock()
+        self.calls = 0
+
+    def _alive(self, key):
+        """Borrar la clave si caducó; True si existe"""
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            del self._expires[key]
+        return key in self._data
+
+    def get(self, name):
+        with self._lock:
+            self.calls += 1
+            return self._data[name] if self._alive(name) else None
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        with self._lock:
+            self.calls += 1
+            if nx and self._alive(name):
+                return None
+            self._data[name] = _bytes(value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self._expires[name] = time.monotonic() + ex
+            elif px is not None:
+                self._expires[name] = time.monotonic() + px / 1000
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            self.calls += 1
+            removed = 0
+            for name in names:
+                if self._alive(name):
+                    del self._data[name]
+                    self._expires.pop(name, None)
+                    removed += 1
+            return removed
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            self.calls += 1
+            keys = [key for key in list(self._data) if self._alive(key) and fnmatch.fnmatchcase(key, match)]
+        return iter(key.encode("utf-8") for key in keys)
+
+    def eval(self, script, numkeys, *args):
+        with self._lock:
+            self.calls += 1
+            return SCRIPTS[script](self, list(args[:numkeys]), list(args[numkeys:]))
+
+    # --- Sorted sets (índice de sesiones de RedisSessionStore.count) ---
+
+    def _zset(self, name):
+        if not self._alive(name):
+            self._data[name] = {}
+        return self._data[name]
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            self.calls += 1
+            zset = self._zset(name)
+            added = sum(1 for member in mapping if _text(member) not in zset)
+            zset.update({_text(member): float(score) for member, score in mapping.items()})
+            return added
+
+    def zrem(self, name, *members):
+        with self._lock:
+            self.calls += 1
+            zset = self._zset(name)
+            return sum(1 for member in members if zset.pop(_text(member), None) is not None)
+
+    def zremrangebyscore(self, name, min, max):
+        with self._lock:
+            self.calls += 1
+            zset = self._zset(name)
+            low, high = float(min), float(max)
+            stale = [member for member, score in zset.items() if low <= score <= high]
+            for member in stale:
+                del zset[member]
+            return len(stale)
+
+    def zcard(self, name):
+        with self._lock:
+            self.calls += 1
+            return len(self._zset(name))
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    """Acumula comandos y los ejecuta de una vez (atómico respecto a otros hilos)"""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+def _compare_and_delete(client, keys, args):
+    """Equivalente de RedisSessionStore._RELEASE: borrar el lock solo si es nuestro"""
+    if client.get(keys[0]) == _bytes(args[0]):
+        return client.delete(keys[0])
+    return 0
+
+
+SCRIPTS = {RedisSessionStore._RELEASE: _compare_and_delete}
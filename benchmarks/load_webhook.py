@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga y latencia del flujo de WhatsApp.
+
+Reproduce payloads reales de Twilio (form-urlencoded) para muchos teléfonos
+concurrentes a través de la máquina de estados completa:
+
+    conversation (/webhook de app.py):   collecting_info -> waiting_time -> reserva
+    agent (/webhook/whatsapp de webhook.py): saludo -> intención -> fecha
+
+Cal.com y Twilio se sustituyen por un stub local con latencia configurable.
+Las peticiones van firmadas (X-Twilio-Signature) como las de Twilio.
+
+Cada teléfono pide un hueco distinto (mañana o pasado mañana, de 7:00 a
+16:30) y el negocio abre los siete días (BUSINESS_DAYS): la etapa de reserva
+se alcanza sea cual sea el día de la ejecución. Las reservas y los mensajes
+salientes van por colas de fondo: antes de informar se espera a que se vacíen
+(booking_queue_depth, outbound_queue_depth) para que sus llamadas upstream
+cuenten.
+
+Modos:
+    wsgi       servidor Flask (threaded) en un subproceso
+    asgi       uvicorn (asgi.py) en un subproceso
+    inprocess  cliente de pruebas de Flask en este proceso; además mide el coste
+               por etapa (idioma, intención, extracción, fecha, llamada upstream)
+
+Cada ejecución se añade a benchmarks/results/load.jsonl (con el commit actual)
+y se compara con la ejecución anterior de mismos parámetros.
+
+Uso:
+    python benchmarks/load_webhook.py --mode inprocess --target conversation
+    python benchmarks/load_webhook.py --mode asgi --phones 500 --concurrency 100 --cal-latency 0.3
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import datetime
+import functools
+import threading
+import tempfile
+import subprocess
+import urllib.request
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "load.jsonl")
+sys.path.insert(0, ROOT)
+
+from signatures import TwilioValidator, TWILIO_SIGNATURE_HEADER
+
+TWILIO_TO = "whatsapp:+14155238886"
+ACCOUNT_SID = "ACloadtest00000000000000000000000"
+
+# Mensajes por teléfono según el endpoint (multilingües, como en producción).
+# {day} es "mañana" o "pasado mañana" en el idioma del guion y {time} la hora del hueco
+SCRIPTS = {
+    "conversation": [
+        ["Hola, quiero agendar una cita", "Me llamo Ana López, ana{i}@example.com", "{day} a las {time}"],
+        ["Hi, I'd like to book an appointment", "My name is John Smith, john{i}@example.com", "{day} at {time}"],
+        ["Bonjour, je voudrais un rendez-vous", "Je m'appelle Pierre Dubois, pierre{i}@example.fr", "{day} à {time}"],
+        ["Hallo, ich möchte einen Termin buchen", "Mein Name ist Hans Müller, hans{i}@example.de", "{day} um {time}"],
+        ["Ciao, vorrei prenotare un appuntamento", "Mi chiamo Marco Rossi, marco{i}@example.it", "{day} alle {time}"],
+        ["Olá, quero marcar uma consulta", "Meu nome é João Silva, joao{i}@example.com.br", "{day} às {time}"],
+    ],
+    "agent": [
+        ["Hola", "quiero agendar una cita", "{day} a las {time}"],
+        ["Hello", "I want to schedule a meeting", "{day} at {time}"],
+    ],
+}
+# "mañana" / "pasado mañana" en el idioma de cada guion (mismo orden que SCRIPTS)
+DAY_WORDS = {
+    "conversation": [("mañana", "pasado mañana"), ("tomorrow", "day after tomorrow"), ("demain", "après-demain"),
+                     ("morgen", "übermorgen"), ("domani", "dopodomani"), ("amanhã", "depois de amanhã")],
+    "agent": [("mañana", "pasado mañana"), ("tomorrow", "day after tomorrow")],
+}
+PATHS = {"conversation": "/webhook", "agent": "/webhook/whatsapp"}
+# Colas de fondo que hay que vaciar antes de informar (gauges de /metrics)
+QUEUE_GAUGES = ("booking_queue_depth", "outbound_queue_depth")
+DRAIN_TIMEOUT = 120
+
+
+def _slot_grid(days=14):
+    """Todas las medias horas de los próximos días libres (el horario lo filtra la app)"""
+    start = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    grid = {}
+    for i in range(days * 48):
+        slot = start + datetime.timedelta(minutes=30 * i)
+        grid.setdefault(slot.date().isoformat(), []).append({"start": slot.isoformat()})
+    return grid
+
+
+SLOT_GRID = _slot_grid()
+
+
+# --- Stubs de Cal.com y Twilio ---
+
+class UpstreamStubHandler(BaseHTTPRequestHandler):
+    """Cal.com (/v2/...) y Twilio (/Accounts/...) con latencia inyectada"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        time.sleep(self.server.cal_latency)
+        if self.path.startswith("/v2/slots"):
+            key, body = "cal_slots", {"data": SLOT_GRID}
+        else:
+            key, body = "cal_event_types", {"data": [{"id": 1, "booking_url": "https://cal.com/stub/demo"}]}
+        with self.server.lock:
+            self.server.calls[key] += 1
+        self._reply(200, body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/Accounts/"):
+            time.sleep(self.server.twilio_latency)
+            key, body = "twilio_messages", {"sid": "SMstub"}
+        else:
+            time.sleep(self.server.cal_latency)
+            key, body = "cal_bookings", {"status": "success", "data": {"uid": "stub"}}
+        with self.server.lock:
+            self.server.calls[key] += 1
+        self._reply(201, body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(cal_latency, twilio_latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamStubHandler)
+    server.daemon_threads = True
+    server.cal_latency = cal_latency
+    server.twilio_latency = twilio_latency
+    server.lock = threading.Lock()
+    server.calls = {"cal_event_types": 0, "cal_slots": 0, "cal_bookings": 0, "twilio_messages": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def upstream_env(stub):
+    base = f"http://127.0.0.1:{stub.server_address[1]}"
+    # Estado en disco nuevo en cada ejecución (mismos teléfonos y huecos), fuera del directorio de trabajo
+    state = tempfile.mkdtemp(prefix="load-")
+    return {
+        "CAL_API_KEY": "load-test",
+        "CAL_API_BASE": f"{base}/v2",
+        "TWILIO_API_BASE": base,
+        "TWILIO_ACCOUNT_SID": ACCOUNT_SID,
+        "TWILIO_AUTH_TOKEN": "load-test",
+        "TWILIO_MPS": "1000",
+        "BOOKING_DB_PATH": os.path.join(state, "bookings.db"),
+        "BOOKING_INDEX_DB_PATH": os.path.join(state, "booking_index.db"),
+        "OUTBOUND_DEAD_LETTER_PATH": os.path.join(state, "outbound_dead_letter.jsonl"),
+        # Abierto todos los días: "mañana" nunca cae en día de cierre
+        "BUSINESS_DAYS": "0,1,2,3,4,5,6",
+    }
+
+
+# --- Servidor bajo prueba ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, target, port, env, workers):
+    env = dict(os.environ, **env)
+    if mode == "wsgi":
+        flask_app = "app.app" if target == "conversation" else "webhook.WhatsAppWebhookAgent().app"
+        module = "app" if target == "conversation" else "webhook"
+        cmd = [sys.executable, "-c",
+               f"import {module}; {flask_app}.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1",
+               "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"El servidor {mode} no arrancó")
+
+
+def twilio_payload(phone, body, index, step):
+    """Campos que envía Twilio en un mensaje entrante de WhatsApp"""
+    return {
+        "SmsMessageSid": f"SM{index:08d}{step:02d}",
+        "NumMedia": "0",
+        "ProfileName": f"Cliente {index}",
+        "SmsSid": f"SM{index:08d}{step:02d}",
+        "WaId": phone.split("+")[-1],
+        "SmsStatus": "received",
+        "Body": body,
+        "To": TWILIO_TO,
+        "NumSegments": "1",
+        "MessageSid": f"SM{index:08d}{step:02d}",
+        "AccountSid": ACCOUNT_SID,
+        "From": phone,
+        "ApiVersion": "2010-04-01",
+    }
+
+
+def http_sender(url, auth_token):
+    validator = TwilioValidator(auth_token)
+
+    def send(form):
+        data = urlencode(form).encode()
+        headers = {TWILIO_SIGNATURE_HEADER: validator.signature(url, form).decode()}
+        request = urllib.request.Request(url, data=data, headers=headers)
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+    return send
+
+
+def metrics_depths(url):
+    """Profundidad de las colas de fondo del servidor, leída de su /metrics"""
+    def read():
+        with urllib.request.urlopen(url, timeout=10) as response:
+            text = response.read().decode()
+        depths = {}
+        for line in text.splitlines():
+            name = line.split("{")[0].split(" ")[0]
+            if name in QUEUE_GAUGES:
+                depths[name] = depths.get(name, 0) + float(line.rsplit(" ", 1)[1])
+        return depths
+    return read
+
+
+# --- Modo en proceso: coste por etapa ---
+
+class StageTimer:
+    """Envuelve funciones de un módulo para medir cuánto cuesta cada etapa"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, attr, stage):
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.samples.setdefault(stage, []).append(elapsed)
+
+        setattr(owner, attr, timed)
+
+    def summary(self):
+        result = {}
+        for stage, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            result[stage] = {
+                "calls": len(samples),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+                "p95_ms": round(percentile(samples, 0.95), 3),
+            }
+        return result
+
+
+def inprocess_sender(target, env, timer):
+    os.environ.update(env)
+    if target == "conversation":
+        import app as bot
+        timer.wrap(bot, "identify_language", "language_detection")
+        timer.wrap(bot, "detect_intent", "intent")
+        timer.wrap(bot, "extract_entities", "extraction")
+        timer.wrap(bot, "parse_user_date_time", "date_parsing")
+        timer.wrap(bot, "create_cal_booking", "upstream_cal_booking")
+        flask_app = bot.app
+    else:
+        import webhook
+        agent = webhook.WhatsAppWebhookAgent()
+        timer.wrap(webhook, "identify_language", "language_detection")
+        timer.wrap(agent, "get_cal_booking_url", "booking_url")
+        flask_app = agent.app
+    import webhook
+    # Antes de crear la cola saliente: sus workers llaman a la función envuelta
+    timer.wrap(webhook, "deliver_whatsapp_message", "upstream_twilio_send")
+
+    def read_depths():
+        depths = {"outbound_queue_depth": webhook.get_outbound_queue().depth()}
+        if target == "conversation":
+            depths["booking_queue_depth"] = bot.BOOKING_QUEUE.journal.pending()
+        return depths
+
+    local = threading.local()
+    validator = TwilioValidator(env["TWILIO_AUTH_TOKEN"])
+    url = "http://localhost" + PATHS[target]  # URL base del cliente de pruebas
+
+    def send(form):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        headers = {TWILIO_SIGNATURE_HEADER: validator.signature(url, form).decode()}
+        client.post(PATHS[target], data=form, headers=headers)
+    return send, read_depths
+
+
+# --- Ejecución y resultados ---
+
+def booking_slot(index):
+    """Hueco del teléfono: (0 = mañana, 1 = pasado mañana, "HH:MM"), 40 huecos distintos de 7:00 a 16:30"""
+    slot = index % 40
+    return slot // 20, f"{7 + slot % 20 // 2}:{30 * (slot % 2):02d}"
+
+
+def conversation(send, target, index):
+    """Un teléfono recorre su guion completo; devuelve la latencia de cada mensaje"""
+    phone = f"whatsapp:+1555{index:07d}"
+    script = SCRIPTS[target][index % len(SCRIPTS[target])]
+    day, slot_time = booking_slot(index)
+    day_word = DAY_WORDS[target][index % len(SCRIPTS[target])][day]
+    latencies = []
+    for step, body in enumerate(script):
+        form = twilio_payload(phone, body.format(i=index, day=day_word, time=slot_time), index, step)
+        start = time.perf_counter()
+        send(form)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(samples, pct):
+    return samples[min(len(samples) - 1, int(len(samples) * pct))] * 1000
+
+
+def wait_drained(read_depths, timeout=DRAIN_TIMEOUT):
+    """Esperar a que las colas de fondo se vacíen: (segundos, vacías)"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if not any(read_depths().values()):
+            return time.perf_counter() - start, True
+        time.sleep(0.1)
+    return time.perf_counter() - start, False
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def store_result(result):
+    """Añadir el resultado y devolver la ejecución anterior comparable (o None)"""
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    previous = None
+    if os.path.exists(RESULTS_PATH):
+        with open(RESULTS_PATH, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["params"] == result["params"]:
+                    previous = entry
+    with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("wsgi", "asgi", "inprocess"), default="inprocess")
+    parser.add_argument("--target", choices=tuple(PATHS), default="conversation")
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--cal-latency", type=float, default=0.2, help="latencia del stub de Cal.com (s)")
+    parser.add_argument("--twilio-latency", type=float, default=0.1, help="latencia del stub de Twilio (s)")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn (modo asgi)")
+    parser.add_argument("--no-store", action="store_true", help="no guardar el resultado")
+    args = parser.parse_args()
+
+    stub = start_stub(args.cal_latency, args.twilio_latency)
+    env = upstream_env(stub)
+    timer = StageTimer()
+    proc = None
+    if args.mode == "inprocess":
+        send, read_depths = inprocess_sender(args.target, env, timer)
+    else:
+        port = free_port()
+        proc = start_server(args.mode, args.target, port, env, args.workers)
+        send = http_sender(f"http://127.0.0.1:{port}{PATHS[args.target]}", env["TWILIO_AUTH_TOKEN"])
+        read_depths = metrics_depths(f"http://127.0.0.1:{port}/metrics")
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda i: conversation(send, args.target, i), range(args.phones)))
+        elapsed = time.perf_counter() - start
+        # Reservas y respuestas salientes siguen en cola: sus llamadas upstream también cuentan
+        drain, drained = wait_drained(read_depths)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+        stub.shutdown()
+
+    samples = sorted(latency for result in results for latency in result)
+    result = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "params": {
+            "mode": args.mode, "target": args.target, "phones": args.phones,
+            "concurrency": args.concurrency, "cal_latency": args.cal_latency,
+            "twilio_latency": args.twilio_latency, "workers": args.workers,
+        },
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(samples, 0.50), 2),
+        "p95_ms": round(percentile(samples, 0.95), 2),
+        "p99_ms": round(percentile(samples, 0.99), 2),
+        "drain_s": round(drain, 2),
+        "drained": drained,
+        "upstream_calls": dict(stub.calls),
+        "stages": timer.summary(),
+    }
+
+    print(f"{args.mode}/{args.target}: {result['requests']} peticiones en {elapsed:.2f}s "
+          f"({result['throughput_rps']} req/s), concurrencia {args.concurrency}")
+    print(f"  p50 {result['p50_ms']} ms   p95 {result['p95_ms']} ms   p99 {result['p99_ms']} ms")
+    print(f"  colas de fondo vaciadas en {drain:.2f}s" if drained
+          else f"  ⚠️ colas de fondo sin vaciar tras {drain:.0f}s")
+    print(f"  llamadas upstream: {result['upstream_calls']}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<22} {stats['calls']:>6} llamadas   media {stats['mean_ms']:>8} ms   p95 {stats['p95_ms']:>8} ms")
+
+    if not args.no_store:
+        previous = store_result(result)
+        if previous:
+            delta = (result["throughput_rps"] / previous["throughput_rps"] - 1) * 100
+            print(f"  vs. {previous['commit']}: {previous['throughput_rps']} req/s ({delta:+.1f}%), "
+                  f"p99 {previous['p99_ms']} -> {result['p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Prueba de estrés del despachador por teléfono (dispatcher.py).
+
+Muchos teléfonos envían ráfagas de mensajes desde muchos hilos a la vez. Cada
+mensaje hace lectura-modificación-escritura de la sesión en el almacén de
+session_store.py (SQLite por defecto, el de producción con varios workers),
+sin el bloqueo por teléfono y con una pausa entre leer y escribir para abrir
+la ventana de carrera:
+
+    session['count'] += 1
+    session['seq'].append(n)     # orden de llegada del mensaje
+    session['name'] / ['email']  # campos distintos en mensajes distintos
+
+Con el despachador no debe perderse ninguna actualización y 'seq' debe quedar
+en orden. Como control, el mismo tráfico en un ThreadPoolExecutor normal debe
+perder actualizaciones (si no, la prueba no está detectando carreras).
+
+Uso:
+    python benchmarks/stress_dispatcher.py [--phones 200] [--messages 50] [--backend sqlite|memory|redis]
+
+--backend redis usa el cliente en memoria de fake_redis.py.
+Sale con código 1 si el despachador pierde o desordena alguna actualización.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import Dispatcher, AsyncDispatcher
+from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore
+from fake_redis import FakeRedis
+
+
+def make_store(backend, tmpdir, name):
+    """Almacén vacío para una pasada"""
+    if backend == "sqlite":
+        return SQLiteSessionStore(path=os.path.join(tmpdir, f"{name}.db"))
+    if backend == "redis":
+        return RedisSessionStore(client=FakeRedis())
+    return MemorySessionStore()
+
+
+def make_handler(store, pause):
+    def handle(phone, n):
+        # Sin store.lock(): el orden por teléfono es cosa del despachador
+        session = store.load(phone) or {'count': 0, 'seq': [], 'name': None, 'email': None}
+        count, seq = session['count'], list(session['seq'])
+        time.sleep(pause)  # Ventana de carrera entre leer y escribir
+        updated = dict(session, count=count + 1, seq=seq + [n])
+        if n % 2 == 0:
+            updated['name'] = f"cliente {n}"
+        else:
+            updated['email'] = f"c{n}@example.com"
+        store.save(phone, updated)
+    return handle
+
+
+def check(store, phones, messages):
+    """Número de sesiones con actualizaciones perdidas o fuera de orden"""
+    expected = list(range(messages))
+    bad = 0
+    for i in range(phones):
+        session = store.load(f"+1555{i:07d}") or {}
+        if session.get('count') != messages or session.get('seq') != expected:
+            bad += 1
+        elif session['name'] is None or session['email'] is None:
+            bad += 1
+    return bad
+
+
+def run_threads(submit, phones, messages, senders):
+    """Enviar los mensajes de cada teléfono en orden, repartidos entre muchos hilos"""
+    def send_burst(i):
+        phone = f"+1555{i:07d}"
+        return [submit(phone, n) for n in range(messages)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=senders) as pool:
+        futures = [f for burst in pool.map(send_burst, range(phones)) for f in burst]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--senders", type=int, default=16)
+    parser.add_argument("--pause", type=float, default=0.0005)
+    parser.add_argument("--backend", choices=["sqlite", "memory", "redis"], default="sqlite")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run(args, tmpdir)
+
+
+def run(args, tmpdir):
+    total = args.phones * args.messages
+    print(f"Almacén de sesiones: {args.backend}")
+
+    # Control: pool normal, sin orden por teléfono
+    sessions = make_store(args.backend, tmpdir, "baseline")
+    handle = make_handler(sessions, args.pause)
+    baseline = ThreadPoolExecutor(max_workers=args.workers)
+    elapsed = run_threads(lambda phone, n: baseline.submit(handle, phone, n),
+                          args.phones, args.messages, args.senders)
+    baseline.shutdown()
+    lost = check(sessions, args.phones, args.messages)
+    print(f"ThreadPoolExecutor: {total} mensajes en {elapsed:.2f}s, "
+          f"{lost}/{args.phones} sesiones con actualizaciones perdidas o desordenadas")
+
+    # Dispatcher (hilos)
+    sessions = make_store(args.backend, tmpdir, "dispatcher")
+    handle = make_handler(sessions, args.pause)
+    dispatcher = Dispatcher(workers=args.workers).start()
+    elapsed = run_threads(lambda phone, n: dispatcher.submit(phone, handle, phone, n),
+                          args.phones, args.messages, args.senders)
+    bad_threads = check(sessions, args.phones, args.messages)
+    print(f"Dispatcher:         {total} mensajes en {elapsed:.2f}s ({total / elapsed:.0f} msg/s), "
+          f"{bad_threads}/{args.phones} sesiones con errores  {dispatcher.stats()}")
+
+    # AsyncDispatcher (asyncio): el almacén en un hilo, como en asgi.py
+    sessions = make_store(args.backend, tmpdir, "async")
+    handle = make_handler(sessions, args.pause)
+
+    async def handle_async(phone, n):
+        await asyncio.to_thread(handle, phone, n)
+
+    async def run_async():
+        conversations = AsyncDispatcher()
+        calls = [conversations.call(f"+1555{i:07d}", handle_async, f"+1555{i:07d}", n)
+                 for n in range(args.messages) for i in range(args.phones)]
+        start = time.perf_counter()
+        await asyncio.gather(*calls)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run_async())
+    bad_async = check(sessions, args.phones, args.messages)
+    print(f"AsyncDispatcher:    {total} mensajes en {elapsed:.2f}s ({total / elapsed:.0f} msg/s), "
+          f"{bad_async}/{args.phones} sesiones con errores")
+
+    if bad_threads or bad_async:
+        print("❌ Se perdieron o desordenaron actualizaciones")
+        sys.exit(1)
+    if not lost:
+        print("⚠️ El control no perdió actualizaciones: sube --pause o --workers")
+    print("✅ Sin actualizaciones perdidas y en orden por teléfono")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Índice teléfono <-> booking de Cal.com y canal de eventos de /webhook/cal.
+
+Sin el índice, las confirmaciones de Cal.com iban siempre al número fijo
+WHATSAPP_PHONE: nada unía el email o el booking con una conversación.
+
+- BookingIndex: uid del booking y email (en minúsculas) -> contacto
+  {phone, tenant, lang, tz}. Un dict en memoria (O(1), LRU de
+  BOOKING_INDEX_MAX_ENTRIES) delante de una tabla SQLite compartida entre
+  workers (BOOKING_INDEX_DB_PATH): la reserva se crea en un worker y el evento
+  de Cal.com puede llegar a otro.
+- Se rellena al crear la reserva (create_cal_booking en app.py) y desde el
+  flujo del enlace de reserva (webhook.py): el enlace lleva
+  metadata[whatsapp]=teléfono, Cal.com la devuelve en cada evento de ese
+  booking y el primer evento indexa su uid y su email.
+- La metadata llega desde la query de una página pública: va firmada
+  (metadata[sig], HMAC-SHA256 de teléfono + negocio + idioma con
+  BOOKING_LINK_SECRET) y sin firma válida se ignora. Un evento nunca cambia
+  el teléfono de un email ya indexado (el email lo escribe quien reserva).
+- CalEventPipeline: cola acotada (CAL_EVENT_QUEUE_SIZE) con CAL_EVENT_WORKERS
+  hilos. El webhook solo encola y responde; con la cola llena se responde 503
+  y Cal.com reintenta. Cada worker resuelve el destinatario (metadata -> uid
+  -> uid original si se reprogramó -> email) y pasa el texto a la cola saliente.
+"""
+
+import os
+import hmac
+import json
+import time
+import hashlib
+import queue
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+BOOKING_INDEX_DB_PATH = os.getenv("BOOKING_INDEX_DB_PATH", "booking_index.db")
+BOOKING_INDEX_MAX_ENTRIES = int(os.getenv("BOOKING_INDEX_MAX_ENTRIES", "50000"))
+BOOKING_INDEX_TTL = float(os.getenv("BOOKING_INDEX_TTL", str(90 * 86400)))
+CAL_EVENT_QUEUE_SIZE = int(os.getenv("CAL_EVENT_QUEUE_SIZE", "1000"))
+CAL_EVENT_WORKERS = int(os.getenv("CAL_EVENT_WORKERS", "2"))
+BOOKING_LINK_SECRET = (os.getenv("BOOKING_LINK_SECRET") or os.getenv("CAL_WEBHOOK_SECRET") or "").encode("utf-8")
+LATENCY_SAMPLES = 500
+
+# Claves de metadata que viajan con el booking (Cal.com solo acepta cadenas)
+METADATA_PHONE = "whatsapp"
+METADATA_TENANT = "tenant"
+METADATA_LANG = "lang"
+METADATA_SOURCE = "source"
+METADATA_SIGNATURE = "sig"
+
+def _metadata_signature(phone, tenant_id=None, lang=None):
+    message = "|".join((phone or "", tenant_id or "", lang or "")).encode("utf-8")
+    return hmac.new(BOOKING_LINK_SECRET, message, hashlib.sha256).hexdigest()[:32]
+
+
+def signed_metadata(phone, tenant_id=None, lang=None):
+    """Metadata del booking con el teléfono de la conversación, firmada"""
+    metadata = {METADATA_PHONE: phone}
+    if tenant_id:
+        metadata[METADATA_TENANT] = tenant_id
+    if lang:
+        metadata[METADATA_LANG] = lang
+    if BOOKING_LINK_SECRET:
+        metadata[METADATA_SIGNATURE] = _metadata_signature(phone, tenant_id, lang)
+    return metadata
+
+
+def verified_phone(metadata):
+    """Teléfono de la metadata si la firma es válida; None si falta o no coincide"""
+    phone, signature = metadata.get(METADATA_PHONE), metadata.get(METADATA_SIGNATURE)
+    if not (BOOKING_LINK_SECRET and phone and isinstance(signature, str)):
+        return None
+    expected = _metadata_signature(phone, metadata.get(METADATA_TENANT), metadata.get(METADATA_LANG))
+    return phone if hmac.compare_digest(expected, signature) else None
+
+
+def booking_link(url, phone, tenant_id=None, lang=None):
+    """Enlace de reserva que devuelve el teléfono (firmado) en la metadata de cada evento"""
+    params = {f"metadata[{key}]": value for key, value in signed_metadata(phone, tenant_id, lang).items()}
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+
+def event_fields(event):
+    """Campos de un evento de Cal.com (formato de webhook y formato plano antiguo)"""
+    payload = event.get("payload")
+    if not isinstance(payload, dict):
+        payload = event
+    attendee = (payload.get("attendees") or [{}])[0]
+    event_type = payload.get("event_type") or payload.get("eventType") or {}
+    return {
+        'trigger': event.get("triggerEvent") or "BOOKING_CREATED",
+        'uid': payload.get("uid") or payload.get("id"),
+        'previous_uid': payload.get("rescheduleUid") or payload.get("fromReschedule"),
+        'email': attendee.get("email") or payload.get("email"),
+        'name': attendee.get("name") or payload.get("name") or "",
+        'time_zone': attendee.get("timeZone"),
+        'start': payload.get("startTime") or payload.get("start_time"),
+        'title': payload.get("title") or event_type.get("title") or "",
+        'metadata': payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {},
+    }
+
+
+class BookingIndex:
+    """uid / email -> contacto de WhatsApp, en memoria con respaldo SQLite"""
+
+    PURGE_EVERY = 500  # Escrituras entre purgas de entradas caducadas
+
+    def __init__(self, path=BOOKING_INDEX_DB_PATH, max_entries=BOOKING_INDEX_MAX_ENTRIES,
+                 ttl=BOOKING_INDEX_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # 'uid:...' | 'email:...' -> contacto
+        self._guard = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.unverified = 0  # Eventos con metadata de teléfono sin firma válida
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS booking_contacts ("
+                     "key TEXT PRIMARY KEY, contact TEXT NOT NULL, updated_at REAL NOT NULL)")
+
+    def _after_fork(self):
+        self._local = threading.local()
+        self._guard = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _keys(uid=None, email=None):
+        keys = []
+        if uid:
+            keys.append(f"uid:{uid}")
+        if email:
+            keys.append(f"email:{email.strip().lower()}")
+        return keys
+
+    def _cache(self, key, contact):
+        """Guardar en memoria (bajo self._guard)"""
+        self._memory[key] = contact
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def remember(self, phone, uid=None, email=None, tenant=None, lang=None, tz=None):
+        """
+        Asociar el booking (uid) y/o el email al teléfono de la conversación.
+
+        Un email ya indexado (y sin caducar) conserva su teléfono: lo escribe
+        quien reserva, así que no basta para redirigir los avisos a otro número.
+        """
+        if not phone or not (uid or email):
+            return
+        contact = {'phone': phone, 'tenant': tenant, 'lang': lang, 'tz': tz}
+        value, now = json.dumps(contact), time.time()
+        conn = self._conn()
+        if uid:
+            key = self._keys(uid=uid)[0]
+            conn.execute("INSERT OR REPLACE INTO booking_contacts (key, contact, updated_at) VALUES (?, ?, ?)",
+                         (key, value, now))
+            with self._guard:
+                self._cache(key, contact)
+        if email:
+            key = self._keys(email=email)[0]
+            cursor = conn.execute(
+                "INSERT INTO booking_contacts (key, contact, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET contact = excluded.contact, updated_at = excluded.updated_at "
+                "WHERE booking_contacts.updated_at <= ? "
+                "OR json_extract(booking_contacts.contact, '$.phone') = json_extract(excluded.contact, '$.phone')",
+                (key, value, now, now - self.ttl))
+            if cursor.rowcount:
+                with self._guard:
+                    self._cache(key, contact)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM booking_contacts WHERE updated_at <= ?", (now - self.ttl,))
+
+    def lookup(self, uid=None, email=None):
+        """Contacto del booking (primero por uid, luego por email) o None"""
+        keys = self._keys(uid, email)
+        if not keys:
+            return None
+        with self._guard:
+            for key in keys:
+                contact = self._memory.get(key)
+                if contact is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return contact
+        # Otro worker pudo indexarlo: una búsqueda por clave primaria
+        for key in keys:
+            row = self._conn().execute(
+                "SELECT contact FROM booking_contacts WHERE key = ? AND updated_at > ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+            if row:
+                contact = json.loads(row[0])
+                with self._guard:
+                    self.db_hits += 1
+                    self._cache(key, contact)
+                return contact
+        with self._guard:
+            self.misses += 1
+        return None
+
+    def resolve(self, fields):
+        """Contacto de un evento (ver event_fields); indexa su uid y email para los siguientes"""
+        metadata = fields['metadata']
+        phone = verified_phone(metadata)
+        if metadata.get(METADATA_PHONE) and not phone:
+            with self._guard:
+                self.unverified += 1
+            logger.warning("⚠️ Metadata de booking sin firma válida: se ignora (uid %s)", fields['uid'])
+        if phone:
+            contact = {'phone': phone, 'tenant': metadata.get(METADATA_TENANT),
+                       'lang': metadata.get(METADATA_LANG), 'tz': fields['time_zone']}
+        else:
+            contact = (self.lookup(uid=fields['uid'])
+                       or self.lookup(uid=fields['previous_uid'])
+                       or self.lookup(email=fields['email']))
+            if contact is None:
+                return None
+        if phone or fields['previous_uid']:
+            # El booking reprogramado tiene uid nuevo: los eventos siguientes lo usan
+            self.remember(contact['phone'], uid=fields['uid'], email=fields['email'],
+                          tenant=contact.get('tenant'), lang=contact.get('lang'), tz=contact.get('tz'))
+        return contact
+
+    def stats(self):
+        """Contadores para /health"""
+        with self._guard:
+            return {
+                'entries': len(self._memory),
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'unverified': self.unverified,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_booking_index():
+    """Índice compartido del proceso (conversación de app.py y agente de webhook.py)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not BOOKING_LINK_SECRET:
+                    logger.warning("⚠️ Sin BOOKING_LINK_SECRET: la metadata de los bookings no se firma ni se usa")
+                _index = BookingIndex()
+    return _index
+
+
+class CalEventPipeline:
+    """Cola acotada de eventos de Cal.com con un pool de workers"""
+
+    def __init__(self, handle, size=CAL_EVENT_QUEUE_SIZE, workers=CAL_EVENT_WORKERS):
+        self._handle = handle  # Callable(evento)
+        self.size = size
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self.processed = 0
+        self.rejected = 0
+        self.errors = 0
+        self._wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Arrancar los workers (idempotente)"""
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"cal-events-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _after_fork(self):
+        """Los hilos no sobreviven al fork: el hijo arranca sus propios workers"""
+        started = bool(self._threads)
+        self._queue = queue.Queue(maxsize=self.size)
+        self._threads = []
+        self._lock = threading.Lock()
+        if started:
+            self.start()
+
+    def alive(self):
+        """¿Están vivos todos los workers? (para /ready)"""
+        return bool(self._threads) and all(thread.is_alive() for thread in self._threads)
+
+    def submit(self, event):
+        """Encolar un evento sin bloquear; queue.Full si la cola está llena"""
+        try:
+            self._queue.put_nowait((event, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            event, enqueued_at = self._queue.get()
+            wait_ms = (time.monotonic() - enqueued_at) * 1000
+            try:
+                self._handle(event)
+                ok = True
+            except Exception:
+                logger.exception("❌ Error procesando evento de Cal.com")
+                ok = False
+            with self._lock:
+                self.processed += 1
+                self.errors += not ok
+                self._wait_ms.append(wait_ms)
+
+    def stats(self):
+        """Profundidad y latencia de cola para /health"""
+        with self._lock:
+            ordered = sorted(self._wait_ms)
+            pick = lambda pct: round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1) if ordered else None
+            return {
+                'depth': self._queue.qsize(),
+                'capacity': self.size,
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'queue_wait_ms_p50': pick(0.50),
+                'queue_wait_ms_p95': pick(0.95),
+            }
@@ -0,0 +1,420 @@
+"""
+Cola de reservas con escritura diferida (write-behind) hacia Cal.com.
+
+- Cada reserva es un trabajo durable en un diario SQLite (BOOKING_DB_PATH),
+  compartido entre procesos. La clave de idempotencia es sha256(teléfono +
+  hueco): repetir la misma petición no crea un segundo trabajo. La clave viaja
+  también en la metadata del booking (METADATA_BOOKING_KEY).
+- Un pool de BOOKING_WORKERS hilos drena el diario. Cada trabajo se reclama
+  con un lease (BOOKING_LEASE segundos) que se renueva mientras dura la
+  llamada; si el proceso muere a mitad, otro worker lo recoge al caducar. Solo
+  el dueño del lease puede cerrar o reintentar el trabajo.
+- Fallos transitorios que no llegaron a Cal.com (RetryableBookingError:
+  timeout de conexión, 429, 5xx) se reintentan con backoff exponencial hasta
+  BOOKING_MAX_ATTEMPTS; un rechazo de Cal.com (4xx) es definitivo.
+- Sin respuesta tras enviar la petición (UncertainBookingError: timeout de
+  lectura, conexión cortada) el booking puede existir ya: el trabajo queda
+  'unknown' y el siguiente intento busca primero en Cal.com un booking con su
+  clave (find) antes de volver a reservar. Igual con un lease caducado.
+- Circuit breaker: tras BREAKER_FAILURE_THRESHOLD fallos transitorios seguidos
+  se deja de llamar a Cal.com durante BREAKER_RESET_TIMEOUT segundos; luego
+  una única reserva de prueba decide si se cierra o vuelve a abrirse. Mientras
+  tanto los trabajos esperan en el diario.
+
+El webhook solo encola y responde al momento; el resultado se notifica con
+on_result(trabajo, éxito) desde el worker.
+
+Uso:
+    queue = BookingQueue(book, on_result, find).start()
+    status = queue.submit(phone, start_time, payload)   # 'queued' | 'duplicate'
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BOOKING_DB_PATH = os.getenv("BOOKING_DB_PATH", "bookings.db")
+BOOKING_WORKERS = int(os.getenv("BOOKING_WORKERS", "4"))
+BOOKING_MAX_ATTEMPTS = int(os.getenv("BOOKING_MAX_ATTEMPTS", "5"))
+BOOKING_RETRY_DELAY = float(os.getenv("BOOKING_RETRY_DELAY", "5"))
+BOOKING_RETRY_MAX = float(os.getenv("BOOKING_RETRY_MAX", "300"))
+BOOKING_LEASE = float(os.getenv("BOOKING_LEASE", "120"))
+BOOKING_POLL_INTERVAL = float(os.getenv("BOOKING_POLL_INTERVAL", "1"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Clave de idempotencia en la metadata del booking (Cal.com solo acepta cadenas)
+METADATA_BOOKING_KEY = "booking_key"
+
+# Estados que los workers reclaman; 'unknown' y 'checking' buscan el booking antes de reservar
+ACTIVE_STATUSES = ('pending', 'running', 'unknown', 'checking')
+
+
+class RetryableBookingError(Exception):
+    """Fallo transitorio de Cal.com que no creó nada (conexión, 429, 5xx): el trabajo se reintenta"""
+
+
+class UncertainBookingError(Exception):
+    """La petición pudo llegar a Cal.com sin respuesta: se comprueba si existe antes de reintentar"""
+
+
+def idempotency_key(phone, start_time):
+    """sha256 del teléfono y el inicio del hueco (ISO 8601 en UTC: el mismo instante da la misma clave)"""
+    if getattr(start_time, "tzinfo", None) is not None:
+        start_time = start_time.astimezone(datetime.timezone.utc)
+    slot = start_time.isoformat() if hasattr(start_time, "isoformat") else str(start_time)
+    return hashlib.sha256(f"{phone}|{slot}".encode("utf-8")).hexdigest()
+
+
+class CircuitBreaker:
+    """closed -> open tras N fallos seguidos -> half_open tras reset_timeout -> closed"""
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def allow(self):
+        """¿Se puede llamar a Cal.com ahora? En half_open solo pasa una llamada de prueba"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def retry_after(self):
+        """Segundos hasta la próxima llamada de prueba (0 si está cerrado)"""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("✅ Circuit breaker de Cal.com cerrado")
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                    logger.warning("⚡ Circuit breaker de Cal.com abierto (%s fallos seguidos)", self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self._failures, 'opened': self.opened}
+
+
+class BookingJournal:
+    """Trabajos de reserva en SQLite (modo WAL), con una conexión por hilo"""
+
+    def __init__(self, path=BOOKING_DB_PATH, lease=BOOKING_LEASE):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS booking_jobs ("
+            " key TEXT PRIMARY KEY, phone TEXT NOT NULL, payload TEXT NOT NULL,"
+            " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " error TEXT, lease_id TEXT)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(booking_jobs)")}
+        if "lease_id" not in columns:  # Diario creado por una versión anterior
+            conn.execute("ALTER TABLE booking_jobs ADD COLUMN lease_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS booking_jobs_due ON booking_jobs (status, next_attempt_at)")
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, key, phone, payload):
+        """Encolar un trabajo; False si ya hay uno activo con la misma clave (uno fallido se reencola)"""
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO booking_jobs (key, phone, payload, status, next_attempt_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'pending', ?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET payload = excluded.payload, status = 'pending', attempts = 0,"
+            " next_attempt_at = excluded.next_attempt_at, updated_at = excluded.updated_at, error = NULL"
+            " WHERE booking_jobs.status = 'failed'",
+            (key, phone, json.dumps(payload), now, now, now),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self):
+        """
+        Reclamar el siguiente trabajo vencido (o con el lease caducado); None si no hay.
+
+        Un trabajo 'unknown', o 'running' con el lease caducado (su worker murió
+        a mitad de la llamada), pasa a 'checking': hay que buscarlo en Cal.com.
+        """
+        now = time.time()
+        lease_id = uuid.uuid4().hex
+        rows = self._conn().execute(
+            "UPDATE booking_jobs SET status = CASE status WHEN 'pending' THEN 'running' ELSE 'checking' END,"
+            " attempts = attempts + 1, next_attempt_at = ?, updated_at = ?, lease_id = ?"
+            " WHERE key = (SELECT key FROM booking_jobs"
+            f"  WHERE status IN {ACTIVE_STATUSES} AND next_attempt_at <= ?"
+            "  ORDER BY next_attempt_at LIMIT 1)"
+            " RETURNING key, phone, payload, attempts, status",
+            (now + self.lease, now, lease_id, now),
+        ).fetchall()  # Consumir el RETURNING entero: libera el bloqueo de escritura
+        if not rows:
+            return None
+        key, phone, payload, attempts, status = rows[0]
+        return {'key': key, 'phone': phone, 'payload': json.loads(payload), 'attempts': attempts,
+                'status': status, 'lease_id': lease_id}
+
+    def extend(self, key, lease_id):
+        """Renovar el lease de un trabajo en curso; False si ya no es de este worker"""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE booking_jobs SET next_attempt_at = ?, updated_at = ?"
+            " WHERE key = ? AND lease_id = ? AND status IN ('running', 'checking')",
+            (now + self.lease, now, key, lease_id),
+        )
+        return cursor.rowcount == 1
+
+    def finish(self, key, lease_id, status, error=None):
+        """Marcar el trabajo como 'done' o 'failed'; False si el lease ya no es de este worker"""
+        cursor = self._conn().execute(
+            "UPDATE booking_jobs SET status = ?, error = ?, updated_at = ?, lease_id = NULL"
+            " WHERE key = ? AND lease_id = ?",
+            (status, error, time.time(), key, lease_id),
+        )
+        return cursor.rowcount == 1
+
+    def retry(self, key, lease_id, delay, error=None, status='pending'):
+        """Volver a 'pending' (o 'unknown') dentro de `delay` segundos; False si el lease no es de este worker"""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE booking_jobs SET status = ?, next_attempt_at = ?, error = ?, updated_at = ?, lease_id = NULL"
+            " WHERE key = ? AND lease_id = ?",
+            (status, now + delay, error, now, key, lease_id),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key, lease_id, status, delay):
+        """Devolver un trabajo reclamado sin intentarlo (no cuenta como intento)"""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE booking_jobs SET status = ?, attempts = attempts - 1, next_attempt_at = ?,"
+            " updated_at = ?, lease_id = NULL WHERE key = ? AND lease_id = ?",
+            ('pending' if status == 'running' else 'unknown', now + delay, now, key, lease_id),
+        )
+
+    def counts(self):
+        """{estado: trabajos}"""
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM booking_jobs GROUP BY status").fetchall())
+
+    def pending(self):
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM booking_jobs WHERE status IN {ACTIVE_STATUSES}"
+        ).fetchone()[0]
+
+
+class BookingQueue:
+    """Workers que drenan el diario hacia Cal.com detrás de un circuit breaker"""
+
+    def __init__(self, book, on_result, find=None, journal=None, breaker=None, workers=BOOKING_WORKERS,
+                 max_attempts=BOOKING_MAX_ATTEMPTS, retry_delay=BOOKING_RETRY_DELAY,
+                 retry_max=BOOKING_RETRY_MAX, poll_interval=BOOKING_POLL_INTERVAL):
+        self._book = book  # Callable(payload, key) -> bool; RetryableBookingError / UncertainBookingError
+        self._on_result = on_result  # Callable(job, success)
+        self._find = find  # Callable(payload, key) -> bool: ¿ya existe en Cal.com? (RetryableBookingError)
+        self.journal = journal or BookingJournal()
+        self.breaker = breaker or CircuitBreaker()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._leases = {}  # key -> lease_id de los trabajos en curso en este proceso
+        self.lost_leases = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Arrancar los workers y el renovador de leases (idempotente)"""
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"booking-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._keep_leases, name="booking-leases", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def _after_fork(self):
+        """Los hilos no sobreviven al fork; los trabajos siguen en el diario"""
+        started = bool(self._threads)
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._leases = {}
+        if started:
+            self.start()
+
+    def alive(self):
+        """¿Están vivos todos los workers? (para /ready)"""
+        return bool(self._threads) and all(thread.is_alive() for thread in self._threads)
+
+    def submit(self, phone, start_time, payload):
+        """Encolar una reserva: 'queued', o 'duplicate' si ya estaba en curso o hecha"""
+        key = idempotency_key(phone, start_time)
+        if not self.journal.add(key, phone, payload):
+            metrics.inc("booking_jobs_total", result="duplicate")
+            return 'duplicate'
+        metrics.inc("booking_jobs_total", result="queued")
+        self._wakeup.set()
+        return 'queued'
+
+    def _backoff(self, attempts):
+        delay = min(self.retry_max, self.retry_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _keep_leases(self):
+        """Renovar el lease de las llamadas en curso: una lenta no se reclama desde otro worker"""
+        while True:
+            time.sleep(self.journal.lease / 3)
+            for key, lease_id in list(self._leases.items()):
+                try:
+                    self.journal.extend(key, lease_id)
+                except sqlite3.Error as e:
+                    logger.error("❌ Error renovando el lease de una reserva: %s", e)
+
+    def _worker(self):
+        while True:
+            wait = self.breaker.retry_after()
+            if wait:
+                time.sleep(min(wait, self.poll_interval))
+                continue
+            try:
+                job = self.journal.claim()
+            except sqlite3.Error as e:
+                logger.error("❌ Error leyendo el diario de reservas: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            if not self.breaker.allow():  # Otro worker está haciendo la llamada de prueba
+                self.journal.release(job['key'], job['lease_id'], job['status'],
+                                     self.breaker.retry_after() or self.poll_interval)
+                continue
+            self._leases[job['key']] = job['lease_id']
+            try:
+                self._process(job)
+            finally:
+                self._leases.pop(job['key'], None)
+
+    def _call(self, job):
+        """Reservar; un trabajo 'checking' (intento anterior sin respuesta) busca antes el booking por su clave"""
+        if job['status'] == 'checking' and self._find is not None:
+            try:
+                found = self._find(job['payload'], job['key'])
+            except RetryableBookingError as e:
+                raise UncertainBookingError(f"sin comprobar: {e}") from e  # Sigue 'unknown'
+            if found:
+                logger.info("🔎 La reserva ya estaba en Cal.com", extra={"phone": job['phone']})
+                metrics.inc("booking_jobs_total", result="found")
+                return True
+        # No existe (o es el primer intento): reservar no la duplica
+        return self._book(job['payload'], job['key'])
+
+    def _process(self, job):
+        try:
+            success = self._call(job)
+        except (RetryableBookingError, UncertainBookingError) as e:
+            self.breaker.record_failure()
+            uncertain = isinstance(e, UncertainBookingError)
+            if job['attempts'] < self.max_attempts:
+                delay = self._backoff(job['attempts'])
+                status = 'unknown' if uncertain else 'pending'
+                if not self.journal.retry(job['key'], job['lease_id'], delay, str(e), status):
+                    self._lost_lease(job)
+                    return
+                metrics.inc("booking_jobs_total", result="unknown" if uncertain else "retried")
+                logger.warning("🔁 Reserva %s, nuevo intento en %.0fs (intento %s): %s",
+                               "sin confirmar" if uncertain else "reintentada", delay, job['attempts'], e,
+                               extra={"phone": job['phone']})
+                return
+            success = False
+            error = str(e)
+        except Exception as e:
+            logger.exception("❌ Error inesperado en la reserva", extra={"phone": job['phone']})
+            success = False
+            error = str(e)
+        else:
+            self.breaker.record_success()  # Cal.com respondió (aunque rechace la reserva)
+            error = None if success else "rejected"
+
+        if not self.journal.finish(job['key'], job['lease_id'], 'done' if success else 'failed', error):
+            self._lost_lease(job)
+            return
+        metrics.inc("booking_jobs_total", result="done" if success else "failed")
+        try:
+            self._on_result(job, success)
+        except Exception:
+            logger.exception("❌ Error notificando el resultado de la reserva", extra={"phone": job['phone']})
+
+    def _lost_lease(self, job):
+        """Otro worker reclamó el trabajo (lease caducado): él decide y notifica"""
+        self.lost_leases += 1
+        metrics.inc("booking_jobs_total", result="lost_lease")
+        logger.warning("⚠️ Lease de la reserva perdido: el resultado lo registra otro worker",
+                       extra={"phone": job['phone']})
+
+    def stats(self):
+        """Contadores para /health"""
+        return {
+            'workers': self.workers,
+            'jobs': self.journal.counts(),
+            'lost_leases': self.lost_leases,
+            'circuit_breaker': self.breaker.stats(),
+        }
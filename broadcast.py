@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Difusiones y recordatorios masivos por WhatsApp.
+
+- Origen de destinatarios: un CSV (columnas phone, y opcionalmente id,
+  send_at, message y cualquier campo usado por la plantilla) o los bookings
+  próximos de Cal.com (recordatorios REMINDER_LEAD_HOURS antes de la cita).
+  Los recordatorios recorren los negocios de TENANTS_FILE (ver tenants.py):
+  cada cuenta de Cal.com se consulta una vez, y cada recordatorio sale del
+  número del negocio, con sus textos, en el idioma y la zona del cliente.
+- Planificación: cola de prioridad (heapq) ordenada por hora de envío; un
+  hilo planificador despacha cada envío cuando le toca.
+- Envío: pool de BROADCAST_CONCURRENCY hilos sobre post_whatsapp_message,
+  limitado a BROADCAST_MPS mensajes por segundo (token bucket, como la cola
+  saliente). Los rechazos de Twilio (respuesta distinta de 201) se
+  replanifican con backoff hasta BROADCAST_MAX_RETRIES veces.
+- Checkpoint en SQLite por campaña y envío: al reanudar tras una caída no se
+  repite nada que se haya enviado. Un envío que quedó a medias ('sending') o
+  que falló por la red después de salir (timeout de lectura: 'unknown') no se
+  reintenta por defecto (no sabemos si Twilio lo aceptó); se informa como
+  'unknown'. --dry-run lee el checkpoint pero no escribe en él.
+- Informe de progreso y final con envíos por segundo.
+
+Uso:
+    python broadcast.py csv destinatarios.csv --campaign promo-nov --template "Hola {name}, ..."
+    python broadcast.py reminders                # bookings de las próximas REMINDER_LEAD_HOURS (24) horas
+    python broadcast.py csv destinatarios.csv --campaign prueba --dry-run
+"""
+
+import os
+import csv
+import time
+import heapq
+import sqlite3
+import logging
+import argparse
+import datetime
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# .env antes que los módulos del proyecto: leen su configuración al importarse
+load_dotenv()
+
+import http_client
+import timezones
+from outbound_queue import TokenBucket, TWILIO_MPS
+from responses import format_datetime
+from tenants import TenantRegistry
+from webhook import post_whatsapp_message, CATALOG, default_tenant
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_MPS = float(os.getenv("BROADCAST_MPS", str(TWILIO_MPS)))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_RETRY_DELAY = float(os.getenv("BROADCAST_RETRY_DELAY", "5"))
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "broadcast.db")
+BROADCAST_PROGRESS_EVERY = float(os.getenv("BROADCAST_PROGRESS_EVERY", "10"))
+REMINDER_LEAD_HOURS = float(os.getenv("REMINDER_LEAD_HOURS", "24"))
+
+UTC = datetime.timezone.utc
+# Estados que no se vuelven a enviar al reanudar
+FINAL_STATUSES = frozenset({"sent", "failed", "sending", "unknown"})
+# Sin saber si Twilio lo aceptó: solo con --retry-unknown
+UNKNOWN_STATUSES = frozenset({"sending", "unknown"})
+
+
+class Checkpoint:
+    """Estado de cada envío por campaña (SQLite en modo WAL)"""
+
+    def __init__(self, path=BROADCAST_DB_PATH, read_only=False):
+        self.read_only = read_only  # --dry-run: ve lo ya enviado, no marca nada
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS broadcast_sends ("
+            " campaign TEXT NOT NULL, job_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (campaign, job_id))"
+        )
+        self._conn.commit()
+
+    def load(self, campaign):
+        """{job_id: estado} de una campaña"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status FROM broadcast_sends WHERE campaign = ?", (campaign,)
+            ).fetchall()
+        return dict(rows)
+
+    def mark(self, campaign, job_id, status, attempts):
+        if self.read_only:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO broadcast_sends VALUES (?, ?, ?, ?, ?)",
+                (campaign, job_id, status, attempts, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Broadcast:
+    """Planificador por hora de envío + pool de envío limitado en ritmo y concurrencia"""
+
+    def __init__(self, campaign, send=post_whatsapp_message, checkpoint=None,
+                 concurrency=BROADCAST_CONCURRENCY, rate=BROADCAST_MPS,
+                 max_retries=BROADCAST_MAX_RETRIES, retry_delay=BROADCAST_RETRY_DELAY,
+                 retry_unknown=False):
+        self.campaign = campaign
+        self._send = send  # Callable(to, body, sender) -> bool; los errores de red se propagan
+        self.checkpoint = checkpoint or Checkpoint()
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retry_unknown = retry_unknown
+        self._bucket = TokenBucket(rate)
+
+        self._heap = []  # (enviar_en, secuencia, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+
+        self.scheduled = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.skipped = 0  # Ya enviados (o fallidos) en una ejecución anterior
+        self.unknown = 0  # Sin saber si Twilio lo aceptó (a medias o error de red tras enviarlo)
+
+    def _push(self, send_at, job):
+        heapq.heappush(self._heap, (send_at, next(self._seq), job))
+
+    def schedule(self, jobs):
+        """Planificar los envíos que no constan en el checkpoint"""
+        done = self.checkpoint.load(self.campaign)
+        with self._cond:
+            for job in jobs:
+                status = done.get(job['id'])
+                if status in UNKNOWN_STATUSES and not self.retry_unknown:
+                    self.unknown += 1
+                    continue
+                if status in FINAL_STATUSES - UNKNOWN_STATUSES:
+                    self.skipped += 1
+                    continue
+                job.setdefault('attempts', 0)
+                self._push(job['send_at'], job)
+                self.scheduled += 1
+            self._cond.notify()
+
+    def run(self):
+        """Enviar todo lo planificado; devuelve el informe final"""
+        start = time.monotonic()
+        last_report = start
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast") as pool:
+            while True:
+                with self._cond:
+                    while True:
+                        if not self._heap and self._in_flight == 0:
+                            break
+                        wait = None
+                        if self._heap and self._in_flight < self.concurrency:
+                            wait = self._heap[0][0] - time.time()
+                            if wait <= 0:
+                                break
+                        self._cond.wait(timeout=min(wait, BROADCAST_PROGRESS_EVERY) if wait else BROADCAST_PROGRESS_EVERY)
+                    if not self._heap:
+                        break
+                    _, _, job = heapq.heappop(self._heap)
+                    self._in_flight += 1
+
+                self._bucket.acquire()
+                pool.submit(self._send_one, job)
+
+                if time.monotonic() - last_report >= BROADCAST_PROGRESS_EVERY:
+                    last_report = time.monotonic()
+                    logger.info("📣 %s", self.report(last_report - start))
+        return self.report(time.monotonic() - start)
+
+    def _send_one(self, job):
+        job['attempts'] += 1
+        self.checkpoint.mark(self.campaign, job['id'], 'sending', job['attempts'])
+        try:
+            ok = self._send(job['to'], job['body'], job.get('sender'))
+            definite = True
+        except Exception as e:
+            logger.error("❌ Error enviando a %s: %s", job['to'], e, extra={"phone": job['to']})
+            ok = False
+            definite = http_client.not_sent(e)  # Timeout de conexión: no llegó a Twilio
+
+        if ok:
+            status = 'sent'
+        elif not definite:
+            status = 'unknown'  # Pudo aceptarlo antes del error: reenviar podría duplicar
+        elif job['attempts'] <= self.max_retries:
+            status = 'retry'  # Twilio no lo aceptó: se puede reenviar sin duplicar
+        else:
+            status = 'failed'
+        self.checkpoint.mark(self.campaign, job['id'], status, job['attempts'])
+
+        with self._cond:
+            self._in_flight -= 1
+            if status == 'sent':
+                self.sent += 1
+            elif status == 'retry':
+                self.retried += 1
+                self._push(time.time() + self.retry_delay * (2 ** (job['attempts'] - 1)), job)
+            elif status == 'unknown':
+                self.unknown += 1
+                logger.warning("❓ Envío a %s sin confirmar: no se reintenta (--retry-unknown)", job['to'],
+                               extra={"phone": job['to']})
+            else:
+                self.failed += 1
+                logger.error("💀 Envío a %s abandonado tras %s intentos", job['to'], job['attempts'],
+                             extra={"phone": job['to']})
+            self._cond.notify()
+
+    def report(self, elapsed):
+        with self._cond:
+            return {
+                'campaign': self.campaign,
+                'scheduled': self.scheduled,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retries': self.retried,
+                'pending': len(self._heap) + self._in_flight,
+                'skipped': self.skipped,
+                'unknown': self.unknown,
+                'elapsed_seconds': round(elapsed, 1),
+                'sends_per_second': round(self.sent / elapsed, 2) if elapsed else None,
+            }
+
+
+def _parse_send_at(value):
+    """Hora de envío (epoch) desde ISO 8601; vacío = ahora"""
+    if not value:
+        return time.time()
+    dt = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.astimezone()  # Hora local del servidor
+    return dt.timestamp()
+
+
+def csv_jobs(path, template=None):
+    """Envíos desde un CSV; el cuerpo es la columna message o `template` con los campos de la fila"""
+    render = template.format_map if template else None
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            phone = (row.get('phone') or '').strip()
+            if not phone:
+                continue
+            body = row.get('message') or (render(row) if render else None)
+            if not body:
+                raise ValueError(f"Fila sin mensaje para {phone}: usa la columna message o --template")
+            yield {
+                'id': row.get('id') or f"{phone}|{row.get('send_at', '')}",
+                'to': phone,
+                'body': body,
+                'send_at': _parse_send_at(row.get('send_at')),
+            }
+
+
+def booking_jobs(hours=REMINDER_LEAD_HOURS, lead_hours=REMINDER_LEAD_HOURS, tenants=None, page_size=100):
+    """Recordatorios para los bookings de Cal.com que empiezan en las próximas `hours` horas"""
+    tenants = tenants or TenantRegistry(default_tenant())
+    # Negocios por cuenta de Cal.com: varios pueden compartirla (distinto tipo de evento)
+    accounts = {}
+    for tenant in tenants.all():
+        if tenant.cal_api_key:
+            accounts.setdefault((tenant.cal_api_base, tenant.cal_api_key), []).append(tenant)
+    for account_tenants in accounts.values():
+        yield from _account_reminders(account_tenants, hours, lead_hours, page_size)
+
+
+def _account_reminders(tenants, hours, lead_hours, page_size):
+    """Recordatorios de una cuenta de Cal.com; cada booking va al negocio de su tipo de evento"""
+    by_event_type = {str(t.event_type_id): t for t in tenants if t.event_type_id}
+    now = datetime.datetime.now(UTC)
+    headers = {'Authorization': f'Bearer {tenants[0].cal_api_key}', 'cal-api-version': '2024-08-13'}
+    skip = 0
+    while True:
+        response = http_client.get(f"{tenants[0].cal_api_base}/bookings", headers=headers, params={
+            'status': 'upcoming',
+            'afterStart': now.isoformat(),
+            'beforeEnd': (now + datetime.timedelta(hours=hours)).isoformat(),
+            'take': page_size,
+            'skip': skip,
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"Error API Cal.com {response.status_code}: {response.text}")
+        bookings = response.json().get('data', [])
+
+        for booking in bookings:
+            attendee = (booking.get('attendees') or [{}])[0]
+            fields = booking.get('bookingFieldsResponses') or {}
+            phone = attendee.get('phoneNumber') or fields.get('phone')
+            if not phone:
+                continue
+            tenant = by_event_type.get(str(booking.get('eventTypeId')), tenants[0])
+            start = datetime.datetime.fromisoformat(booking['start'].replace("Z", "+00:00"))
+            tz = timezones.get_zone(attendee.get('timeZone') or tenant.timezone)
+            messages = tenant.catalog("agent", CATALOG).get(attendee.get('language'))
+            yield {
+                'id': f"{booking.get('uid')}|{booking['start']}",
+                'to': phone,
+                'sender': tenant.twilio_number,
+                'body': messages.render(
+                    'reminder', name=attendee.get('name', ''),
+                    formatted_time=format_datetime(start.astimezone(tz), messages.lang)
+                ),
+                'send_at': max(time.time(), (start - datetime.timedelta(hours=lead_hours)).timestamp()),
+            }
+
+        if len(bookings) < page_size:
+            return
+        skip += page_size
+
+
+def dry_run_send(to, body, sender=None):
+    """--dry-run: registrar el envío sin llamar a Twilio"""
+    logger.info("🧪 [dry-run] %s: %s", to, body[:60], extra={"phone": to})
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sources = parser.add_subparsers(dest="source", required=True)
+    from_csv = sources.add_parser("csv", help="destinatarios desde un CSV")
+    from_csv.add_argument("path")
+    from_csv.add_argument("--template", help="cuerpo con campos de la fila, p. ej. 'Hola {name}'")
+    from_csv.add_argument("--campaign", required=True)
+    reminders = sources.add_parser("reminders", help="recordatorios de bookings de Cal.com")
+    reminders.add_argument("--hours", type=float, default=REMINDER_LEAD_HOURS,
+                           help="ventana de bookings a recordar (por defecto REMINDER_LEAD_HOURS)")
+    reminders.add_argument("--campaign", default="reminders")
+    for sub in (from_csv, reminders):
+        sub.add_argument("--dry-run", action="store_true", help="no enviar, solo registrar")
+        sub.add_argument("--retry-unknown", action="store_true",
+                         help="reenviar los que quedaron a medias en una ejecución anterior")
+    args = parser.parse_args()
+
+    send = dry_run_send if args.dry_run else post_whatsapp_message
+    checkpoint = Checkpoint(read_only=args.dry_run)  # Un dry-run no marca nada como enviado
+
+    jobs = csv_jobs(args.path, args.template) if args.source == "csv" else booking_jobs(args.hours)
+    broadcast = Broadcast(args.campaign, send=send, checkpoint=checkpoint, retry_unknown=args.retry_unknown)
+    broadcast.schedule(jobs)
+    logger.info("📣 Campaña %s: %s envíos planificados", args.campaign, broadcast.scheduled)
+    report = broadcast.run()
+    broadcast.checkpoint.close()
+    logger.info("✅ Difusión terminada: %s", report, extra={"report": report})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Parser de fecha/hora por capas para los mensajes de cita.
+
+1. Caché: resultados memoizados por (texto normalizado, fecha local, franja de
+   tiempo, idioma, zona horaria). Un resultado que ya pasó no se sirve de la
+   caché: se vuelve a calcular.
+2. Ruta rápida: una expresión regular precompilada para las formas habituales
+   en los seis idiomas ("mañana a las 3 PM", "tomorrow 4pm", "demain 15h",
+   "morgen um 15 Uhr", "domani alle 15:00", "amanhã às 15h").
+3. Parser lento (dateparser), solo como último recurso y con el idioma como pista.
+
+La franja de tiempo (DATE_PARSE_BUCKET_SECONDS) acota cuánto puede envejecer
+un resultado relativo ("mañana") servido desde la caché; con la fecha local
+en la clave, una franja que cruza la medianoche no sirve el "mañana" de ayer.
+
+Las horas que ya pasaron se mueven al día siguiente, también con "hoy"
+("hoy a las 9" a las 15:00 es mañana a las 9): nunca se propone una cita en
+el pasado, y la confirmación muestra la fecha para que el cliente la corrija.
+"""
+
+import os
+import re
+import datetime
+import threading
+from collections import OrderedDict
+
+DATE_PARSE_CACHE_SIZE = int(os.getenv("DATE_PARSE_CACHE_SIZE", "4096"))
+DATE_PARSE_BUCKET_SECONDS = int(os.getenv("DATE_PARSE_BUCKET_SECONDS", "900"))
+
+# Palabras de día -> desplazamiento en días
+DAY_WORDS = {
+    # Hoy
+    "hoy": 0, "today": 0, "aujourd'hui": 0, "heute": 0, "oggi": 0, "hoje": 0,
+    # Mañana
+    "mañana": 1, "tomorrow": 1, "demain": 1, "morgen": 1, "domani": 1, "amanhã": 1,
+    # Pasado mañana
+    "pasado mañana": 2, "day after tomorrow": 2, "après-demain": 2,
+    "übermorgen": 2, "dopodomani": 2, "depois de amanhã": 2,
+}
+# Conectores entre el día y la hora ("a las", "at", "à", "um", "alle", "às"...)
+TIME_CONNECTORS = ["a las", "a la", "at", "à", "a", "um", "alle", "all'", "às", "as", "ás"]
+
+_DAYS = "|".join(re.escape(w) for w in sorted(DAY_WORDS, key=len, reverse=True))
+_CONNECTORS = "|".join(re.escape(w) for w in sorted(TIME_CONNECTORS, key=len, reverse=True))
+_FAST_PATTERN = re.compile(
+    rf"(?:(?P<day>{_DAYS})\s*,?\s*)?"
+    rf"(?:(?:{_CONNECTORS})\s*)?"
+    r"(?P<hour>\d{1,2})"
+    r"(?:(?::|h|\.)(?P<minute>\d{2}))?"
+    r"\s*(?P<suffix>a\.?\s?m\.?|p\.?\s?m\.?|h|uhr)?"
+    rf"(?:\s*,?\s*(?P<day2>{_DAYS}))?"
+)
+_NORMALIZE_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " .!?¡¿,;"
+
+_MISS = object()
+
+
+def normalize(text):
+    """Texto en minúsculas, sin espacios repetidos ni puntuación en los extremos"""
+    return _NORMALIZE_SPACES.sub(" ", text.lower()).strip(_TRAILING_PUNCTUATION)
+
+
+def fast_parse(normalized, now):
+    """Ruta rápida para las formas habituales; None si el texto no encaja exactamente"""
+    match = _FAST_PATTERN.fullmatch(normalized)
+    if not match:
+        return None
+
+    day = match.group("day") or match.group("day2")
+    minute = match.group("minute")
+    suffix = (match.group("suffix") or "").replace(".", "").replace(" ", "")
+    # Un número suelto ("3") es ambiguo: dejarlo para el parser lento
+    if not (day or minute or suffix):
+        return None
+
+    hour = int(match.group("hour"))
+    minute = int(minute) if minute else 0
+    if suffix in ("am", "pm"):
+        if not 1 <= hour <= 12:
+            return None
+        if suffix == "pm" and hour != 12:
+            hour += 12
+        elif suffix == "am" and hour == 12:
+            hour = 0
+    if hour > 23 or minute > 59:
+        return None
+
+    result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if day:
+        result += datetime.timedelta(days=DAY_WORDS[day])
+    if result <= now:
+        # Ya pasó (solo hora, u "hoy" a una hora pasada): preferir fechas futuras
+        result += datetime.timedelta(days=1)
+    return result
+
+
+class LayeredDateParser:
+    """Caché -> ruta rápida -> parser lento"""
+
+    def __init__(self, slow_parse=None, cache_size=DATE_PARSE_CACHE_SIZE,
+                 bucket_seconds=DATE_PARSE_BUCKET_SECONDS):
+        self._slow_parse = slow_parse  # Callable(text, lang, now) -> datetime | None
+        self.cache_size = cache_size
+        self.bucket_seconds = bucket_seconds
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.fast_hits = 0
+        self.slow_calls = 0
+
+    def parse(self, text, lang=None, now=None):
+        """Fecha/hora del texto (con zona horaria local) o None"""
+        now = now or datetime.datetime.now().astimezone()
+        normalized = normalize(text)
+        # La zona forma parte de la clave: "mañana a las 3" es otro instante en otra zona;
+        # la fecha local, porque "mañana" cambia a medianoche aunque no cambie la franja
+        key = (normalized, now.date(), int(now.timestamp()) // self.bucket_seconds, lang, now.tzinfo)
+
+        with self._lock:
+            cached = self._cache.get(key, _MISS)
+            # "3pm" calculado a las 14:55 ya pasó a las 15:05 de la misma franja: recalcular
+            if cached is not _MISS and (cached is None or cached > now):
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+
+        parsed = fast_parse(normalized, now)
+        if parsed is not None:
+            self.fast_hits += 1
+        elif self._slow_parse is not None:
+            self.slow_calls += 1
+            parsed = self._slow_parse(text, lang, now)
+
+        with self._lock:
+            self._cache[key] = parsed
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return parsed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'cache_hits': self.cache_hits,
+                'fast_hits': self.fast_hits,
+                'slow_calls': self.slow_calls,
+            }
@@ -0,0 +1,185 @@
+"""
+Índice de idempotencia para los webhooks entrantes.
+
+Twilio reintenta un webhook si respondemos lento, y Cal.com puede entregar el
+mismo evento más de una vez. Cada entrega lleva una clave estable (MessageSid,
+o uid del booking + tipo de evento): la primera entrega se procesa y su
+respuesta se guarda; los duplicados se contestan con esa respuesta sin volver
+a ejecutar la máquina de estados ni la reserva en Cal.com.
+
+- Acotado (DEDUP_MAX_ENTRIES, se expulsan las más antiguas) y con TTL.
+- Si el duplicado llega mientras el original sigue en curso (el caso típico:
+  Twilio reintenta porque aún no hemos respondido), espera su resultado hasta
+  DEDUP_WAIT_TIMEOUT segundos; si no llega, devuelve None y el llamador
+  responde con un ack vacío.
+- Si el procesamiento falla, la clave se libera para que un reintento pueda
+  procesarse de nuevo.
+
+Con `store` (un SessionStore de session_store.py con backend SQLite o Redis)
+la clave se registra también en el almacén compartido: un reintento que cae
+en otro worker lee allí la respuesta del original (esperándola si aún está en
+curso). El LRU en memoria queda como caché delante del almacén: los
+duplicados dentro del mismo proceso no lo consultan. Las respuestas
+guardadas en el almacén deben ser serializables a JSON (una tupla vuelve
+como lista).
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+import metrics
+
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "86400"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "50000"))
+DEDUP_WAIT_TIMEOUT = float(os.getenv("DEDUP_WAIT_TIMEOUT", "10"))
+DEDUP_POLL_INTERVAL = float(os.getenv("DEDUP_POLL_INTERVAL", "0.05"))  # Espera de un original en otro worker
+
+
+class _Entry:
+    __slots__ = ("expires", "done", "response")
+
+    def __init__(self, expires):
+        self.expires = expires
+        self.done = threading.Event()
+        self.response = None
+
+
+class IdempotencyIndex:
+    """Clave -> respuesta de la primera entrega, con TTL y tamaño acotado"""
+
+    def __init__(self, name, store=None, max_entries=DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL,
+                 wait_timeout=DEDUP_WAIT_TIMEOUT):
+        self.name = name
+        # Solo un almacén compartido entre workers aporta algo sobre el LRU local
+        self.store = store if store is not None and store.shared else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.duplicates = 0
+        self.shared_duplicates = 0
+        self._entries = OrderedDict()  # clave -> _Entry (orden de llegada)
+        self._guard = threading.Lock()
+
+    def _claim(self, key):
+        """Registrar la clave; devuelve (entrada, True si esta entrega es la primera)"""
+        now = time.monotonic()
+        with self._guard:
+            # Las entradas tienen el mismo TTL: las caducadas están al principio
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest.expires >= now:
+                    break
+                self._entries.popitem(last=False)
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.duplicates += 1
+                metrics.inc("webhook_duplicates_total", index=self.name)
+                return entry, False
+
+            entry = self._entries[key] = _Entry(now + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry, True
+
+    def _release(self, key, entry):
+        """El procesamiento falló: olvidar la clave y despertar a los duplicados"""
+        with self._guard:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+        if self.store is not None:
+            self.store.release_key(self._shared_key(key))
+
+    def _shared_key(self, key):
+        return f"{self.name}:{key}"
+
+    def _claim_shared(self, key, entry):
+        """Registrar la clave en el almacén compartido; False si otro worker la registró antes
+
+        En ese caso espera la respuesta del original (hasta wait_timeout) y la
+        deja en la entrada local para los duplicados de este proceso.
+        """
+        if self.store is None or self.store.claim_key(self._shared_key(key), self.ttl):
+            return True
+        self.shared_duplicates += 1
+        metrics.inc("webhook_duplicates_total", index=self.name)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            result = self.store.key_result(self._shared_key(key))
+            if result is None or result[0] or time.monotonic() >= deadline:
+                break
+            time.sleep(DEDUP_POLL_INTERVAL)
+        entry.response = result[1] if result else None
+        entry.done.set()
+        return False
+
+    def _complete(self, key, entry, response):
+        entry.response = response
+        entry.done.set()
+        if self.store is not None:
+            self.store.complete_key(self._shared_key(key), response, self.ttl)
+
+    def run_once(self, key, fn):
+        """Ejecutar fn() solo en la primera entrega de `key`; devuelve (respuesta, duplicado)"""
+        if not key:
+            return fn(), False
+        entry, first = self._claim(key)
+        if not first:
+            entry.done.wait(self.wait_timeout)
+            return entry.response, True
+        if not self._claim_shared(key, entry):
+            return entry.response, True
+        try:
+            response = fn()
+        except BaseException:
+            self._release(key, entry)
+            raise
+        self._complete(key, entry, response)
+        return response, False
+
+    async def run_once_async(self, key, fn):
+        """Igual que run_once, con fn() asíncrona (modo ASGI)"""
+        if not key:
+            return await fn(), False
+        entry, first = self._claim(key)
+        if not first:
+            if not entry.done.is_set():
+                await asyncio.to_thread(entry.done.wait, self.wait_timeout)
+            return entry.response, True
+        # El almacén (SQLite/Redis) es bloqueante: fuera del bucle de eventos
+        if self.store is not None and not await asyncio.to_thread(self._claim_shared, key, entry):
+            return entry.response, True
+        try:
+            response = await fn()
+        except BaseException:
+            if self.store is not None:
+                await asyncio.to_thread(self._release, key, entry)
+            else:
+                self._release(key, entry)
+            raise
+        if self.store is not None:
+            await asyncio.to_thread(self._complete, key, entry, response)
+        else:
+            self._complete(key, entry, response)
+        return response, False
+
+    def stats(self):
+        with self._guard:
+            size = len(self._entries)
+        return {'entries': size, 'duplicates': self.duplicates + self.shared_duplicates,
+                'shared_duplicates': self.shared_duplicates, 'shared': self.store is not None}
+
+
+def cal_event_key(event):
+    """Clave de un evento de Cal.com: tipo de evento + uid (o id) del booking"""
+    payload = event.get('payload')
+    if not isinstance(payload, dict):
+        payload = event
+    booking_id = payload.get('uid') or payload.get('bookingId') or payload.get('id') or event.get('id')
+    if not booking_id:
+        return None
+    return f"{event.get('triggerEvent', 'BOOKING')}:{booking_id}"
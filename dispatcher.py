@@ -0,0 +1,164 @@
+"""
+Despachador de conversaciones: un buzón por teléfono sobre un pool de workers.
+
+- Los mensajes de un mismo teléfono se procesan de uno en uno y en orden de
+  llegada (nunca dos a la vez), así que la lectura-modificación-escritura de
+  la sesión no pierde actualizaciones.
+- Los de teléfonos distintos se procesan en paralelo en los workers libres.
+  Un teléfono lento (p. ej. esperando a Cal.com) solo retiene a su propio
+  buzón; los demás siguen avanzando.
+- Reparto justo: tras cada mensaje el teléfono vuelve al final de la cola de
+  listos (round-robin entre conversaciones).
+
+Dispatcher usa hilos (WSGI); AsyncDispatcher es el equivalente con tareas de
+asyncio (ASGI). El orden es por proceso: entre workers de gunicorn lo sigue
+garantizando el bloqueo del almacén de sesiones.
+
+Uso:
+    dispatcher = Dispatcher().start()
+    result = dispatcher.call(phone, fn, *args)   # espera el resultado
+
+call() lanza DispatchTimeout si el resultado no llega en DISPATCH_TIMEOUT
+segundos; el mensaje sigue en su buzón y se procesará igualmente.
+"""
+
+import os
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as DispatchTimeout
+
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+DISPATCH_TIMEOUT = float(os.getenv("DISPATCH_TIMEOUT", "30"))
+
+
+class Dispatcher:
+    """Pool de workers con un buzón FIFO por clave"""
+
+    def __init__(self, workers=DISPATCH_WORKERS, timeout=DISPATCH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._mailboxes = {}   # clave -> deque de (fn, args, kwargs, future)
+        self._ready = deque()  # claves con mensajes y sin worker asignado
+        self._cond = threading.Condition()
+        self._threads = []
+
+        self.processed = 0
+        self.max_mailbox = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Arrancar los workers (idempotente)"""
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _after_fork(self):
+        """Los hilos no sobreviven al fork (workers de gunicorn con preload_app)"""
+        started = bool(self._threads)
+        self._mailboxes = {}
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        if started:
+            self.start()
+
+    def alive(self):
+        """¿Están vivos todos los workers? (para /ready)"""
+        return bool(self._threads) and all(thread.is_alive() for thread in self._threads)
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Encolar fn(*args, **kwargs) en el buzón de `key`; devuelve un Future"""
+        future = Future()
+        with self._cond:
+            mailbox = self._mailboxes.get(key)
+            if mailbox is None:
+                mailbox = self._mailboxes[key] = deque()
+                self._ready.append(key)  # Buzón nuevo: nadie lo está atendiendo
+                self._cond.notify()
+            mailbox.append((fn, args, kwargs, future))
+            self.max_mailbox = max(self.max_mailbox, len(mailbox))
+        return future
+
+    def call(self, key, fn, *args, **kwargs):
+        """submit() y esperar el resultado (hasta self.timeout segundos, si no DispatchTimeout)"""
+        return self.submit(key, fn, *args, **kwargs).result(self.timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                key = self._ready.popleft()
+                fn, args, kwargs, future = self._mailboxes[key].popleft()
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._cond:
+                self.processed += 1
+                if self._mailboxes[key]:
+                    self._ready.append(key)  # Siguiente mensaje del mismo teléfono, al final
+                    self._cond.notify()
+                else:
+                    del self._mailboxes[key]
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'active_mailboxes': len(self._mailboxes),
+                'queued': sum(len(mailbox) for mailbox in self._mailboxes.values()),
+                'processed': self.processed,
+                'max_mailbox': self.max_mailbox,
+            }
+
+
+class AsyncDispatcher:
+    """Un buzón por clave drenado por una tarea de asyncio (creada bajo demanda)"""
+
+    def __init__(self):
+        self._mailboxes = {}  # clave -> deque de (fn, args, future)
+        self._tasks = set()
+
+    async def call(self, key, fn, *args):
+        """Ejecutar `await fn(*args)` en orden respecto al resto de mensajes de `key`"""
+        future = asyncio.get_running_loop().create_future()
+        mailbox = self._mailboxes.get(key)
+        if mailbox is None:
+            mailbox = self._mailboxes[key] = deque()
+            task = asyncio.create_task(self._drain(key, mailbox))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        mailbox.append((fn, args, future))
+        return await future
+
+    async def _drain(self, key, mailbox):
+        try:
+            while mailbox:
+                fn, args, future = mailbox.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    result = await fn(*args)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del self._mailboxes[key]
+
+    def stats(self):
+        return {
+            'active_mailboxes': len(self._mailboxes),
+            'queued': sum(len(mailbox) for mailbox in self._mailboxes.values()),
+        }
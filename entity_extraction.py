@@ -0,0 +1,86 @@
+"""
+Extracción de nombre, email y teléfono en una sola pasada.
+
+Un único patrón precompilado recorre el mensaje una vez y devuelve los emails
+y teléfonos con sus posiciones. El nombre se obtiene del texto restante (sin
+esos tramos), así que no se vuelve a buscar emails ni teléfonos.
+
+Las reglas son las de las antiguas funciones extract_*_from_text de app.py:
+- teléfono: primero formato EE. UU./Canadá (solo los 10 dígitos), si no,
+  cualquier secuencia internacional de 10 o más dígitos;
+- nombre: texto en minúsculas sin frases de presentación ("me llamo", "i am",
+  "je m'appelle"...), las dos primeras palabras.
+"""
+
+import re
+
+_ENTITY_PATTERN = re.compile(
+    r"(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)"
+    r"|(?P<us_phone>\+?1?[\s\-\.]?\(?(?P<area>[0-9]{3})\)?[\s\-\.]?(?P<prefix>[0-9]{3})[\s\-\.]?(?P<line>[0-9]{4}))"
+    r"|(?P<intl_phone>\+?[\d\s\-\(\)]{10,})"
+)
+_PHONE_JUNK = re.compile(r"[^\d+]")
+
+# Frases de presentación en todos los idiomas
+NAME_INTRO_PHRASES = [
+    'mi nombre es', 'me llamo', 'soy', 'my name is', 'i am', "i'm",
+    'mon nom est', 'je suis', "je m'appelle", 'mein name ist', 'ich bin', 'ich heiße',
+    'il mio nome è', 'io sono', 'meu nome é', 'o meu nome é', 'eu sou', 'me chamo',
+]
+_INTRO_PATTERN = re.compile(
+    "|".join(re.escape(p) for p in sorted(set(NAME_INTRO_PHRASES), key=len, reverse=True))
+)
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def extract_entities(text):
+    """Email, teléfono y nombre del texto, con las posiciones de email y teléfono"""
+    email = phone = None
+    email_span = phone_span = None
+    us_phone = us_span = None
+    removed = []
+
+    for match in _ENTITY_PATTERN.finditer(text):
+        removed.append(match.span())
+        kind = match.lastgroup
+        if kind == 'email':
+            if email is None:
+                email, email_span = match.group('email'), match.span()
+        elif kind == 'intl_phone':
+            if phone is None and phone_span is None:
+                phone_span = match.span()
+                candidate = _PHONE_JUNK.sub('', match.group())
+                phone = candidate if len(candidate) >= 10 else None
+        elif us_phone is None:
+            us_phone = match.group('area') + match.group('prefix') + match.group('line')
+            us_span = match.span()
+
+    # El formato EE. UU./Canadá tiene prioridad sobre el internacional
+    if us_phone is not None:
+        phone, phone_span = us_phone, us_span
+
+    return {
+        'email': email,
+        'phone': phone,
+        'name': _extract_name(text, removed),
+        'spans': {'email': email_span, 'phone': phone_span},
+    }
+
+
+def _extract_name(text, removed):
+    """Nombre a partir del texto sin los tramos de email/teléfono ya encontrados"""
+    if removed:
+        parts, last = [], 0
+        for start, end in removed:
+            parts.append(text[last:start])
+            last = end
+        parts.append(text[last:])
+        text = " ".join(parts)
+
+    name_text = _INTRO_PATTERN.sub(" ", text.lower())
+    words = _NON_WORD.sub(" ", name_text).split()
+    if len(words) >= 2:
+        return ' '.join(words[:2])  # Primer nombre + apellido
+    elif len(words) == 1 and len(words[0]) > 2:
+        return words[0]
+    return None
@@ -0,0 +1,111 @@
+"""
+Caché de tipos de evento de Cal.com con TTL y refresco en segundo plano.
+
+Las lecturas nunca bloquean en Cal.com: si la entrada está caducada se sirve
+el valor anterior (stale-while-revalidate) y se lanza un refresco en un hilo
+aparte. Si la caché está fría, se devuelve None y el llamador usa su fallback.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CAL_EVENT_TYPES_TTL = float(os.getenv("CAL_EVENT_TYPES_TTL", "300"))
+
+
+class EventTypeCache:
+    """Tipos de evento indexados por id, con TTL y refresco en segundo plano"""
+
+    def __init__(self, fetch, ttl=CAL_EVENT_TYPES_TTL):
+        self._fetch = fetch  # Callable que devuelve la lista de tipos de evento
+        self.ttl = ttl
+        self._by_id = {}
+        self._first = None
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def get(self, event_type_id=None):
+        """Tipo de evento por id (o el primero); None si no está en caché"""
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+            if event_type_id:
+                event_type = self._by_id.get(str(event_type_id))
+            else:
+                event_type = self._first
+
+            if event_type is None:
+                self.misses += 1
+            elif stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+
+        if stale:
+            self.refresh_async()
+        return event_type
+
+    def invalidate(self):
+        """Marcar la caché como caducada y refrescarla en segundo plano"""
+        with self._lock:
+            self._loaded_at = None
+        logger.info("♻️ Caché de tipos de evento invalidada")
+        self.refresh_async()
+
+    def refresh(self):
+        """Recargar los tipos de evento (bloqueante); conserva los datos previos si falla"""
+        try:
+            event_types = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error("❌ Error refrescando tipos de evento: %s", e)
+            return False
+
+        by_id = {str(et.get('id')): et for et in event_types}
+        with self._lock:
+            self._by_id = by_id
+            self._first = event_types[0] if event_types else None
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+        logger.info("✅ Caché de tipos de evento actualizada (%s tipos)", len(by_id))
+        return True
+
+    def refresh_async(self):
+        """Lanzar un refresco en segundo plano si no hay otro en curso"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_worker, name="event-types-refresh", daemon=True).start()
+
+    def _refresh_worker(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def stats(self):
+        """Contadores para /health"""
+        with self._lock:
+            age = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+            return {
+                'entries': len(self._by_id),
+                'age_seconds': age,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'errors': self.errors,
+            }
@@ -0,0 +1,118 @@
+"""
+Salida temprana para las preguntas frecuentes sin estado.
+
+Casi todo el tráfico son preguntas de precio, ubicación, horario, entregas o
+ayuda, cuya respuesta no depende de la conversación. Sin este atajo cada una
+pagaba la detección de idioma, la intención, el despachador y la sesión
+(creada y guardada aunque el cliente no fuera a reservar).
+
+- FAQCache: LRU acotado (FAQ_CACHE_SIZE) del texto normalizado (minúsculas,
+  sin puntuación ni espacios repetidos) por negocio -> (idioma, intención). Un
+  mensaje que no es FAQ también se guarda: sigue por el camino normal con la
+  intención ya detectada, sin volver a clasificarlo.
+- Solo se usa con clientes fuera del flujo de reserva (sin sesión, o con
+  sesión sin datos recogidos): no se crea ni se modifica su sesión.
+- stats(): aciertos, fallos, ratio de aciertos y latencia ahorrada (mediana
+  del camino completo menos mediana del atajo, por respuesta servida).
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+
+FAQ_CACHE_SIZE = int(os.getenv("FAQ_CACHE_SIZE", "10000"))
+FAQ_INTENTS = frozenset({'pricing', 'location', 'hours', 'delivery', 'help'})
+LATENCY_SAMPLES = 500
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize(text):
+    """'¿Cuál es el PRECIO?! ' -> 'cuál es el precio'"""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def _median(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2]
+
+
+class FAQCache:
+    """(negocio, texto normalizado) -> (idioma, intención), LRU acotado"""
+
+    def __init__(self, max_entries=FAQ_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0  # FAQ respondida desde la caché
+        self.misses = 0  # Texto nuevo: se clasificó
+        self.passes = 0  # Texto conocido que no es FAQ: camino normal con la intención ya detectada
+        self.served = 0  # Aciertos respondidos por el atajo (cliente fuera del flujo de reserva)
+        self._hit_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._full_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    def get(self, key):
+        """(idioma, intención) guardados, o None si el texto es nuevo"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry[1] in FAQ_INTENTS:
+                self.hits += 1
+            else:
+                self.passes += 1
+            return entry
+
+    def put(self, key, lang, intent):
+        """Guardar la clasificación del texto"""
+        with self._lock:
+            self._entries[key] = (lang, intent)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_hit(self, start):
+        """Acierto respondido por el atajo y su latencia (desde time.perf_counter())"""
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.served += 1
+            self._hit_ms.append(elapsed)
+
+    def record_full(self, start):
+        """Latencia de una respuesta por el camino completo (referencia del ahorro)"""
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._full_ms.append(elapsed)
+
+    def saved_ms(self):
+        """Latencia ahorrada estimada: respondidas x (mediana completa - mediana del atajo)"""
+        with self._lock:
+            full, hit, served = _median(self._full_ms), _median(self._hit_ms), self.served
+        if full is None or hit is None:
+            return 0.0
+        return max(0.0, full - hit) * served
+
+    def stats(self):
+        """Contadores para /health y /metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.passes
+            full, hit = _median(self._full_ms), _median(self._hit_ms)
+            stats = {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'passes': self.passes,
+                'served': self.served,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'hit_ms_p50': None if hit is None else round(hit, 3),
+                'full_ms_p50': None if full is None else round(full, 3),
+            }
+        stats['saved_ms'] = round(self.saved_ms(), 1)
+        return stats
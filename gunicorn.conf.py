@@ -0,0 +1,60 @@
+"""
+Configuración de gunicorn: workers precargados y compartidos copy-on-write.
+
+El master importa la aplicación (preload_app) y llama a app.preload() antes de
+crear los workers: dateparser, el identificador de idioma y, con
+INTENT_MODE=inprocess, el modelo de intenciones se cargan una sola vez y los
+workers los heredan ya calientes tras el fork. Los servicios con hilos de fondo
+(despachadores, cola de reservas, cola saliente, eventos de Cal.com, índice de
+huecos) no arrancan en el master: lifecycle.defer() los apunta al importar y
+post_fork los arranca en cada worker (ver lifecycle.py). El resto (logging,
+cliente HTTP) se rehace en cada worker con os.register_at_fork.
+
+Uso:
+    gunicorn -c gunicorn.conf.py                           # app:app (WSGI)
+    GUNICORN_APP=asgi:app GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \\
+        gunicorn -c gunicorn.conf.py
+
+/health indica que el worker vive; /ready, que ya está precargado.
+"""
+
+import gc
+import os
+
+import lifecycle
+
+# Antes de que preload_app importe la aplicación: sin hilos de fondo en el master
+lifecycle.defer()
+
+wsgi_app = os.getenv("GUNICORN_APP", "app:app")
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str((os.cpu_count() or 1) * 2 + 1)))
+# La cola saliente reparte TWILIO_MPS entre los workers (ver outbound_queue.py); se lee al precargar
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+preload_app = True
+
+
+def when_ready(server):
+    """En el master, antes del primer fork: precargar y congelar el heap"""
+    import app
+
+    app.preload()
+    # Los objetos precargados pasan a la generación permanente: el GC de los
+    # workers no toca sus cabeceras y las páginas siguen compartidas
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """En cada worker, recién creado: arrancar los servicios de fondo apuntados en el master"""
+    lifecycle.start_deferred()
+
+
+def post_worker_init(worker):
+    """En cada worker: gunicorn restablece SIGUSR2 al arrancarlo; se reinstala el toggle del profiler"""
+    import metrics
+
+    # En el master SIGUSR2 es la actualización en caliente: enviarla siempre al pid de un worker
+    metrics.install_profiler_signal()
@@ -0,0 +1,157 @@
+"""
+Cliente HTTP compartido para las llamadas a Cal.com y Twilio.
+
+- Una sesión de requests con pools de conexiones por host y keep-alive
+  (sin handshake TCP+TLS en cada llamada).
+- Timeouts de conexión y lectura por defecto: un upstream lento ya no
+  bloquea un worker para siempre.
+- Concurrencia acotada por host.
+- Reintentos con backoff exponencial y jitter ante 429/5xx y errores de red.
+  Los métodos no idempotentes (POST) solo se reintentan cuando es seguro:
+  429 (petición rechazada) o timeout de conexión (nunca se envió).
+- Cada respuesta (o error de red) cuenta en upstream_responses_total.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del cliente ---
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", "10"))  # Por host
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.25"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "4"))
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def not_sent(error):
+    """¿El error garantiza que la petición no llegó al servidor? (timeout de conexión)"""
+    return isinstance(error, requests.ConnectTimeout)
+
+
+class HttpClient:
+    """Cliente con pool de conexiones, timeouts, límite de concurrencia y reintentos"""
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 pool_size=HTTP_POOL_SIZE, max_concurrency=HTTP_MAX_CONCURRENCY,
+                 max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE,
+                 backoff_max=HTTP_BACKOFF_MAX):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._limits = {}
+        self._limits_lock = threading.Lock()
+
+    @contextmanager
+    def _limit(self, host):
+        """Acotar las peticiones simultáneas a un mismo host"""
+        semaphore = self._limits.get(host)
+        if semaphore is None:
+            with self._limits_lock:
+                semaphore = self._limits.setdefault(host, threading.BoundedSemaphore(self.max_concurrency))
+        with semaphore:
+            yield
+
+    def _backoff(self, attempt, response=None):
+        """Backoff exponencial con jitter completo (respeta Retry-After si viene)"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+        return delay
+
+    def request(self, method, url, **kwargs):
+        """Hacer una petición HTTP con reintentos; devuelve la última respuesta"""
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                with self._limit(host):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("upstream_responses_total", host=host, status="error")
+                safe = idempotent or not_sent(e)
+                if attempt >= self.max_retries or not safe:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("⚠️ %s %s falló (%s), reintento en %.2fs", method, host, type(e).__name__, delay)
+            else:
+                metrics.inc("upstream_responses_total", host=host, status=response.status_code)
+                retryable = response.status_code in RETRY_STATUSES and (idempotent or response.status_code == 429)
+                if attempt >= self.max_retries or not retryable:
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning("⚠️ %s %s respondió %s, reintento en %.2fs", method, host, response.status_code, delay,
+                               extra={"status": response.status_code})
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Las conexiones del pool no se comparten entre procesos (workers de gunicorn)"""
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """Cliente compartido del proceso (se crea bajo demanda)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
+
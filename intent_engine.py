@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Motor de intenciones compartido por host.
+
+El modelo zero-shot (BART MNLI) se carga una sola vez en un proceso servidor
+que escucha en un socket Unix local. Los workers de Flask solo abren una
+conexión al socket: arrancan en milisegundos y no cargan torch en memoria.
+
+El servidor agrupa los mensajes concurrentes en micro-lotes y ejecuta un único
+forward pass por lote. Mientras el modelo está frío (cargando o sin servidor),
+los clientes reciben None y el llamador usa las listas de palabras clave.
+
+Con INTENT_MODE=inprocess no hay servidor: el modelo se carga en el propio
+proceso. Pensado para gunicorn con preload_app (gunicorn.conf.py): el master
+lo carga una vez y los workers lo comparten copy-on-write tras el fork.
+
+Un lote cuesta un forward pass por mensaje y etiqueta candidata (6): BART
+large en CPU tarda del orden de segundos con lotes grandes, no milisegundos.
+INTENT_CLIENT_TIMEOUT tiene que cubrir el lote mayor (INTENT_MAX_BATCH) más
+la ventana; mídelo en el hardware de producción con
+benchmarks/bench_intent.py, que imprime el valor sugerido. Un timeout solo
+descarta esa respuesta (se usan las palabras clave): no cuenta como servidor
+caído ni activa INTENT_RECONNECT_DELAY.
+
+Uso:
+    python intent_engine.py          # Inicia el servidor (carga el modelo en segundo plano)
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import logging
+import threading
+import socketserver
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del motor ---
+INTENT_MODE = os.getenv("INTENT_MODE", "server")  # server | inprocess | off
+INTENT_SOCKET = os.getenv("INTENT_SOCKET", "/tmp/agent-intent.sock")
+INTENT_MODEL = os.getenv("INTENT_MODEL", "facebook/bart-large-mnli")
+INTENT_BATCH_WINDOW_MS = float(os.getenv("INTENT_BATCH_WINDOW_MS", "10"))
+INTENT_MAX_BATCH = int(os.getenv("INTENT_MAX_BATCH", "8"))
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "0.5"))
+# Lote de INTENT_MAX_BATCH x 6 etiquetas en CPU (ver benchmarks/bench_intent.py)
+INTENT_CLIENT_TIMEOUT = float(os.getenv("INTENT_CLIENT_TIMEOUT", "3"))
+# Tras un fallo de conexión, no reintentar durante este tiempo (segundos)
+INTENT_RECONNECT_DELAY = float(os.getenv("INTENT_RECONNECT_DELAY", "5"))
+
+# Intención interna -> etiqueta candidata para el modelo
+INTENT_LABELS = {
+    "appointment": "booking an appointment",
+    "pricing": "prices and plans",
+    "location": "location or address",
+    "hours": "opening hours",
+    "delivery": "delivery",
+    "help": "asking for help",
+}
+_LABEL_TO_INTENT = {label: intent for intent, label in INTENT_LABELS.items()}
+
+
+class BatchingClassifier:
+    """Clasificador zero-shot que agrupa peticiones concurrentes en un solo forward pass"""
+
+    def __init__(self, model=INTENT_MODEL, window_ms=INTENT_BATCH_WINDOW_MS,
+                 max_batch=INTENT_MAX_BATCH, min_score=INTENT_MIN_SCORE):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.min_score = min_score
+        self._pipeline = None
+        self._ready = threading.Event()
+        self._pending = queue.Queue()
+        self._loader = None
+        self._batcher = None
+        self._lock = threading.Lock()
+        # Los hilos no sobreviven al fork: el hijo reanuda el bucle de lotes
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def warm_up(self, background=True):
+        """
+        Cargar el modelo (en segundo plano por defecto) y arrancar el bucle de lotes.
+
+        Con el modelo ya cargado (precarga en el master) solo arranca el bucle
+        si aún no corre en este proceso: tras el fork ya lo arrancó _after_fork.
+        """
+        with self._lock:
+            if self._ready.is_set() or self._loader is not None:
+                return
+            if self._pipeline is not None:
+                self._start_batching()
+                return
+            self._loader = threading.Thread(target=self._load, name="intent-loader", daemon=True)
+            self._loader.start()
+        if not background:
+            self._loader.join()
+
+    def load(self):
+        """Cargar el modelo sin arrancar hilos (master de gunicorn antes del fork)"""
+        if self._pipeline is not None:
+            return
+        logger.info("🧠 Cargando modelo de intenciones %s...", self.model)
+        start = time.perf_counter()
+        # Import diferido: torch/transformers solo viven en este proceso
+        from transformers import pipeline
+        self._pipeline = pipeline("zero-shot-classification", model=self.model, device=-1)
+        logger.info("✅ Modelo de intenciones cargado en %.1fs", time.perf_counter() - start)
+
+    def _load(self):
+        self.load()
+        with self._lock:
+            self._start_batching()
+
+    def _start_batching(self):
+        """Un único bucle de lotes por proceso (llamar con self._lock)"""
+        if self._batcher is not None:
+            return
+        self._batcher = threading.Thread(target=self._batch_loop, name="intent-batcher", daemon=True)
+        self._batcher.start()
+        self._ready.set()
+
+    def _after_fork(self):
+        self._pending = queue.Queue()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._loader = None
+        self._batcher = None
+        if self._pipeline is not None:
+            with self._lock:
+                self._start_batching()
+
+    def classify(self, text, timeout=INTENT_CLIENT_TIMEOUT):
+        """(intención o None, respondió el modelo): (None, False) si está frío o tarda demasiado"""
+        if not self.ready:
+            return None, False
+        try:
+            return self.submit(text).result(timeout=timeout), True
+        except Exception:
+            return None, False
+
+    def submit(self, text):
+        """Encolar un texto; devuelve un Future con la intención (o None)"""
+        future = Future()
+        if not self.ready:
+            future.set_result(None)
+        else:
+            self._pending.put((text, future))
+        return future
+
+    def _batch_loop(self):
+        labels = list(INTENT_LABELS.values())
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                results = self._pipeline(texts, candidate_labels=labels)
+                if isinstance(results, dict):
+                    results = [results]
+                for (_, future), result in zip(batch, results):
+                    label, score = result["labels"][0], result["scores"][0]
+                    future.set_result(_LABEL_TO_INTENT[label] if score >= self.min_score else None)
+            except Exception as e:
+                logger.error("❌ Error clasificando lote de %s mensajes: %s", len(batch), e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+
+class _IntentRequestHandler(socketserver.StreamRequestHandler):
+    """Protocolo de líneas JSON: {"text": ...} -> {"intent": ..., "ready": ...}"""
+
+    def handle(self):
+        classifier = self.server.classifier
+        for line in self.rfile:
+            try:
+                text = json.loads(line).get("text", "")
+                intent = classifier.submit(text).result(timeout=self.server.request_timeout)
+            except Exception:
+                intent = None
+            reply = {"intent": intent, "ready": classifier.ready}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class IntentServer(socketserver.ThreadingUnixStreamServer):
+    """Servidor local (uno por host) que comparte el modelo entre todos los workers"""
+
+    daemon_threads = True
+    request_timeout = 5.0
+
+    def __init__(self, path=INTENT_SOCKET, classifier=None):
+        if os.path.exists(path):
+            os.unlink(path)  # Socket huérfano de una ejecución anterior
+        self.classifier = classifier or BatchingClassifier()
+        super().__init__(path, _IntentRequestHandler)
+        os.chmod(path, 0o660)
+
+
+class IntentClient:
+    """Cliente ligero del motor de intenciones (una conexión persistente por hilo)"""
+
+    def __init__(self, path=INTENT_SOCKET, timeout=INTENT_CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._retry_at = 0.0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def classify(self, text):
+        """(intención o None, respondió el modelo): (None, False) si está frío o no disponible"""
+        if time.monotonic() < self._retry_at:
+            return None, False
+        try:
+            sock, reader = self._connection()
+            sock.sendall(json.dumps({"text": text}).encode("utf-8") + b"\n")
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("servidor de intenciones cerró la conexión")
+            reply = json.loads(line)
+            return reply.get("intent"), bool(reply.get("ready"))
+        except socket.timeout:
+            # Lote lento, no servidor caído: se descarta la conexión (la respuesta llegaría tarde)
+            self._reset()
+            logger.debug("Motor de intenciones lento: respuesta descartada tras %.2fs", self.timeout)
+            return None, False
+        except (OSError, ValueError) as e:
+            self._reset()
+            self._retry_at = time.monotonic() + INTENT_RECONNECT_DELAY
+            logger.debug("Motor de intenciones no disponible: %s", e)
+            return None, False
+
+
+_client = None
+_client_lock = threading.Lock()
+_local_classifier = None
+
+
+def _reset_after_fork():
+    global _client, _client_lock
+    _client = None  # Las conexiones al socket no se comparten entre procesos
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """Cliente compartido del proceso (se crea bajo demanda)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = IntentClient()
+    return _client
+
+
+def get_local_classifier():
+    """Clasificador en el propio proceso (INTENT_MODE=inprocess)"""
+    global _local_classifier
+    if _local_classifier is None:
+        with _client_lock:
+            if _local_classifier is None:
+                _local_classifier = BatchingClassifier()
+    return _local_classifier
+
+
+def preload():
+    """Cargar el modelo en este proceso si el modo es inprocess (master antes del fork)"""
+    if INTENT_MODE == "inprocess":
+        get_local_classifier().load()
+
+
+def warm_up():
+    """Arrancar el bucle de lotes en este proceso (sin fork, _after_fork no lo arranca)"""
+    if INTENT_MODE == "inprocess":
+        get_local_classifier().warm_up()
+
+
+def ready():
+    """¿Hay modelo disponible? (siempre True si no se usa el modo en proceso)"""
+    return INTENT_MODE != "inprocess" or get_local_classifier().ready
+
+
+def detect_intent(text, fallback):
+    """
+    Intención del modelo compartido; si está frío, usar `fallback(text)` (palabras clave).
+
+    Devuelve (intención, definitiva). definitiva es False cuando el modelo no
+    respondió (frío, caído o lento) y la intención es solo la de palabras
+    clave: con el modelo disponible podría ser otra (no se debe cachear).
+    """
+    if INTENT_MODE == "inprocess":
+        classifier = get_local_classifier()
+        classifier.warm_up()  # No bloquea: mientras carga se usa el fallback
+        intent, answered = classifier.classify(text)
+    elif INTENT_MODE == "server":
+        intent, answered = get_client().classify(text)
+    else:
+        intent, answered = None, True  # Sin modelo: las palabras clave son la respuesta definitiva
+    return (intent if intent else fallback(text)), answered
+
+
+def main():
+    """Arrancar el servidor de intenciones del host"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = IntentServer()
+    server.classifier.warm_up()
+    logger.info("🚀 Motor de intenciones escuchando en %s", INTENT_SOCKET)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(INTENT_SOCKET):
+            os.unlink(INTENT_SOCKET)
+
+
+if __name__ == "__main__":
+    main()
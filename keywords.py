@@ -0,0 +1,106 @@
+"""
+Detección de intenciones por palabras clave, compilada una sola vez.
+
+La tabla declarativa INTENT_KEYWORDS ({intención: {idioma: [palabras]}}) se
+compila en una única expresión regular con alternancia. Un solo recorrido del
+mensaje devuelve todas las intenciones encontradas.
+
+Las palabras clave coinciden al inicio de palabra ("precio" encuentra
+"precios" pero no "aprecio"), igual que las búsquedas por subcadena que
+reemplaza, sin sus falsos positivos a mitad de palabra.
+"""
+
+import re
+
+# --- Palabras clave por intención e idioma (orden = prioridad) ---
+INTENT_KEYWORDS = {
+    "appointment": {
+        "es": ["cita", "citas", "reservar", "agendar"],
+        "en": ["appointment", "book", "booking", "schedule", "reserve"],
+        "fr": ["rendez-vous", "rendezvous", "réserver", "prendre"],
+        "de": ["termin", "terminen", "vereinbaren", "buchen", "buche"],
+        "it": ["appuntamento", "prenotare", "fissare"],
+        "pt": ["consulta", "agendar", "marcar"],
+    },
+    "pricing": {
+        "es": ["precio"],
+        "en": ["price"],
+        "fr": ["prix"],
+        "de": ["preis", "preise"],
+        "pt": ["preço"],
+    },
+    "location": {
+        "es": ["ubicación", "sitio", "lugar"],
+        "en": ["location"],
+        "de": ["standort"],
+        "it": ["posizione"],
+        "pt": ["localização"],
+    },
+    "hours": {
+        "es": ["horario"],
+        "en": ["hours"],
+        "fr": ["heures"],
+        "de": ["stunden"],
+        "it": ["orari"],
+        "pt": ["horário"],
+    },
+    "delivery": {
+        "es": ["entrega"],
+        "en": ["delivery"],
+        "fr": ["livraison"],
+        "de": ["lieferung"],
+        "it": ["consegna"],
+        "pt": ["entrega"],
+    },
+    "help": {
+        "es": ["ayuda"],
+        "en": ["help"],
+        "fr": ["aide"],
+        "de": ["hilfe"],
+        "it": ["aiuto"],
+        "pt": ["ajuda"],
+    },
+}
+
+
+class KeywordMatcher:
+    """Matcher multilingüe precompilado: una pasada por mensaje"""
+
+    def __init__(self, table):
+        self.priority = list(table)
+        keyword_intents = {}
+        for intent, by_lang in table.items():
+            for words in by_lang.values():
+                for word in words:
+                    keyword_intents.setdefault(word.lower(), set()).add(intent)
+
+        # La alternancia prefiere la palabra más larga en cada posición; si una
+        # palabra más corta es prefijo de ella, sus intenciones también cuentan.
+        self._intents = {}
+        for word in keyword_intents:
+            intents = set()
+            for other, other_intents in keyword_intents.items():
+                if word.startswith(other):
+                    intents |= other_intents
+            self._intents[word] = frozenset(intents)
+
+        alternation = "|".join(re.escape(word) for word in sorted(self._intents, key=len, reverse=True))
+        self._pattern = re.compile(r"\b(?:" + alternation + ")")
+
+    def match(self, text):
+        """Todas las intenciones presentes en el texto"""
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._intents[match.group()]
+        return found
+
+    def first(self, text):
+        """Intención de mayor prioridad presente en el texto, o None"""
+        found = self.match(text)
+        for intent in self.priority:
+            if intent in found:
+                return intent
+        return None
+
+
+INTENT_MATCHER = KeywordMatcher(INTENT_KEYWORDS)
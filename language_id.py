@@ -0,0 +1,207 @@
+"""
+Identificación de idioma barata y determinista para los mensajes entrantes.
+
+- Modelo de n-gramas de caracteres (1 a 3) por idioma, entrenado una sola vez
+  (al primer uso) con un corpus semilla embebido. Clasificador Naive Bayes.
+- Idioma "pegajoso" por conversación: el llamador pasa el último idioma de la
+  sesión y se mantiene salvo que el mensaje indique otro con claridad.
+- Mensajes muy cortos o sin letras ("ok", "3pm", un email) no se analizan:
+  se usa el idioma pegajoso, el de un saludo o palabra corta conocida ("hi",
+  "hola", "merci"...) o el idioma por defecto. Con default=None el resultado
+  es None cuando nada lo determina (el llamador no lo guarda como pegajoso).
+"""
+
+import os
+import re
+import math
+import threading
+from collections import Counter
+
+LANGID_MIN_LETTERS = int(os.getenv("LANGID_MIN_LETTERS", "6"))
+# Diferencia mínima de log-probabilidad por n-grama para abandonar el idioma pegajoso
+LANGID_SWITCH_MARGIN = float(os.getenv("LANGID_SWITCH_MARGIN", "0.15"))
+
+SUPPORTED_LANGUAGES = ("es", "en", "fr", "de", "it", "pt")
+
+# Corpus semilla: frases típicas de clientes en cada idioma
+SEED_CORPUS = {
+    "es": """
+        hola buenos días quiero agendar una cita para mañana por la tarde
+        me gustaría reservar una cita cuál es el precio de sus servicios
+        dónde están ubicados y cuál es su horario de atención
+        mi nombre es juan y mi correo es este, gracias por la ayuda
+        necesito ayuda con mi pedido, hacen entregas a domicilio
+        puedo ir hoy a las cuatro de la tarde o el viernes por la mañana
+        cuánto cuesta el plan mensual y qué incluye
+        perfecto, muchas gracias, nos vemos pronto
+        quisiera saber si tienen disponibilidad esta semana
+        está bien, prefiero el lunes a las diez
+    """,
+    "en": """
+        hello good morning i would like to book an appointment for tomorrow afternoon
+        can i schedule a meeting what is the price of your services
+        where are you located and what are your opening hours
+        my name is john and my email is this one, thanks for the help
+        i need help with my order, do you deliver to my address
+        i can come today at four in the afternoon or on friday morning
+        how much does the monthly plan cost and what does it include
+        perfect, thank you very much, see you soon
+        i would like to know if you have availability this week
+        that works, i prefer monday at ten
+    """,
+    "fr": """
+        bonjour je voudrais prendre un rendez-vous pour demain après-midi
+        est-ce que je peux réserver quel est le prix de vos services
+        où êtes-vous situés et quels sont vos horaires d'ouverture
+        je m'appelle jean et voici mon adresse email, merci pour votre aide
+        j'ai besoin d'aide avec ma commande, est-ce que vous livrez
+        je peux venir aujourd'hui à seize heures ou vendredi matin
+        combien coûte la formule mensuelle et qu'est-ce qu'elle comprend
+        parfait, merci beaucoup, à bientôt
+        je voudrais savoir si vous avez des disponibilités cette semaine
+        d'accord, je préfère lundi à dix heures
+    """,
+    "de": """
+        hallo guten morgen ich möchte einen termin für morgen nachmittag vereinbaren
+        kann ich einen termin buchen was kosten ihre leistungen
+        wo befinden sie sich und wie sind ihre öffnungszeiten
+        mein name ist johann und das ist meine e-mail, danke für die hilfe
+        ich brauche hilfe mit meiner bestellung, liefern sie auch
+        ich kann heute um sechzehn uhr oder am freitag vormittag kommen
+        wie viel kostet der monatliche plan und was ist enthalten
+        perfekt, vielen dank, bis bald
+        ich möchte wissen ob sie diese woche noch einen termin frei haben
+        gut, ich nehme lieber montag um zehn uhr
+    """,
+    "it": """
+        ciao buongiorno vorrei prenotare un appuntamento per domani pomeriggio
+        posso fissare un appuntamento qual è il prezzo dei vostri servizi
+        dove vi trovate e quali sono i vostri orari di apertura
+        mi chiamo giovanni e questa è la mia email, grazie per l'aiuto
+        ho bisogno di aiuto con il mio ordine, fate consegne a domicilio
+        posso venire oggi alle sedici oppure venerdì mattina
+        quanto costa il piano mensile e cosa include
+        perfetto, grazie mille, a presto
+        vorrei sapere se avete disponibilità questa settimana
+        va bene, preferisco lunedì alle dieci
+    """,
+    "pt": """
+        olá bom dia quero marcar uma consulta para amanhã à tarde
+        gostaria de agendar um horário qual é o preço dos seus serviços
+        onde vocês estão localizados e qual é o horário de funcionamento
+        meu nome é joão e meu email é este, obrigado pela ajuda
+        preciso de ajuda com meu pedido, vocês fazem entregas em casa
+        posso ir hoje às quatro da tarde ou na sexta de manhã
+        quanto custa o plano mensal e o que está incluído
+        perfeito, muito obrigado, até logo
+        gostaria de saber se vocês têm disponibilidade esta semana
+        tudo bem, prefiro segunda às dez
+    """,
+}
+
+# Palabras cortas inequívocas (saludos, agradecimientos) para mensajes sin n-gramas suficientes
+SHORT_WORDS = {
+    "hi": "en", "hello": "en", "hey": "en", "thanks": "en", "thx": "en", "yes": "en",
+    "hola": "es", "gracias": "es", "buenas": "es", "sí": "es",
+    "bonjour": "fr", "salut": "fr", "merci": "fr", "oui": "fr",
+    "hallo": "de", "danke": "de", "ja": "de",
+    "ciao": "it", "grazie": "it",
+    "olá": "pt", "oi": "pt", "obrigado": "pt", "obrigada": "pt",
+}
+
+_NON_LETTERS = re.compile(r"[^\w'\s-]|\d|_")
+_SPACES = re.compile(r"\s+")
+_EMAILS = re.compile(r"\S+@\S+")
+
+
+def _clean(text):
+    text = _EMAILS.sub(" ", text.lower())
+    text = _NON_LETTERS.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _ngrams(text):
+    """N-gramas de caracteres (1-3) de cada palabra con bordes marcados"""
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        for n in (1, 2, 3):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class LanguageIdentifier:
+    """Clasificador Naive Bayes de n-gramas de caracteres con idioma pegajoso"""
+
+    def __init__(self, corpus=SEED_CORPUS, min_letters=LANGID_MIN_LETTERS,
+                 switch_margin=LANGID_SWITCH_MARGIN):
+        self.min_letters = min_letters
+        self.switch_margin = switch_margin
+        self.languages = tuple(corpus)
+        vocabulary = set()
+        counts = {}
+        for lang, text in corpus.items():
+            counts[lang] = Counter(_ngrams(_clean(text)))
+            vocabulary.update(counts[lang])
+
+        # log P(n-grama | idioma) con suavizado de Laplace
+        self._log_probs = {}
+        self._unseen = {}
+        for lang, counter in counts.items():
+            total = sum(counter.values()) + len(vocabulary) + 1
+            self._log_probs[lang] = {gram: math.log((c + 1) / total) for gram, c in counter.items()}
+            self._unseen[lang] = math.log(1 / total)
+
+    def scores(self, text):
+        """Log-probabilidad media por n-grama para cada idioma"""
+        grams = _ngrams(_clean(text))
+        if not grams:
+            return {}
+        result = {}
+        for lang in self.languages:
+            table, unseen = self._log_probs[lang], self._unseen[lang]
+            result[lang] = sum(table.get(gram, unseen) for gram in grams) / len(grams)
+        return result
+
+    @staticmethod
+    def short_word_language(text):
+        """Idioma de un saludo o palabra corta conocida ("Hi!" -> 'en'), o None"""
+        for word in _clean(text).split():
+            lang = SHORT_WORDS.get(word)
+            if lang:
+                return lang
+        return None
+
+    def detect(self, text, sticky=None, default="en"):
+        """Idioma del mensaje; respeta `sticky` en mensajes cortos o ambiguos"""
+        fallback = sticky or default
+        letters = sum(1 for ch in text if ch.isalpha())
+        if letters < self.min_letters:
+            return sticky or self.short_word_language(text) or default
+
+        scores = self.scores(text)
+        if not scores:
+            return fallback
+        best = max(scores, key=scores.get)
+        if sticky in scores and best != sticky and scores[best] - scores[sticky] < self.switch_margin:
+            return sticky
+        return best
+
+
+_identifier = None
+_identifier_lock = threading.Lock()
+
+
+def get_identifier():
+    """Identificador compartido del proceso (se entrena una sola vez)"""
+    global _identifier
+    if _identifier is None:
+        with _identifier_lock:
+            if _identifier is None:
+                _identifier = LanguageIdentifier()
+    return _identifier
+
+
+def identify_language(text, sticky=None, default="en"):
+    """Atajo para get_identifier().detect(...)"""
+    return get_identifier().detect(text, sticky=sticky, default=default)
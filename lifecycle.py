@@ -0,0 +1,56 @@
+"""
+Arranque de los hilos de fondo solo en los procesos que sirven peticiones.
+
+Con gunicorn y preload_app el master importa la aplicación. Los servicios que
+se arrancan al importar (despachadores, cola de reservas, cola saliente,
+eventos de Cal.com, índice de huecos) correrían también en el master, que no
+atiende peticiones pero sí reclamaría reservas del diario, llamaría a Cal.com
+y enviaría mensajes, todo en paralelo con los workers.
+
+gunicorn.conf.py llama a defer() antes de precargar: desde ese momento
+start_background(servicio) solo lo apunta, y el hook post_fork de cada worker
+llama a start_deferred(). Fuera de gunicorn (python app.py, uvicorn)
+start_background() arranca al momento, como el .start() de siempre.
+
+Uso:
+    DISPATCHER = start_background(Dispatcher())
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_deferred = False
+_pending = []  # Servicios (con .start()) apuntados en el master
+_lock = threading.Lock()
+
+
+def defer():
+    """En el master de gunicorn, antes de importar la aplicación"""
+    global _deferred
+    with _lock:
+        _deferred = True
+
+
+def start_background(service):
+    """service.start() ahora, o en cada worker si este proceso es el master; devuelve el servicio"""
+    with _lock:
+        if _deferred:
+            _pending.append(service)
+            return service
+    return service.start()
+
+
+def start_deferred():
+    """En cada worker tras el fork: arrancar lo apuntado y dejar de diferir"""
+    global _deferred
+    with _lock:
+        _deferred = False
+        pending = list(_pending)
+        _pending.clear()
+    for service in pending:
+        service.start()
+    if pending:
+        logger.debug("🧵 %s servicios de fondo arrancados en el worker", len(pending))
+
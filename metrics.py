@@ -0,0 +1,268 @@
+"""
+Métricas del camino crítico en formato de texto de Prometheus.
+
+- Contadores e histogramas con etiquetas, en memoria y thread-safe.
+- Gauges calculados al momento del scrape (sesiones activas, cola saliente...).
+- span("etapa") / timed("etapa"): miden la duración de cada etapa del mensaje
+  (idioma, intención, extracción, fecha, Cal.com, Twilio) en el histograma
+  stage_duration_seconds.
+- Profiler por muestreo opcional: un hilo toma la pila de todos los hilos cada
+  PROFILER_INTERVAL segundos. Se activa y desactiva en caliente con SIGUSR2 (o
+  profiler.start()/stop()); al parar escribe las pilas agregadas en
+  PROFILER_OUTPUT (formato "collapsed", válido para flamegraph.pl/speedscope).
+  Con gunicorn la señal va al pid de un worker (gunicorn.conf.py la reinstala
+  en post_worker_init); en el master SIGUSR2 es la actualización en caliente.
+
+Uso:
+    with metrics.span("extraction"):
+        ...
+    metrics.inc("bookings_total", result="success")
+    metrics.render()   # cuerpo de GET /metrics
+"""
+
+import os
+import sys
+import time
+import signal
+import inspect
+import logging
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))
+PROFILER_OUTPUT = os.getenv("PROFILER_OUTPUT", "profile.collapsed")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "stage_duration_seconds": "Duración de cada etapa del procesamiento de un mensaje",
+    "bookings_total": "Reservas en Cal.com por resultado",
+    "upstream_responses_total": "Respuestas de Cal.com/Twilio por host y código de estado",
+    "active_sessions": "Conversaciones en el almacén de sesiones",
+    "outbound_queue_depth": "Mensajes pendientes en la cola saliente",
+    "webhook_duplicates_total": "Entregas repetidas de webhooks contestadas desde el índice de idempotencia",
+    "webhook_signatures_total": "Firmas de webhooks verificadas por origen y resultado",
+    "booking_jobs_total": "Trabajos de la cola de reservas por resultado",
+    "booking_queue_depth": "Reservas pendientes o en curso en el diario",
+    "booking_circuit_state": "Circuit breaker de Cal.com (0 cerrado, 1 semiabierto, 2 abierto)",
+    "cal_events_total": "Eventos de booking de Cal.com por tipo y si se encontró la conversación",
+    "cal_event_queue_depth": "Eventos de Cal.com pendientes en la cola acotada",
+    "faq_cache_total": "Consultas a la caché de FAQ (hit, miss, pass = no es FAQ, in_flow = reserva en curso)",
+    "faq_cache_hit_ratio": "Fracción de mensajes respondidos como FAQ desde la caché",
+    "faq_cache_saved_seconds": "Latencia ahorrada estimada por las FAQ servidas sin sesión",
+    "dispatch_timeouts_total": "Mensajes respondidos con un ack porque su buzón no terminó a tiempo",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Histogram:
+    """Buckets acumulados de una serie (suma y cuenta incluidas)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Registry:
+    """Contadores, histogramas y gauges del proceso"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}    # nombre -> {etiquetas: valor}
+        self._histograms = {}  # nombre -> {etiquetas: _Histogram}
+        self._gauges = {}      # nombre -> {etiquetas: función sin argumentos}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def gauge(self, name, fn, **labels):
+        """Registrar un gauge que se evalúa en cada scrape"""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = fn
+
+    def render(self):
+        """Exposición en formato de texto de Prometheus"""
+        lines = []
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', repr(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, fn in sorted(series.items()):
+                try:
+                    value = fn()
+                except Exception as e:
+                    logger.warning("⚠️ Gauge %s falló: %s", name, e)
+                    continue
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Muestreo periódico de las pilas de todos los hilos (coste nulo si está parado)"""
+
+    def __init__(self, interval=PROFILER_INTERVAL, output=PROFILER_OUTPUT):
+        self.interval = interval
+        self.output = output
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("🔬 Profiler iniciado (cada %.0f ms)", self.interval * 1000)
+
+    def stop(self):
+        """Parar y volcar las pilas agregadas; devuelve la ruta del archivo"""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with open(self.output, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("🔬 Profiler detenido: %s muestras en %s", sum(self.stacks.values()), self.output)
+        return self.output
+
+    def toggle(self, *_):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+
+registry = Registry()
+profiler = SamplingProfiler()
+
+inc = registry.inc
+observe = registry.observe
+gauge = registry.gauge
+render = registry.render
+
+
+@contextmanager
+def span(stage):
+    """Medir la duración de una etapa en stage_duration_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+
+def timed(stage):
+    """Decorador equivalente a span() (también para funciones async)"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def install_profiler_signal(signum=getattr(signal, "SIGUSR2", None)):
+    """Activar/desactivar el profiler con una señal (solo desde el hilo principal)"""
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, profiler.toggle)
+    return True
@@ -0,0 +1,250 @@
+"""
+Cola asíncrona de mensajes salientes de WhatsApp.
+
+El webhook solo encola la respuesta y devuelve 200 de inmediato; un pool de
+workers la envía a Twilio en segundo plano:
+
+- Agrupa los mensajes pendientes de un mismo destino en un solo envío
+  (hasta el límite de caracteres de WhatsApp), respetando su orden.
+- Limita el ritmo a los mensajes por segundo de la cuenta (token bucket). El
+  límite es de la cuenta y cada worker de gunicorn/uvicorn tiene su cola:
+  cada proceso usa TWILIO_MPS / WEB_CONCURRENCY.
+- Solo reintenta (con backoff) lo que Twilio no aceptó de forma transitoria
+  (RETRY: no llegó, 429, 5xx). Un rechazo (REJECTED, 4xx) va directo al
+  archivo dead-letter (JSON lines); un envío sin respuesta (UNKNOWN: timeout
+  de lectura) tampoco se reintenta, porque Twilio pudo aceptarlo, y se anota
+  en dead-letter para revisarlo. Agotados los reintentos, también dead-letter.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la cola ---
+TWILIO_MPS = float(os.getenv("TWILIO_MPS", "1"))
+# Procesos que envían con la misma cuenta (workers de gunicorn/uvicorn; ambos leen WEB_CONCURRENCY)
+OUTBOUND_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "4"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+OUTBOUND_RETRY_DELAY = float(os.getenv("OUTBOUND_RETRY_DELAY", "2"))
+OUTBOUND_DEAD_LETTER_PATH = os.getenv("OUTBOUND_DEAD_LETTER_PATH", "outbound_dead_letter.jsonl")
+WHATSAPP_MAX_CHARS = 1600
+LATENCY_SAMPLES = 500
+
+# Resultado de un envío (lo devuelve el callable `send`)
+SENT = "sent"
+RETRY = "retry"  # No aceptado, sin riesgo de duplicar: se reintenta
+REJECTED = "rejected"  # Rechazo definitivo (4xx)
+UNKNOWN = "unknown"  # Sin respuesta tras enviarlo: pudo llegar, no se reenvía
+
+
+class TokenBucket:
+    """Limitador de ritmo: `rate` tokens por segundo con ráfaga de `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Esperar hasta disponer de un token"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+
+class OutboundQueue:
+    """Cola de envío con pool de workers, agrupación por destino, reintentos y dead-letter"""
+
+    def __init__(self, send, workers=OUTBOUND_WORKERS, rate=TWILIO_MPS / OUTBOUND_PROCESSES,
+                 max_retries=OUTBOUND_MAX_RETRIES, retry_delay=OUTBOUND_RETRY_DELAY,
+                 dead_letter_path=OUTBOUND_DEAD_LETTER_PATH):
+        self._send = send  # Callable(to, body, sender) -> SENT | RETRY | REJECTED | UNKNOWN
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        self._bucket = TokenBucket(rate)
+
+        # (destino, emisor) -> deque de [body, encolado_en, intentos]
+        self._pending = OrderedDict()
+        self._not_before = {}
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._dead_letter_lock = threading.Lock()
+        self._threads = []
+
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.unknown = 0
+        self.dead_lettered = 0
+        self._queue_wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._send_ms = deque(maxlen=LATENCY_SAMPLES)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Arrancar los workers (idempotente)"""
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _after_fork(self):
+        """Los hilos no sobreviven al fork: el hijo arranca sus propios workers"""
+        started = bool(self._threads)
+        self._pending = OrderedDict()
+        self._not_before = {}
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._dead_letter_lock = threading.Lock()
+        self._threads = []
+        if started:
+            self.start()
+
+    def alive(self):
+        """¿Están vivos todos los workers? (para /ready)"""
+        return bool(self._threads) and all(thread.is_alive() for thread in self._threads)
+
+    def enqueue(self, to, body, sender=None):
+        """Encolar un mensaje (desde `sender`, o el número por defecto); no bloquea"""
+        with self._cond:
+            self._pending.setdefault((to, sender), deque()).append([body, time.monotonic(), 0])
+            self.enqueued += 1
+            self._cond.notify()
+
+    def depth(self):
+        with self._cond:
+            return sum(len(messages) for messages in self._pending.values())
+
+    def _next_batch(self):
+        """Tomar el siguiente destino libre y sus mensajes agrupados (bajo self._cond)"""
+        while True:
+            now = time.monotonic()
+            wait = None
+            for to, messages in self._pending.items():
+                if to in self._in_flight:
+                    continue
+                not_before = self._not_before.get(to, 0)
+                if not_before > now:
+                    wait = not_before - now if wait is None else min(wait, not_before - now)
+                    continue
+
+                batch = [messages.popleft()]
+                size = len(batch[0][0])
+                while messages and size + 2 + len(messages[0][0]) <= WHATSAPP_MAX_CHARS:
+                    size += 2 + len(messages[0][0])
+                    batch.append(messages.popleft())
+                if not messages:
+                    del self._pending[to]
+                self._in_flight.add(to)
+                return to, batch
+            self._cond.wait(timeout=wait)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                to, batch = self._next_batch()
+
+            body = "\n\n".join(item[0] for item in batch)
+            self._bucket.acquire()
+            start = time.monotonic()
+            try:
+                outcome = self._send(to[0], body, to[1])
+            except Exception as e:
+                logger.error("❌ Error enviando a %s: %s", to[0], e, extra={"phone": to[0]})
+                outcome = UNKNOWN  # No se sabe si llegó a enviarse
+            elapsed_ms = (time.monotonic() - start) * 1000
+
+            with self._cond:
+                self._in_flight.discard(to)
+                if outcome == SENT:
+                    self.sent += len(batch)
+                    self._send_ms.append(elapsed_ms)
+                    self._queue_wait_ms.extend((start - item[1]) * 1000 for item in batch)
+                    self._not_before.pop(to, None)
+                elif outcome == RETRY:
+                    self.failed += 1
+                    self._retry_or_dead_letter(to, batch)
+                else:
+                    # Rechazado o sin confirmar: reenviarlo no sirve o podría duplicarlo
+                    if outcome == REJECTED:
+                        self.rejected += 1
+                    else:
+                        self.unknown += 1
+                    for item in batch:
+                        item[2] += 1
+                        self._dead_letter(to, item, outcome)
+                self._cond.notify_all()
+
+    def _retry_or_dead_letter(self, to, batch):
+        """Reencolar al frente del destino con backoff, o mandar a dead-letter (bajo self._cond)"""
+        retry = []
+        for item in batch:
+            item[2] += 1
+            if item[2] > self.max_retries:
+                self._dead_letter(to, item, "max_retries")
+            else:
+                retry.append(item)
+        if retry:
+            messages = self._pending.setdefault(to, deque())
+            messages.extendleft(reversed(retry))
+            attempts = max(item[2] for item in retry)
+            self._not_before[to] = time.monotonic() + self.retry_delay * (2 ** (attempts - 1))
+            logger.warning("⚠️ Reintentando envío a %s (intento %s/%s)", to[0], attempts, self.max_retries,
+                           extra={"phone": to[0]})
+
+    def _dead_letter(self, to, item, reason):
+        self.dead_lettered += 1
+        logger.error("💀 Mensaje a %s enviado a dead-letter (%s, %s intentos)", to[0], reason, item[2],
+                     extra={"phone": to[0]})
+        record = {'to': to[0], 'from': to[1], 'body': item[0], 'reason': reason, 'attempts': item[2],
+                  'failed_at': time.time()}
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error("❌ No se pudo escribir dead-letter: %s", e, extra={"phone": to[0]})
+
+    def stats(self):
+        """Profundidad de la cola y latencias para /health"""
+        with self._cond:
+            return {
+                'depth': sum(len(messages) for messages in self._pending.values()),
+                'in_flight': len(self._in_flight),
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'failed_attempts': self.failed,
+                'rejected': self.rejected,
+                'unknown': self.unknown,
+                'dead_lettered': self.dead_lettered,
+                'queue_wait_ms_p50': _percentile(self._queue_wait_ms, 0.50),
+                'queue_wait_ms_p95': _percentile(self._queue_wait_ms, 0.95),
+                'send_ms_p50': _percentile(self._send_ms, 0.50),
+                'send_ms_p95': _percentile(self._send_ms, 0.95),
+            }
@@ -0,0 +1,183 @@
+"""
+Catálogo de respuestas compilado una sola vez al arrancar.
+
+Los textos viven en locales/<idioma>.json, una sección por aplicación
+("conversation" para app.py, "agent" para webhook.py). Añadir un idioma es
+añadir un archivo; las claves que falten se toman del idioma por defecto.
+La sección "dates" (días, meses y plantilla "datetime") la usa
+format_datetime() para mostrar fechas en el idioma del mensaje.
+
+- Mensajes estáticos: str internados, con su TwiML pre-renderizado (bytes) y
+  cacheado en el primer uso.
+- Mensajes con parámetros: plantillas precompiladas (el str.format ligado).
+- Mensajes compuestos (varias claves unidas por "\\n\\n"): se componen una
+  vez por combinación y quedan como estático o como una única plantilla.
+
+Uso:
+    CATALOG = ResponseCatalog("conversation", default_lang="en")
+    messages = CATALOG.get(lang)
+    messages["ask_name"]                                 # estático
+    messages.render("appointment_confirmed", date=..., time=...)
+    messages.join(("greeting", "booking_link"), url=...)
+    CATALOG.twiml(text)                                   # bytes de TwiML
+    format_datetime(start, messages.lang)                 # "martes 3 de noviembre de 2026 a las 09:00"
+"""
+
+import os
+import sys
+import json
+import string
+import threading
+from functools import lru_cache
+
+LOCALES_DIR = os.getenv("LOCALES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales"))
+
+DATES_FALLBACK_LANG = "en"  # Idioma sin sección "dates"
+
+_FORMATTER = string.Formatter()
+
+
+@lru_cache(maxsize=None)
+def load_locales(path=LOCALES_DIR):
+    """{idioma: {sección: {clave: texto}}} de todos los archivos (se leen una vez)"""
+    locales = {}
+    for filename in sorted(os.listdir(path)):
+        lang, ext = os.path.splitext(filename)
+        if ext == ".json":
+            with open(os.path.join(path, filename), encoding="utf-8") as f:
+                locales[lang] = json.load(f)
+    return locales
+
+
+@lru_cache(maxsize=None)
+def _date_format(lang, path=LOCALES_DIR):
+    locales = load_locales(path)
+    return (locales.get(lang) or {}).get("dates") or locales[DATES_FALLBACK_LANG]["dates"]
+
+
+def format_datetime(dt, lang, path=LOCALES_DIR):
+    """Fecha y hora (ya en la zona del cliente) con los nombres y el formato del idioma"""
+    dates = _date_format(lang, path)
+    return dates["datetime"].format(
+        weekday=dates["weekdays"][dt.weekday()], month=dates["months"][dt.month - 1],
+        day=dt.day, year=dt.year, hour=dt.hour, minute=dt.minute,
+        hour12=dt.hour % 12 or 12, ampm="AM" if dt.hour < 12 else "PM",
+    )
+
+
+def _has_fields(text):
+    return any(field is not None for _, field, _, _ in _FORMATTER.parse(text))
+
+
+class Template:
+    """Plantilla precompilada: render(**valores)"""
+
+    __slots__ = ("text", "render")
+
+    def __init__(self, text):
+        self.text = text
+        self.render = text.format
+
+
+class Messages:
+    """Mensajes de un idioma"""
+
+    def __init__(self, lang, texts):
+        self.lang = lang
+        self._static = {}
+        self._templates = {}
+        for key, text in texts.items():
+            if _has_fields(text):
+                self._templates[key] = Template(text)
+            else:
+                self._static[key] = sys.intern(text)
+        self._joined = {}
+
+    def __getitem__(self, key):
+        """Texto de un mensaje estático"""
+        return self._static[key]
+
+    def __contains__(self, key):
+        return key in self._static or key in self._templates
+
+    def render(self, key, **values):
+        """Texto de un mensaje (con parámetros si es plantilla)"""
+        template = self._templates.get(key)
+        if template is None:
+            return self._static[key]
+        return template.render(**values)
+
+    def join(self, keys, separator="\n\n", **values):
+        """Varios mensajes unidos por `separator`, compuestos una sola vez"""
+        compiled = self._joined.get((keys, separator))
+        if compiled is None:
+            compiled = self._joined[(keys, separator)] = self._compose(keys, separator)
+        return compiled if isinstance(compiled, str) else compiled.render(**values)
+
+    def _compose(self, keys, separator):
+        parts = []
+        dynamic = False
+        for key in keys:
+            if key in self._templates:
+                parts.append(self._templates[key].text)
+                dynamic = True
+            else:
+                parts.append(self._static[key])
+        if not dynamic:
+            return sys.intern(separator.join(parts))
+        # Escapar las llaves de las partes estáticas antes de unirlas en una plantilla
+        escaped = [part if key in self._templates else part.replace("{", "{{").replace("}", "}}")
+                   for key, part in zip(keys, parts)]
+        return Template(separator.join(escaped))
+
+    def static_texts(self):
+        return self._static.values()
+
+
+class ResponseCatalog:
+    """Mensajes de una sección en todos los idiomas, con TwiML cacheado"""
+
+    def __init__(self, section, default_lang, path=LOCALES_DIR, overrides=None):
+        locales = {lang: data[section] for lang, data in load_locales(path).items() if section in data}
+        defaults = locales[default_lang]
+        # Textos propios de un negocio ({idioma: {clave: texto}}, ver tenants.py): los
+        # del idioma por defecto sustituyen al texto por defecto, así que solo llegan a
+        # otro idioma en las claves que ese idioma no traduce (nunca pisan su traducción)
+        overrides = overrides or {}
+        common = overrides.get(default_lang, {})
+        self.default_lang = default_lang
+        self._messages = {
+            lang: Messages(lang, {**defaults, **common, **texts, **overrides.get(lang, {})})
+            for lang, texts in locales.items()
+        }
+        self.default = self._messages[default_lang]
+        self._static = {text for messages in self._messages.values() for text in messages.static_texts()}
+        self._twiml = {}
+        self._twiml_lock = threading.Lock()
+
+    @property
+    def languages(self):
+        return tuple(self._messages)
+
+    def get(self, lang):
+        """Mensajes de un idioma (o los del idioma por defecto)"""
+        return self._messages.get(lang, self.default)
+
+    def twiml(self, text=None):
+        """TwiML (bytes) con `text` como mensaje; cacheado si el texto es estático"""
+        if text is not None and text not in self._static:
+            return _render_twiml(text)
+        cached = self._twiml.get(text)
+        if cached is None:
+            with self._twiml_lock:
+                cached = self._twiml.setdefault(text, _render_twiml(text))
+        return cached
+
+
+def _render_twiml(text):
+    from twilio.twiml.messaging_response import MessagingResponse
+
+    resp = MessagingResponse()
+    if text is not None:
+        resp.message(text)
+    return str(resp).encode("utf-8")
@@ -0,0 +1,420 @@
+"""
+Almacén de estado de conversación (sesiones por número de teléfono).
+
+Backends intercambiables detrás de la misma interfaz:
+
+- MemorySessionStore: LRU + TTL en memoria (proceso único, memoria acotada).
+- SQLiteSessionStore: archivo SQLite en modo WAL, sobrevive a reinicios y se
+  comparte entre workers; bloqueo por teléfono con leases en una tabla.
+- RedisSessionStore: cualquier servidor compatible con Redis; bloqueo por
+  teléfono con SET NX PX. Acepta un cliente inyectado (p. ej. el cliente en
+  memoria de benchmarks/fake_redis.py, que usa benchmarks/check_session_store.py).
+
+Uso típico (lectura-modificación-escritura atómica por teléfono):
+
+    with store.session(phone, factory) as data:
+        data['name'] = ...
+
+Los backends también guardan las claves de idempotencia de los webhooks
+(claim_key / complete_key / release_key / key_result, ver dedup.py): con
+SQLite o Redis un reintento de Twilio que cae en otro worker se detecta.
+"""
+
+import os
+import abc
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:  # Dependencia opcional, solo para SESSION_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite | redis
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+SESSION_LOCK_LEASE = float(os.getenv("SESSION_LOCK_LEASE", "30"))
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "10"))
+
+
+class SessionLockTimeout(Exception):
+    """No se pudo obtener el bloqueo de la sesión a tiempo"""
+
+
+class _KeyedLocks:
+    """Un lock por clave dentro del proceso (se liberan cuando nadie los usa)"""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+class SessionStore(abc.ABC):
+    """Interfaz común de los backends"""
+
+    shared = False  # ¿Lo ven todos los workers? (MemorySessionStore es por proceso)
+
+    def __init__(self):
+        self._local_locks = _KeyedLocks()
+
+    @abc.abstractmethod
+    def load(self, phone):
+        """Sesión guardada del teléfono, o None"""
+
+    @abc.abstractmethod
+    def save(self, phone, data):
+        """Guardar la sesión (serializable a JSON) renovando su TTL"""
+
+    @abc.abstractmethod
+    def delete(self, phone):
+        """Borrar la sesión"""
+
+    @abc.abstractmethod
+    def count(self):
+        """Sesiones vivas (gauge active_sessions: se evalúa en cada scrape, debe ser barato)"""
+
+    @abc.abstractmethod
+    def claim_key(self, key, ttl):
+        """Registrar una clave de idempotencia si no existe (o caducó); True si esta llamada la registró"""
+
+    @abc.abstractmethod
+    def complete_key(self, key, response, ttl):
+        """Guardar la respuesta (serializable a JSON) de la entrega que registró la clave"""
+
+    @abc.abstractmethod
+    def release_key(self, key):
+        """Olvidar la clave (el procesamiento falló: un reintento vuelve a procesarse)"""
+
+    @abc.abstractmethod
+    def key_result(self, key):
+        """(terminada, respuesta) de una clave registrada, o None si no existe"""
+
+    @contextmanager
+    def lock(self, phone):
+        """Bloqueo exclusivo de la sesión (dentro del proceso por defecto)"""
+        with self._local_locks.hold(phone):
+            yield
+
+    @contextmanager
+    def session(self, phone, factory):
+        """Cargar (o crear con `factory(phone)`) la sesión bajo bloqueo y guardarla al salir"""
+        with self.lock(phone):
+            data = self.load(phone)
+            if data is None:
+                data = factory(phone)
+            yield data
+            self.save(phone, data)
+
+
+class MemorySessionStore(SessionStore):
+    """LRU + TTL en memoria"""
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # phone -> (expira_en, data)
+        self._keys = OrderedDict()  # clave de idempotencia -> [expira_en, terminada, respuesta]
+        self._guard = threading.Lock()
+
+    def load(self, phone):
+        with self._guard:
+            entry = self._data.get(phone)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[phone]
+                return None
+            self._data.move_to_end(phone)
+            return entry[1]
+
+    def save(self, phone, data):
+        with self._guard:
+            self._data[phone] = (time.monotonic() + self.ttl, data)
+            self._data.move_to_end(phone)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, phone):
+        with self._guard:
+            self._data.pop(phone, None)
+
+    def count(self):
+        with self._guard:
+            return len(self._data)
+
+    def claim_key(self, key, ttl):
+        now = time.monotonic()
+        with self._guard:
+            entry = self._keys.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._keys[key] = [now + ttl, False, None]
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+            return True
+
+    def complete_key(self, key, response, ttl):
+        with self._guard:
+            self._keys[key] = [time.monotonic() + ttl, True, response]
+
+    def release_key(self, key):
+        with self._guard:
+            self._keys.pop(key, None)
+
+    def key_result(self, key):
+        with self._guard:
+            entry = self._keys.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1], entry[2]
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite en modo WAL, compartido entre procesos"""
+
+    shared = True
+    PURGE_EVERY = 500  # Escrituras entre purgas de sesiones caducadas
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, lease=SESSION_LOCK_LEASE,
+                 lock_timeout=SESSION_LOCK_TIMEOUT):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self.lock_timeout = lock_timeout
+        self._local = threading.local()
+        self._writes = 0
+        # Una conexión SQLite no debe cruzar un fork: cada worker abre la suya
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                     "phone TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS session_locks ("
+                     "phone TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                     "key TEXT PRIMARY KEY, done INTEGER NOT NULL, response TEXT, expires_at REAL NOT NULL)")
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        """Una conexión por hilo (autocommit; transacciones explícitas)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, phone):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE phone = ? AND expires_at > ?", (phone, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, phone, data):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (phone, data, expires_at) VALUES (?, ?, ?)",
+            (phone, json.dumps(data, ensure_ascii=False), time.time() + self.ttl)
+        )
+        self._count_write(conn)
+
+    def _count_write(self, conn):
+        """Purgar sesiones y claves caducadas cada PURGE_EVERY escrituras"""
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, phone):
+        self._conn().execute("DELETE FROM sessions WHERE phone = ?", (phone,))
+
+    def count(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+
+    def claim_key(self, key, ttl):
+        now = time.time()
+        conn = self._conn()
+        cursor = conn.execute(
+            "INSERT INTO idempotency_keys (key, done, response, expires_at) VALUES (?, 0, NULL, ?)"
+            " ON CONFLICT(key) DO UPDATE SET done = 0, response = NULL, expires_at = excluded.expires_at"
+            " WHERE idempotency_keys.expires_at <= ?",
+            (key, now + ttl, now)
+        )
+        self._count_write(conn)
+        return cursor.rowcount == 1
+
+    def complete_key(self, key, response, ttl):
+        self._conn().execute(
+            "UPDATE idempotency_keys SET done = 1, response = ?, expires_at = ? WHERE key = ?",
+            (json.dumps(response, ensure_ascii=False), time.time() + ttl, key)
+        )
+
+    def release_key(self, key):
+        self._conn().execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    def key_result(self, key):
+        row = self._conn().execute(
+            "SELECT done, response FROM idempotency_keys WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), json.loads(row[1]) if row[1] is not None else None
+
+    @contextmanager
+    def lock(self, phone):
+        """Bloqueo por teléfono entre procesos con un lease en session_locks"""
+        with self._local_locks.hold(phone):
+            owner = uuid.uuid4().hex
+            conn = self._conn()
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT expires_at FROM session_locks WHERE phone = ?", (phone,)
+                    ).fetchone()
+                    acquired = row is None or row[0] <= now
+                    if acquired:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO session_locks (phone, owner, expires_at) VALUES (?, ?, ?)",
+                            (phone, owner, now + self.lease)
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                if acquired:
+                    break
+                if time.monotonic() > deadline:
+                    raise SessionLockTimeout(phone)
+                time.sleep(0.01)
+            try:
+                yield
+            finally:
+                conn.execute("DELETE FROM session_locks WHERE phone = ? AND owner = ?", (phone, owner))
+
+
+class RedisSessionStore(SessionStore):
+    """Backend compatible con Redis (EXPIRE para el TTL, SET NX PX para el bloqueo)
+
+    Cada sesión se anota también en un sorted set (teléfono -> caducidad):
+    count() poda las caducadas y hace ZCARD, sin recorrer el keyspace con SCAN
+    en cada scrape de /metrics.
+    """
+
+    # Liberar el lock solo si seguimos siendo sus dueños
+    _RELEASE = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                "return redis.call('del', KEYS[1]) else return 0 end")
+
+    shared = True
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=SESSION_TTL, lease=SESSION_LOCK_LEASE,
+                 lock_timeout=SESSION_LOCK_TIMEOUT, client=None, prefix="session:",
+                 lock_prefix="session-lock:", key_prefix="idempotency:", index_key="session-index"):
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise RuntimeError("SESSION_BACKEND=redis requiere el paquete 'redis'")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = int(ttl)
+        self.lease_ms = int(lease * 1000)
+        self.lock_timeout = lock_timeout
+        self.prefix = prefix
+        self.lock_prefix = lock_prefix
+        self.key_prefix = key_prefix
+        self.index_key = index_key
+
+    def load(self, phone):
+        raw = self.client.get(self.prefix + phone)
+        return json.loads(raw) if raw else None
+
+    def save(self, phone, data):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self.prefix + phone, json.dumps(data, ensure_ascii=False), ex=self.ttl)
+        pipe.zadd(self.index_key, {phone: time.time() + self.ttl})
+        pipe.execute()
+
+    def delete(self, phone):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self.prefix + phone)
+        pipe.zrem(self.index_key, phone)
+        pipe.execute()
+
+    def count(self):
+        self.client.zremrangebyscore(self.index_key, "-inf", time.time())
+        return self.client.zcard(self.index_key)
+
+    def claim_key(self, key, ttl):
+        return bool(self.client.set(self.key_prefix + key, json.dumps([False, None]), nx=True, px=int(ttl * 1000)))
+
+    def complete_key(self, key, response, ttl):
+        self.client.set(self.key_prefix + key, json.dumps([True, response], ensure_ascii=False),
+                        px=int(ttl * 1000))
+
+    def release_key(self, key):
+        self.client.delete(self.key_prefix + key)
+
+    def key_result(self, key):
+        raw = self.client.get(self.key_prefix + key)
+        return tuple(json.loads(raw)) if raw else None
+
+    @contextmanager
+    def lock(self, phone):
+        with self._local_locks.hold(phone):
+            key = self.lock_prefix + phone
+            owner = uuid.uuid4().hex
+            deadline = time.monotonic() + self.lock_timeout
+            while not self.client.set(key, owner, nx=True, px=self.lease_ms):
+                if time.monotonic() > deadline:
+                    raise SessionLockTimeout(phone)
+                time.sleep(0.01)
+            try:
+                yield
+            finally:
+                self.client.eval(self._RELEASE, 1, key, owner)
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    """Crear el backend configurado en SESSION_BACKEND"""
+    if backend == "memory":
+        return MemorySessionStore()
+    elif backend == "sqlite":
+        return SQLiteSessionStore()
+    elif backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"SESSION_BACKEND desconocido: {backend}")
@@ -0,0 +1,146 @@
+"""
+Verificación de firmas de los webhooks (Twilio y Cal.com).
+
+- Twilio firma cada petición con X-Twilio-Signature: base64 del HMAC-SHA1
+  (clave: TWILIO_AUTH_TOKEN) de la URL pública seguida de los parámetros POST
+  ordenados por nombre (nombre + valor, sin separadores).
+- Cal.com firma el cuerpo con X-Cal-Signature-256: hex del HMAC-SHA256
+  (clave: el secreto del webhook, CAL_WEBHOOK_SECRET).
+
+La clave se procesa una sola vez: cada verificación copia el HMAC ya
+inicializado (.copy()) en lugar de recalcular los bloques ipad/opad. La
+comparación es de tiempo constante (hmac.compare_digest). Una petición sin
+cabecera se rechaza sin calcular nada.
+
+Sin clave configurada no se verifica (desarrollo local); con
+WEBHOOK_SIGNATURES=required se rechaza todo hasta configurarla. Detrás de un
+proxy o de ngrok, WEBHOOK_PUBLIC_URL es la URL base que ve Twilio.
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+import logging
+from urllib.parse import urlsplit, urlunsplit
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SIGNATURE_HEADER = "X-Twilio-Signature"
+CAL_SIGNATURE_HEADER = "X-Cal-Signature-256"
+
+_DEFAULT_PORTS = {"https": 443, "http": 80}
+
+
+def _signed_params(params):
+    """Parámetros POST ordenados y concatenados (nombre + valor), en bytes"""
+    getlist = getattr(params, "getlist", None)  # MultiDict de Flask o dict
+    if getlist is None:
+        return "".join([name + params[name] for name in sorted(params)]).encode("utf-8")
+    return "".join([name + value for name in sorted(params) for value in sorted(getlist(name))]).encode("utf-8")
+
+
+def _port_variants(url):
+    """La URL tal cual y con/sin el puerto por defecto (Twilio firma una de las dos)"""
+    parts = urlsplit(url)
+    default = _DEFAULT_PORTS.get(parts.scheme)
+    if default is None or not parts.hostname:
+        return (url,)
+    if parts.port is None:
+        netloc = f"{parts.netloc}:{default}"
+    elif parts.port == default:
+        netloc = parts.netloc.rsplit(":", 1)[0]
+    else:
+        return (url,)
+    return (url, urlunsplit(parts._replace(netloc=netloc)))
+
+
+class TwilioValidator:
+    """X-Twilio-Signature con la clave (auth token) precalculada"""
+
+    def __init__(self, auth_token):
+        self._mac = hmac.new(auth_token.encode("utf-8"), digestmod=hashlib.sha1)
+
+    def signature(self, url, params, signed_params=None):
+        """Firma esperada (bytes base64) de una petición"""
+        mac = self._mac.copy()
+        mac.update(url.encode("utf-8"))
+        mac.update(_signed_params(params) if signed_params is None else signed_params)
+        return base64.b64encode(mac.digest())
+
+    def verify(self, url, params, signature):
+        if not signature:
+            return False
+        signature = signature.encode("utf-8")
+        signed_params = _signed_params(params)  # Una vez para todas las variantes de la URL
+        return any(hmac.compare_digest(self.signature(candidate, params, signed_params), signature)
+                   for candidate in _port_variants(url))
+
+
+class CalValidator:
+    """X-Cal-Signature-256 con el secreto precalculado"""
+
+    def __init__(self, secret):
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def signature(self, body):
+        """Firma esperada (hex) del cuerpo en bruto"""
+        mac = self._mac.copy()
+        mac.update(body)
+        return mac.hexdigest()
+
+    def verify(self, body, signature):
+        if not signature:
+            return False
+        return hmac.compare_digest(self.signature(body), signature.strip().lower())
+
+
+def public_url(url, base=""):
+    """URL con la que firmó Twilio: la base pública (si hay) + ruta y query de la petición"""
+    if not base:
+        return url
+    parts = urlsplit(url)
+    return base + urlunsplit(("", "", parts.path, parts.query, ""))
+
+
+class WebhookVerifier:
+    """Verificación de Twilio y Cal.com con contadores por resultado"""
+
+    def __init__(self, twilio_auth_token=None, cal_secret=None, mode=None, base_url=None):
+        # Configuración leída al construir (después de load_dotenv), no al importar
+        if mode is None:
+            mode = os.getenv("WEBHOOK_SIGNATURES", "auto")  # auto | required | off
+        if base_url is None:
+            base_url = os.getenv("WEBHOOK_PUBLIC_URL", "")
+        self.mode = mode
+        self.base_url = base_url.rstrip("/")
+        self.twilio = TwilioValidator(twilio_auth_token) if twilio_auth_token and mode != "off" else None
+        self.cal = CalValidator(cal_secret) if cal_secret and mode != "off" else None
+        for source, validator in (("twilio", self.twilio), ("cal", self.cal)):
+            if validator is None and mode == "auto":
+                logger.warning("⚠️ Firmas de %s sin verificar: falta la clave", source)
+
+    def _result(self, source, validator, signature, check):
+        if validator is None:
+            if self.mode != "required":
+                return True
+            result = "unconfigured"
+        elif not signature:
+            result = "missing"
+        else:
+            result = "valid" if check() else "invalid"
+        metrics.inc("webhook_signatures_total", source=source, result=result)
+        if result != "valid":
+            logger.debug("🚫 Firma de %s rechazada (%s)", source, result)
+        return result == "valid"
+
+    def verify_twilio(self, url, params, signature):
+        """True si la petición viene de Twilio (o no hay que verificarla)"""
+        return self._result("twilio", self.twilio, signature,
+                            lambda: self.twilio.verify(public_url(url, self.base_url), params, signature))
+
+    def verify_cal(self, body, signature):
+        """True si el cuerpo lo firmó Cal.com (o no hay que verificarlo)"""
+        return self._result("cal", self.cal, signature, lambda: self.cal.verify(body, signature))
@@ -0,0 +1,124 @@
+"""
+Logging estructurado y no bloqueante.
+
+- Cada registro es una línea JSON: ts, level, logger, msg y los campos pasados
+  en `extra` (phone, status, event...).
+- El hilo de la petición solo encola el LogRecord (QueueHandler); el formateo
+  del mensaje, la serialización JSON y la escritura en stdout ocurren en el
+  hilo del QueueListener.
+- Formateo perezoso: se usan argumentos estilo %, así que un registro por
+  debajo de LOG_LEVEL no se formatea nunca.
+- Muestreo de DEBUG por teléfono: con LOG_LEVEL=DEBUG solo se emiten los debug
+  de un LOG_DEBUG_SAMPLE_PERCENT de los teléfonos (siempre los mismos, así una
+  conversación muestreada se ve completa).
+
+Uso:
+    setup_logging()
+    logger.info("📱 Mensaje recibido de %s", phone, extra={"phone": phone})
+"""
+
+import os
+import sys
+import json
+import zlib
+import queue
+import atexit
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_PERCENT = float(os.getenv("LOG_DEBUG_SAMPLE_PERCENT", "10"))
+
+# Atributos propios de LogRecord: todo lo demás viene de `extra`
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class PhoneSamplingFilter(logging.Filter):
+    """Deja pasar los DEBUG solo para un porcentaje estable de teléfonos"""
+
+    def __init__(self, percent=LOG_DEBUG_SAMPLE_PERCENT):
+        super().__init__()
+        self.threshold = percent / 100 * 0x100000000
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        phone = getattr(record, "phone", None)
+        if phone is None:
+            return True
+        return zlib.crc32(str(phone).encode("utf-8")) < self.threshold
+
+
+class _LazyQueueHandler(QueueHandler):
+    """Encola el registro tal cual: el mensaje se formatea en el hilo del listener"""
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """Instalar el pipeline en el logger raíz (idempotente)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        handler = _LazyQueueHandler(log_queue)
+        handler.addFilter(PhoneSamplingFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+def _restart_after_fork():
+    """El hilo del listener no sobrevive al fork: cola y listener nuevos en el hijo"""
+    global _listener, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _LazyQueueHandler):
+            handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,253 @@
+"""
+Registro de negocios (tenants) servidos por un mismo despliegue.
+
+Cada negocio se identifica por el número de WhatsApp al que escribe el
+cliente (el campo To de Twilio) y tiene su propia configuración: cuenta y
+tipo de evento de Cal.com, zona horaria, horario comercial, número emisor y
+textos propios (dirección, horario, precios...). Los modelos de idioma,
+intención y fechas son del proceso y se comparten entre todos.
+
+- Archivo TENANTS_FILE (JSON). Se relee sin reiniciar cuando cambia su mtime
+  (se comprueba como mucho cada TENANTS_RELOAD_INTERVAL segundos, en la propia
+  petición: no hay hilos). Si el archivo nuevo no es válido se mantiene el
+  anterior.
+- get(to) es una búsqueda en un dict: O(1) por petición.
+- Un número desconocido (o sin archivo) usa el tenant por defecto, que es la
+  configuración de siempre (variables de entorno y constantes de app.py).
+- Un trabajo en cola de un tenant que ya no existe falla (require() lanza
+  UnknownTenantError): nunca se reserva en la cuenta de Cal.com de otro negocio.
+
+Formato:
+    {"tenants": [{
+        "id": "panaderia-queens",
+        "numbers": ["+14155238886"],
+        "twilio_number": "+14155238886",
+        "cal": {"api_key_env": "CAL_API_KEY_PANADERIA", "user": "panaderia",
+                "event_type_id": 123, "event_type_slug": "cita", "duration_minutes": 30},
+        "timezone": "America/New_York",
+        "hours": {"days": [0, 1, 2, 3, 4, 5], "open": 7, "close": 17},
+        "responses": {"conversation": {"en": {"location": "We are at 1 Main St, Queens."}}}
+    }]}
+Los campos que falten se heredan del tenant por defecto. Un texto propio en el
+idioma por defecto no pisa las traducciones: para cambiar un texto en todos
+los idiomas hay que darlo en cada uno.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from availability import BusinessHours
+from responses import ResponseCatalog
+
+logger = logging.getLogger(__name__)
+
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+TENANTS_RELOAD_INTERVAL = float(os.getenv("TENANTS_RELOAD_INTERVAL", "5"))
+
+DEFAULT_TENANT_ID = "default"
+
+
+def normalize_number(number):
+    """'whatsapp:+1 415 523 8886' -> '+14155238886'"""
+    number = (number or "").strip()
+    if number.startswith("whatsapp:"):
+        number = number[len("whatsapp:"):]
+    return number.replace(" ", "").replace("-", "")
+
+
+class UnknownTenantError(KeyError):
+    """El tenant de un trabajo en cola ya no está en el archivo"""
+
+
+class Tenant:
+    """Configuración de un negocio (inmutable: una recarga crea objetos nuevos)"""
+
+    def __init__(self, id, numbers=(), twilio_number=None, cal_api_key="", cal_api_base="https://api.cal.com/v2",
+                 cal_user=None, event_type_id=None, event_type_slug=None, duration_minutes=30,
+                 timezone="America/New_York", hours=None, responses=None, config=None):
+        self.id = id
+        self.numbers = tuple(normalize_number(n) for n in numbers)
+        self.twilio_number = twilio_number
+        self.cal_api_key = cal_api_key
+        self.cal_api_base = cal_api_base
+        self.cal_user = cal_user
+        self.event_type_id = event_type_id
+        self.event_type_slug = event_type_slug
+        self.duration_minutes = duration_minutes
+        self.timezone = timezone
+        self.hours = hours or BusinessHours(tz=timezone)
+        self.responses = responses or {}  # {sección: {idioma: {clave: texto}}}
+        self.config = config  # Entrada del archivo (para detectar cambios al recargar)
+        self.slot_index = None  # Índice de disponibilidad (lo crea app.py bajo demanda)
+        self._catalogs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_default(self):
+        return self.id == DEFAULT_TENANT_ID
+
+    @property
+    def booking_url(self):
+        """Página pública de reserva en Cal.com"""
+        return f"https://cal.com/{self.cal_user}/{self.event_type_slug or self.event_type_id}"
+
+    def session_key(self, phone):
+        """Clave de sesión: un mismo cliente puede hablar con varios negocios"""
+        return phone if self.is_default else f"{self.id}|{phone}"
+
+    def catalog(self, section, base):
+        """Catálogo de la sección con los textos propios; `base` si no hay ninguno"""
+        overrides = self.responses.get(section)
+        if not overrides:
+            return base
+        catalog = self._catalogs.get(section)
+        if catalog is None:
+            with self._lock:
+                catalog = self._catalogs.get(section)
+                if catalog is None:
+                    catalog = self._catalogs[section] = ResponseCatalog(
+                        section, default_lang=base.default_lang, overrides=overrides)
+        return catalog
+
+    @classmethod
+    def from_config(cls, config, defaults):
+        """Tenant de una entrada del archivo; lo que falte se toma de `defaults`"""
+        cal = config.get("cal", {})
+        api_key = cal.get("api_key") or (os.getenv(cal["api_key_env"], "") if cal.get("api_key_env") else None)
+        timezone = config.get("timezone", defaults.timezone)
+        hours = config.get("hours")
+        if hours or timezone != defaults.timezone:
+            hours = hours or {}
+            hours = BusinessHours(
+                tz=timezone,
+                days=frozenset(hours.get("days", defaults.hours.days)),
+                open_hour=hours.get("open", defaults.hours.open_hour),
+                close_hour=hours.get("close", defaults.hours.close_hour),
+            )
+        else:
+            hours = defaults.hours
+        numbers = config.get("numbers", [])
+        return cls(
+            id=config["id"],
+            numbers=numbers,
+            twilio_number=config.get("twilio_number") or (numbers[0] if numbers else defaults.twilio_number),
+            cal_api_key=defaults.cal_api_key if api_key is None else api_key,
+            cal_api_base=cal.get("api_base", defaults.cal_api_base),
+            cal_user=cal.get("user", defaults.cal_user),
+            event_type_id=cal.get("event_type_id", defaults.event_type_id),
+            event_type_slug=cal.get("event_type_slug", defaults.event_type_slug),
+            duration_minutes=cal.get("duration_minutes", defaults.duration_minutes),
+            timezone=timezone,
+            hours=hours,
+            responses=config.get("responses"),
+            config=config,
+        )
+
+
+class TenantRegistry:
+    """Tenants por número entrante, recargados del archivo cuando cambia"""
+
+    def __init__(self, default, path=TENANTS_FILE, reload_interval=TENANTS_RELOAD_INTERVAL):
+        self.default = default
+        self.path = path
+        self.reload_interval = reload_interval
+        self._by_number = {}
+        self._by_id = {default.id: default}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.reloads = 0
+        self.errors = 0
+        self.reload()
+
+    def get(self, to_number):
+        """Tenant del número al que escribió el cliente (o el tenant por defecto)"""
+        self._maybe_reload()
+        return self._by_number.get(normalize_number(to_number), self.default)
+
+    def by_id(self, tenant_id):
+        """Tenant por id (avisos); el de por defecto si ya no existe"""
+        return self._by_id.get(tenant_id, self.default)
+
+    def all(self):
+        """Todos los tenants, el de por defecto primero (recordatorios de broadcast.py)"""
+        self._maybe_reload()
+        return list(self._by_id.values())
+
+    def require(self, tenant_id):
+        """Tenant por id para un trabajo en cola; UnknownTenantError si se eliminó"""
+        tenant = self._by_id.get(tenant_id)
+        if tenant is None:
+            raise UnknownTenantError(tenant_id)
+        return tenant
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # Otro hilo ya está comprobando
+        try:
+            self._checked_at = now
+            self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Releer el archivo si cambió; True si se aplicó una versión nueva"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+
+        try:
+            tenants = self._load() if mtime is not None else []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            logger.error("❌ Archivo de tenants no válido (%s), se mantiene la versión anterior: %s", self.path, e)
+            self._mtime = mtime
+            return False
+
+        by_number = {}
+        by_id = {self.default.id: self.default}
+        for tenant in tenants:
+            # Sin cambios en su entrada: se conserva el objeto (catálogos e índice ya cargados)
+            previous = self._by_id.get(tenant.id)
+            if previous is not None and previous.config == tenant.config:
+                tenant = previous
+            elif previous is not None and previous.slot_index is not None:
+                previous.slot_index.stop()
+            by_id[tenant.id] = tenant
+            for number in tenant.numbers:
+                by_number[number] = tenant
+
+        # Tenants eliminados del archivo: parar su índice de disponibilidad
+        for tenant_id, previous in self._by_id.items():
+            if tenant_id not in by_id and previous.slot_index is not None:
+                previous.slot_index.stop()
+
+        # Intercambio atómico: las peticiones en curso siguen con la versión anterior
+        self._by_number, self._by_id, self._mtime = by_number, by_id, mtime
+        self.reloads += 1
+        logger.info("🏢 Tenants cargados: %s (%s números)", len(by_id) - 1, len(by_number))
+        return True
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        return [Tenant.from_config(entry, self.default) for entry in data.get("tenants", [])]
+
+    def stats(self):
+        """Contadores para /health"""
+        return {
+            'tenants': len(self._by_id),
+            'numbers': len(self._by_number),
+            'reloads': self.reloads,
+            'errors': self.errors,
+        }
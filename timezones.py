@@ -0,0 +1,127 @@
+"""
+Zonas horarias de las citas: una sola conversión, con zoneinfo y en caché.
+
+- get_zone(nombre): ZoneInfo en caché; un nombre inválido cae a UTC (con aviso)
+  en vez de romper la conversación.
+- Zona del cliente: la guardada en la sesión ('tz'); si no hay, la del prefijo
+  internacional de su teléfono; si el prefijo abarca varias zonas (+1, +7,
+  +61...) o es desconocido, la del negocio. Se resuelve una vez y se guarda.
+- normalize(dt, zona): toda hora parseada pasa por aquí una sola vez. Una hora
+  naive es hora de pared en la zona; una hora que no existe (salto de marzo,
+  2:30) se mueve hacia delante (3:30) y una repetida (vuelta de noviembre,
+  1:30) es la primera.
+- to_utc_many: conversión masiva de los huecos de /v2/slots. Lo caro es el
+  texto ISO, no la zona: la ruta rápida evita el replace("Z") y las
+  conversiones cuando el instante ya viene en UTC. Hacia la hora local basta
+  astimezone (to_local): zoneinfo (en C) ya guarda sus transiciones, y ni una
+  versión en bloque ni un desfase por día en caché lo mejoran (ver
+  benchmarks/bench_timezones.py).
+"""
+
+import logging
+import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+UTC = datetime.timezone.utc
+
+# Prefijo internacional -> zona (solo países con una zona dominante)
+COUNTRY_ZONES = {
+    "34": "Europe/Madrid", "33": "Europe/Paris", "49": "Europe/Berlin", "39": "Europe/Rome",
+    "351": "Europe/Lisbon", "44": "Europe/London", "353": "Europe/Dublin", "41": "Europe/Zurich",
+    "43": "Europe/Vienna", "32": "Europe/Brussels", "31": "Europe/Amsterdam", "48": "Europe/Warsaw",
+    "52": "America/Mexico_City", "55": "America/Sao_Paulo", "54": "America/Argentina/Buenos_Aires",
+    "56": "America/Santiago", "57": "America/Bogota", "58": "America/Caracas", "51": "America/Lima",
+    "53": "America/Havana", "591": "America/La_Paz", "593": "America/Guayaquil",
+    "595": "America/Asuncion", "598": "America/Montevideo", "502": "America/Guatemala",
+    "503": "America/El_Salvador", "504": "America/Tegucigalpa", "505": "America/Managua",
+    "506": "America/Costa_Rica", "507": "America/Panama",
+}
+# Prefijos con varias zonas: se usa la del negocio
+MULTI_ZONE_PREFIXES = frozenset({"1", "7", "61", "62"})
+
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo por nombre IANA; UTC si el nombre no es válido"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        logger.warning("⚠️ Zona horaria desconocida %r, se usa UTC", name)
+        return ZoneInfo("UTC")
+
+
+def _zone(zone):
+    return get_zone(zone) if isinstance(zone, str) else zone
+
+
+def zone_for_phone(phone):
+    """Zona del prefijo internacional ('whatsapp:+34...' -> 'Europe/Madrid') o None"""
+    phone = (phone or "").strip()
+    if phone.startswith("whatsapp:"):
+        phone = phone[len("whatsapp:"):]
+    if not phone.startswith("+"):
+        return None
+    digits = phone[1:4]
+    for length in (3, 2, 1):
+        prefix = digits[:length]
+        if prefix in MULTI_ZONE_PREFIXES:
+            return None
+        zone = COUNTRY_ZONES.get(prefix)
+        if zone:
+            return zone
+    return None
+
+
+def resolve_user_zone(session, phone, fallback):
+    """Zona del cliente: sesión -> prefijo del teléfono -> `fallback` (se guarda en la sesión)"""
+    name = session.get('tz')
+    if not name:
+        name = session['tz'] = zone_for_phone(phone) or fallback
+    return get_zone(name)
+
+
+def now(zone):
+    """Hora actual en la zona"""
+    return datetime.datetime.now(_zone(zone))
+
+
+def normalize(dt, zone):
+    """Hora parseada -> datetime con la ZoneInfo de la zona, existente y sin ambigüedad"""
+    zone = _zone(zone)
+    if dt.tzinfo is None or dt.tzinfo is zone:
+        # Hora de pared: la ida y vuelta por UTC corrige las horas del salto
+        return dt.replace(tzinfo=zone, fold=0).astimezone(UTC).astimezone(zone)
+    return dt.astimezone(zone)
+
+
+def _fromisoformat(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:  # Python < 3.11 no acepta el sufijo Z
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def to_utc(value):
+    """datetime (naive = UTC) o ISO 8601 -> datetime UTC"""
+    if isinstance(value, str):
+        value = _fromisoformat(value)
+    tzinfo = value.tzinfo
+    if tzinfo is UTC:
+        return value
+    if tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def to_utc_many(values):
+    """to_utc en bloque (inicios de hueco de Cal.com)"""
+    return [to_utc(value) for value in values]
+
+
+def to_local(instant, zone):
+    """Un instante (aware) en la zona"""
+    return instant.astimezone(_zone(zone))
@@ -17,337 +17,533 @@ Fecha: 2025-11-12
 """
 
 import os
-import json
-import requests
+import queue
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from dotenv import load_dotenv
 import logging
+import threading
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# Cargar variables de entorno
+# .env antes que los módulos del proyecto: leen su configuración al importarse
 load_dotenv()
 
+from structured_logging import setup_logging
+from keywords import KeywordMatcher
+import http_client
+from event_types import EventTypeCache
+from outbound_queue import OutboundQueue, SENT, RETRY, REJECTED, UNKNOWN
+from language_id import identify_language
+from session_store import MemorySessionStore, create_session_store
+from lifecycle import start_background
+from dedup import IdempotencyIndex, cal_event_key
+import availability
+from dispatcher import Dispatcher, DispatchTimeout
+from responses import ResponseCatalog, format_datetime
+from signatures import WebhookVerifier, TWILIO_SIGNATURE_HEADER, CAL_SIGNATURE_HEADER
+from tenants import Tenant, TenantRegistry, DEFAULT_TENANT_ID
+from booking_index import get_booking_index, CalEventPipeline, booking_link, event_fields, METADATA_SOURCE
+import timezones
+import metrics
+
+# Configurar logging (JSON fuera del hilo de la petición, ver structured_logging.py)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Configuración desde .env
 WHATSAPP_PHONE = os.getenv('WHATSAPP_PHONE', '+19296025778')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', '+14155238886')
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 CAL_API_KEY = os.getenv('CAL_API_KEY')
+CAL_WEBHOOK_SECRET = os.getenv('CAL_WEBHOOK_SECRET')
 CAL_EVENT_TYPE_ID = os.getenv('CAL_EVENT_TYPE_ID', 'agente-demo')
 ACCOUNT_USERNAME = os.getenv('ACCOUNT_USERNAME', 'call-me-please-2tibhe')
 
-# URLs de Cal.com API v2
-CAL_API_BASE = "https://api.cal.com/v2"
-
-# Respuestas en múltiples idiomas
-RESPONSES = {
-    'es': {
-        'greeting': "¡Hola! Soy tu agente de citas de WhatsApp. 📅",
-        'understanding': "He entendido que quieres agendar una cita.",
-        'booking_link': "✨ Puedes agendar tu cita directamente aquí: {}",
-        'instructions': "📋 **Instrucciones:**\n1. Haz clic en el enlace de arriba\n2. Selecciona fecha y hora disponibles\n3. Completa el formulario\n4. ¡Recibirás confirmación automática!",
-        'confirmation': "✅ ¡Cita confirmada! Recibirás un email de confirmación y luego te confirmaré por WhatsApp.",
-        'support': "¿Necesitas ayuda o quieres modificar algo? Solo responde aquí.",
-        'booking_received': "¡Perfecto! He recibido tu solicitud de cita. Puedes agendar directamente usando el enlace:",
-        'timezone_note': "⏰ Todos los horarios están en tu zona horaria local.",
-        'thanks': "¡Gracias por usar nuestro agente de WhatsApp! 😊",
-        'error': "❌ Hubo un problema generando el enlace de cita. Por favor intenta de nuevo."
+# URLs de Cal.com API v2 y Twilio
+CAL_API_BASE = os.getenv('CAL_API_BASE', "https://api.cal.com/v2")
+TWILIO_API_BASE = os.getenv('TWILIO_API_BASE', "https://api.twilio.com/2010-04-01")
+
+# Respuestas en múltiples idiomas (locales/<idioma>.json, ver responses.py)
+CATALOG = ResponseCatalog("agent", default_lang="es")
+
+# Respuestas compuestas (se precompilan una vez por idioma)
+WELCOME_REPLY = ('greeting', 'understanding', 'booking_link', 'instructions')
+SCHEDULING_REPLY = ('booking_received', 'booking_link', 'timezone_note')
+DATE_REPLY = ('booking_received', 'booking_link', 'instructions')
+DEFAULT_REPLY = ('greeting', 'understanding', 'booking_link', 'support')
+
+# Evento de Cal.com -> aviso al cliente por WhatsApp
+CAL_EVENT_REPLIES = {
+    'BOOKING_CREATED': 'confirmation_details',
+    'BOOKING_RESCHEDULED': 'booking_rescheduled',
+    'BOOKING_CANCELLED': 'booking_cancelled',
+    'BOOKING_REJECTED': 'booking_cancelled',
+}
+
+# Palabras clave del flujo de enlace de reserva (intención -> idioma -> palabras)
+MESSAGE_KEYWORDS = {
+    'greeting': {
+        'es': ['hola'],
+        'en': ['hello', 'hi', 'start'],
+    },
+    'scheduling': {
+        'es': ['cita', 'reunión', 'agendar'],
+        'en': ['appointment', 'meeting', 'schedule', 'book', 'calendly', 'cal.com'],
+        'fr': ['rendez-vous'],
+    },
+    'date': {
+        'es': ['mañana'],
+        'en': ['tomorrow'],
+        'fr': ['demain'],
+        'de': ['morgen'],
+        'it': ['domani'],
+        'pt': ['amanhã'],
     },
-    'en': {
-        'greeting': "Hello! I'm your WhatsApp scheduling agent. 📅",
-        'understanding': "I understand you want to book an appointment.",
-        'booking_link': "✨ You can book your appointment directly here: {}",
-        'instructions': "📋 **Instructions:**\n1. Click the link above\n2. Select available date and time\n3. Complete the form\n4. You'll receive automatic confirmation!",
-        'confirmation': "✅ Appointment confirmed! You'll receive a confirmation email and I'll confirm via WhatsApp.",
-        'support': "Need help or want to modify anything? Just reply here.",
-        'booking_received': "Perfect! I've received your booking request. You can schedule directly using the link:",
-        'timezone_note': "⏰ All times are in your local timezone.",
-        'thanks': "Thanks for using our WhatsApp agent! 😊",
-        'error': "❌ There was a problem generating the booking link. Please try again."
-    }
 }
+MESSAGE_MATCHER = KeywordMatcher(MESSAGE_KEYWORDS)
+
+@metrics.timed("twilio_send")
+def _post_to_twilio(to_number, message, from_number=None):
+    """Enviar mensaje de WhatsApp via Twilio; devuelve el código de estado (errores de red se propagan)"""
+    # Limpiar número - remover prefijo whatsapp si existe
+    clean_to_number = to_number.replace('whatsapp:', '').strip()
+
+    # URL de la API de Twilio
+    url = f"{TWILIO_API_BASE}/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+
+    # Número emisor: el del negocio (ver tenants.py) o el configurado
+    sender = (from_number or TWILIO_PHONE_NUMBER).replace('whatsapp:', '').strip()
+
+    # Datos del mensaje
+    data = {
+        'From': f'whatsapp:{sender}',
+        'To': f'whatsapp:{clean_to_number}',
+        'Body': message
+    }
+
+    # Headers
+    auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+    # Log de debugging
+    logger.debug("📤 Enviando mensaje a %s desde %s", clean_to_number, sender,
+                 extra={"phone": to_number})
+
+    # Enviar mensaje
+    response = http_client.post(url, data=data, auth=auth)
+
+    if response.status_code == 201:
+        logger.info("✅ Mensaje enviado exitosamente a %s", clean_to_number,
+                    extra={"phone": to_number, "sid": response.json().get('sid', 'N/A')})
+    else:
+        logger.error("❌ Error enviando mensaje a %s: %s", clean_to_number, response.status_code,
+                     extra={"phone": to_number, "status": response.status_code, "body": response.text})
+    return response.status_code
+
+def post_whatsapp_message(to_number, message, from_number=None):
+    """
+    Enviar mensaje de WhatsApp via Twilio; True si Twilio lo aceptó, False si lo rechazó.
+
+    Los errores de red se propagan: tras un timeout de lectura no se sabe si
+    Twilio lo aceptó (ver broadcast.py).
+    """
+    return _post_to_twilio(to_number, message, from_number) == 201
+
+def deliver_whatsapp_message(to_number, message, from_number=None):
+    """
+    Envío de la cola saliente: SENT, RETRY (no llegó a Twilio, 429 o 5xx),
+    REJECTED (4xx: reenviarlo no cambia nada) o UNKNOWN (sin respuesta tras
+    enviarlo: Twilio pudo aceptarlo y reenviarlo lo duplicaría).
+    """
+    try:
+        status = _post_to_twilio(to_number, message, from_number)
+    except Exception as e:
+        logger.error("❌ Error enviando mensaje de WhatsApp: %s", e, extra={"phone": to_number})
+        return RETRY if http_client.not_sent(e) else UNKNOWN
+    if status == 201:
+        return SENT
+    if status == 429 or status >= 500:
+        return RETRY
+    return REJECTED
+
+def send_whatsapp_message(to_number, message, from_number=None):
+    """Enviar mensaje de WhatsApp via Twilio; devuelve True si Twilio lo aceptó"""
+    try:
+        return post_whatsapp_message(to_number, message, from_number)
+    except Exception as e:
+        logger.error("❌ Error enviando mensaje de WhatsApp: %s", e, extra={"phone": to_number})
+        return False
+
+
+_outbound = None
+_outbound_lock = threading.Lock()
+
+
+def get_outbound_queue():
+    """Cola saliente compartida del proceso (agente y confirmaciones de reservas de app.py)"""
+    global _outbound
+    if _outbound is None:
+        with _outbound_lock:
+            if _outbound is None:
+                # Enlace tardío: envía con el deliver_whatsapp_message vigente del módulo
+                _outbound = start_background(
+                    OutboundQueue(lambda to, body, sender: deliver_whatsapp_message(to, body, sender)))
+                metrics.gauge("outbound_queue_depth", _outbound.depth)
+    return _outbound
+
+
+def format_event_time(start_time, zone=None, lang=CATALOG.default_lang):
+    """Inicio de un booking de Cal.com (ISO 8601) en la zona del cliente y su idioma, para mostrar"""
+    try:
+        dt = timezones.to_utc(start_time)
+    except (TypeError, ValueError):
+        return start_time or ''
+    if zone:
+        dt = timezones.to_local(dt, zone)
+    return format_datetime(dt, lang)
+
+
+def default_tenant():
+    """La configuración de siempre (variables de entorno) como tenant por defecto"""
+    return Tenant(
+        DEFAULT_TENANT_ID,
+        twilio_number=TWILIO_PHONE_NUMBER,
+        cal_api_key=CAL_API_KEY or "",
+        cal_api_base=CAL_API_BASE,
+        cal_user=ACCOUNT_USERNAME,
+        event_type_slug=CAL_EVENT_TYPE_ID,
+    )
+
 
 class WhatsAppWebhookAgent:
-    def __init__(self):
+    def __init__(self, tenants=None, store=None):
         self.app = Flask(__name__)
+        self.tenants = tenants or TenantRegistry(default_tenant())  # Negocios por número To
+        self.event_types = EventTypeCache(self.fetch_event_types)
+        if CAL_API_KEY:
+            self.event_types.refresh_async()  # Precalentar sin bloquear el arranque
+        self.outbound = get_outbound_queue()
+        self.conversation_langs = MemorySessionStore()  # Idioma pegajoso por número
+        # Claves de idempotencia compartidas entre workers con SESSION_BACKEND=sqlite|redis (ver dedup.py)
+        store = store or create_session_store()
+        self.message_dedup = IdempotencyIndex("whatsapp", store=store)  # Reintentos de Twilio (MessageSid)
+        self.cal_dedup = IdempotencyIndex("cal", store=store)  # Eventos repetidos de Cal.com (uid)
+        self.dispatcher = start_background(Dispatcher())  # Mensajes del mismo número en orden
+        self.verifier = WebhookVerifier(TWILIO_AUTH_TOKEN, CAL_WEBHOOK_SECRET)  # Firmas de los webhooks
+        self.bookings = get_booking_index()  # uid/email del booking -> teléfono de la conversación
+        # Eventos de Cal.com fuera de la petición (hilos solo en los workers, ver lifecycle.py)
+        self.cal_events = start_background(CalEventPipeline(self.confirm_booking))
+        metrics.gauge("active_sessions", self.conversation_langs.count, app="agent")
+        metrics.gauge("cal_event_queue_depth", self.cal_events.depth)
+        metrics.install_profiler_signal()
         self.setup_routes()
         
     def setup_routes(self):
         """Configurar rutas de la aplicación Flask"""
         
+        @self.app.before_request
+        def verify_signature():
+            """Rechazar webhooks falsificados antes de cualquier trabajo"""
+            if request.method != 'POST':
+                return None
+            if request.path == '/webhook/whatsapp':
+                valid = self.verifier.verify_twilio(request.url, request.form,
+                                                    request.headers.get(TWILIO_SIGNATURE_HEADER))
+            elif request.path == '/webhook/cal':
+                valid = self.verifier.verify_cal(request.get_data(), request.headers.get(CAL_SIGNATURE_HEADER))
+            else:
+                return None
+            return None if valid else (jsonify({'status': 'error', 'message': 'Invalid signature'}), 403)
+        
         @self.app.route('/webhook/whatsapp', methods=['POST'])
         def whatsapp_webhook():
             """Webhook para recibir mensajes de WhatsApp via Twilio"""
-            try:
-                # Extraer datos del webhook
-                data = request.form
-                
-                # Información del mensaje
-                from_number = data.get('From', '')
-                to_number = data.get('To', '')
-                message_body = data.get('Body', '').strip()
-                message_sid = data.get('MessageSid', '')
-                
-                logger.info(f"📱 Mensaje recibido de {from_number}: {message_body}")
-                
-                # Procesar mensaje y responder
-                response_text = self.process_message(message_body, from_number)
-                
-                if response_text:
-                    # Enviar respuesta
-                    self.send_whatsapp_message(from_number, response_text)
-                    logger.info(f"✅ Respuesta enviada a {from_number}")
-                
-                return jsonify({'status': 'success', 'message': 'Message processed'}), 200
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando webhook WhatsApp: {e}")
-                return jsonify({'status': 'error', 'message': str(e)}), 500
+            body, status = self.handle_whatsapp(request.form)
+            return jsonify(body), status
         
         @self.app.route('/webhook/cal', methods=['POST'])
         def cal_webhook():
             """Webhook para recibir confirmaciones de Cal.com"""
-            try:
-                # Datos del booking de Cal.com
-                booking_data = request.json
-                
-                logger.info(f"📅 Booking recibido de Cal.com: {json.dumps(booking_data, indent=2)}")
-                
-                # Extraer información relevante
-                booking_id = booking_data.get('id', 'Unknown')
-                email = booking_data.get('email', 'Unknown')
-                name = booking_data.get('name', 'Unknown')
-                start_time = booking_data.get('start_time', 'Unknown')
-                event_type = booking_data.get('event_type', {}).get('title', 'Unknown')
-                
-                # Enviar confirmación por WhatsApp
-                self.send_confirmation_whatsapp(email, name, start_time, event_type)
-                
-                return jsonify({'status': 'success'}), 200
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando webhook Cal.com: {e}")
-                return jsonify({'status': 'error', 'message': str(e)}), 500
+            body, status = self.handle_cal_event(request.json)
+            return jsonify(body), status
         
         @self.app.route('/health', methods=['GET'])
         def health_check():
             """Endpoint de salud del agente"""
-            return jsonify({
-                'status': 'healthy',
-                'timestamp': datetime.now().isoformat(),
-                'service': 'WhatsApp + Cal.com Webhook Agent (Corregido)',
-                'version': '1.1.0-webhook-fixed',
-                'config': {
-                    'twilio_connected': bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN),
-                    'cal_api_configured': bool(CAL_API_KEY),
-                    'webhook_urls': {
-                        'whatsapp': '/webhook/whatsapp',
-                        'cal': '/webhook/cal'
-                    }
-                }
-            })
+            return jsonify(self.health())
+        
+        @self.app.route('/ready', methods=['GET'])
+        def ready_check():
+            """Readiness: los workers de envío y del despachador están vivos"""
+            ready, checks = self.readiness()
+            return jsonify({'status': 'ready' if ready else 'starting', 'checks': checks}), 200 if ready else 503
+        
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics_endpoint():
+            """Métricas en formato Prometheus"""
+            return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
     
-    def get_cal_booking_url(self, event_type_id=None):
-        """Generar URL de reserva dinámica usando Cal.com API v2"""
+    # Los manejadores no dependen de Flask: también los usa el modo ASGI (asgi.py)
+    
+    def handle_whatsapp(self, data):
+        """Procesar un mensaje entrante de Twilio (form); devuelve (cuerpo, status)"""
         try:
-            if not CAL_API_KEY:
-                # Fallback a URL estática si no hay API key
-                logger.warning("⚠️ CAL_API_KEY no configurada, usando URL estática")
-                return f"https://cal.com/{ACCOUNT_USERNAME}/{event_type_id or CAL_EVENT_TYPE_ID}"
+            # Información del mensaje
+            from_number = data.get('From', '')
+            to_number = data.get('To', '')
+            message_body = data.get('Body', '').strip()
+            message_sid = data.get('MessageSid', '')
             
-            # Usar API v2 de Cal.com para obtener información del evento
-            headers = {
-                'Authorization': f'Bearer {CAL_API_KEY}',
-                'Content-Type': 'application/json'
-            }
+            logger.info("📱 Mensaje recibido de %s: %s", from_number, message_body, extra={"phone": from_number})
             
-            # Obtener tipos de eventos disponibles
-            response = requests.get(
-                f"{CAL_API_BASE}/event-types",
-                headers=headers
+            # Un reintento de Twilio no vuelve a encolar la respuesta
+            tenant = self.tenants.get(to_number)
+            result, duplicate = self.message_dedup.run_once(
+                message_sid, lambda: self.dispatch_whatsapp(message_body, from_number, tenant)
             )
+            if duplicate:
+                logger.info("🔁 Reintento de %s ignorado", message_sid, extra={"phone": from_number})
+                return {'status': 'success', 'message': 'Duplicate message'}, 200
+            return result
             
-            logger.info(f"📡 Respuesta de Cal.com API: {response.status_code}")
+        except Exception as e:
+            logger.error("❌ Error procesando webhook WhatsApp: %s", e)
+            return {'status': 'error', 'message': str(e)}, 500
+    
+    def dispatch_whatsapp(self, message_body, from_number, tenant):
+        """reply_whatsapp() en el buzón del teléfono; si no termina a tiempo, 200 igualmente"""
+        try:
+            return self.dispatcher.call(tenant.session_key(from_number), self.reply_whatsapp,
+                                        message_body, from_number, tenant)
+        except DispatchTimeout:
+            # Sigue en su buzón y encolará la respuesta al terminar: Twilio no debe reintentar
+            logger.warning("⏳ Buzón de %s sin terminar en %ss", from_number, self.dispatcher.timeout,
+                           extra={"phone": from_number})
+            metrics.inc("dispatch_timeouts_total", app="agent")
+            return {'status': 'success', 'message': 'Processing'}, 200
+
+    def reply_whatsapp(self, message_body, from_number, tenant=None):
+        """Generar y encolar la respuesta a un mensaje"""
+        tenant = tenant or self.tenants.default
+        # Procesar mensaje y responder
+        response_text = self.process_message(message_body, from_number, tenant)
+        
+        if response_text:
+            # Encolar respuesta (la envía el pool de workers en segundo plano, desde el número del negocio)
+            self.outbound.enqueue(from_number, response_text, sender=tenant.twilio_number)
+            logger.debug("📥 Respuesta encolada para %s", from_number, extra={"phone": from_number})
+        
+        return {'status': 'success', 'message': 'Message processed'}, 200
+    
+    def handle_cal_event(self, booking_data):
+        """Procesar un evento de Cal.com (JSON); devuelve (cuerpo, status)"""
+        try:
+            logger.info("📅 Evento recibido de Cal.com: %s", booking_data.get('triggerEvent', 'booking'))
+            logger.debug("📅 Payload de Cal.com", extra={"event": booking_data})
             
-            if response.status_code == 200:
-                event_types = response.json().get('data', [])
-                
-                # Buscar el tipo de evento específico o usar el primero
-                if event_type_id:
-                    event_type = next((et for et in event_types if str(et.get('id')) == str(event_type_id)), None)
-                else:
-                    event_type = event_types[0] if event_types else None
-                
-                if event_type:
-                    booking_url = event_type.get('booking_url', '')
-                    if booking_url:
-                        logger.info(f"✅ URL de booking generada dinámicamente: {booking_url}")
-                        return booking_url
-                else:
-                    logger.warning(f"⚠️ No se encontró tipo de evento para ID: {event_type_id}")
-            else:
-                logger.error(f"❌ Error API Cal.com {response.status_code}: {response.text}")
+            # Cambios en tipos de evento: solo invalidar la caché
+            if str(booking_data.get('triggerEvent', '')).startswith('EVENT_TYPE'):
+                self.event_types.invalidate()
+                return {'status': 'success'}, 200
             
-            # Fallback si no se puede obtener la URL dinámicamente
-            logger.warning("⚠️ No se pudo generar URL dinámica, usando fallback")
-            return f"https://cal.com/{ACCOUNT_USERNAME}/{event_type_id or CAL_EVENT_TYPE_ID}"
+            # Ocupar o liberar el hueco en los índices de disponibilidad del proceso
+            availability.apply_cal_event(booking_data)
             
+            # Un evento repetido (mismo uid y tipo) no vuelve a encolarse
+            result, duplicate = self.cal_dedup.run_once(
+                cal_event_key(booking_data), lambda: self.enqueue_cal_event(booking_data)
+            )
+            if duplicate:
+                logger.info("🔁 Evento de Cal.com repetido ignorado: %s", cal_event_key(booking_data))
+            # Desde el almacén compartido la tupla (cuerpo, status) vuelve como lista
+            return tuple(result) if result else ({'status': 'success'}, 200)
+            
+        except queue.Full:
+            # Cola llena: la clave de dedup se liberó y Cal.com reintentará la entrega
+            logger.warning("⚠️ Cola de eventos de Cal.com llena, se pide reintento")
+            return {'status': 'error', 'message': 'Busy, retry later'}, 503
         except Exception as e:
-            logger.error(f"❌ Error generando URL de Cal.com: {e}")
-            logger.error(f"❌ Detalles del error: {type(e).__name__}: {str(e)}")
-            return f"https://cal.com/{ACCOUNT_USERNAME}/{event_type_id or CAL_EVENT_TYPE_ID}"
+            logger.error("❌ Error procesando webhook Cal.com: %s", e)
+            return {'status': 'error', 'message': str(e)}, 500
     
-    def detect_language(self, text):
-        """Detectar idioma del mensaje"""
-        text_lower = text.lower()
+    def enqueue_cal_event(self, booking_data):
+        """Encolar el evento para los workers; queue.Full si la cola está llena"""
+        self.cal_events.submit(booking_data)
+        return {'status': 'success', 'message': 'Event queued'}, 200
+    
+    def confirm_booking(self, booking_data):
+        """Avisar por WhatsApp a quien reservó (worker de la cola de eventos de Cal.com)"""
+        fields = event_fields(booking_data)
+        reply_key = CAL_EVENT_REPLIES.get(fields['trigger'])
+        if reply_key is None:
+            return
+        
+        # Destinatario en O(1): metadata del enlace o de la reserva, uid o email
+        contact = self.bookings.resolve(fields)
+        if fields['trigger'] == 'BOOKING_CREATED' and fields['metadata'].get(METADATA_SOURCE) == 'conversation':
+            return  # app.py ya confirmó la reserva que creó; basta con indexarla
+        metrics.inc("cal_events_total", event=fields['trigger'], recipient='resolved' if contact else 'unresolved')
+        if contact is None:
+            logger.warning("⚠️ Booking %s sin conversación asociada, aviso al número configurado", fields['uid'])
+            contact = {'phone': WHATSAPP_PHONE}
         
-        # Patrones para detección rápida
-        if any(word in text_lower for word in ['hola', 'cita', 'reunión', 'agendar', 'mañana']):
-            return 'es'
-        elif any(word in text_lower for word in ['hello', 'appointment', 'meeting', 'schedule', 'tomorrow']):
-            return 'en'
-        else:
-            return 'es'  # Default to Spanish
+        tenant = self.tenants.by_id(contact.get('tenant'))
+        lang = contact.get('lang') or self.conversation_langs.load(tenant.session_key(contact['phone']))
+        messages = tenant.catalog("agent", CATALOG).get(lang)
+        text = messages.render(
+            reply_key, name=fields['name'], email=fields['email'] or '', event_type=fields['title'],
+            formatted_time=format_event_time(fields['start'], contact.get('tz') or fields['time_zone'], messages.lang)
+        )
+        self.outbound.enqueue(contact['phone'], text, sender=tenant.twilio_number)
+        logger.info("📅 Aviso de %s encolado", fields['trigger'], extra={"phone": contact['phone']})
+    
+    def health(self):
+        """Estado de salud del agente"""
+        return {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'service': 'WhatsApp + Cal.com Webhook Agent (Corregido)',
+            'version': '1.1.0-webhook-fixed',
+            'config': {
+                'twilio_connected': bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN),
+                'cal_api_configured': bool(CAL_API_KEY),
+                'webhook_urls': {
+                    'whatsapp': '/webhook/whatsapp',
+                    'cal': '/webhook/cal'
+                }
+            },
+            'event_type_cache': self.event_types.stats(),
+            'tenants': self.tenants.stats(),
+            'dedup': {'whatsapp': self.message_dedup.stats(), 'cal': self.cal_dedup.stats()},
+            'dispatcher': self.dispatcher.stats(),
+            'outbound_queue': self.outbound.stats(),
+            'cal_events': self.cal_events.stats(),
+            'booking_index': self.bookings.stats()
+        }
+    
+    def readiness(self):
+        """(listo, comprobaciones) para /ready; /health sigue siendo el estado completo"""
+        checks = {
+            'dispatcher': self.dispatcher.alive(),
+            'outbound_queue': self.outbound.alive(),
+            'cal_events': self.cal_events.alive(),
+        }
+        return all(checks.values()), checks
     
-    def process_message(self, message_body, from_number):
+    def fetch_event_types(self):
+        """Obtener los tipos de evento de Cal.com API v2 (lo usa la caché)"""
+        headers = {
+            'Authorization': f'Bearer {CAL_API_KEY}',
+            'Content-Type': 'application/json'
+        }
+        
+        response = http_client.get(
+            f"{CAL_API_BASE}/event-types",
+            headers=headers
+        )
+        
+        logger.info("📡 Respuesta de Cal.com API: %s", response.status_code, extra={"status": response.status_code})
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Error API Cal.com {response.status_code}: {response.text}")
+        return response.json().get('data', [])
+    
+    def get_cal_booking_url(self, event_type_id=None):
+        """Generar URL de reserva desde la caché de tipos de evento (nunca bloquea en Cal.com)"""
+        fallback_url = f"https://cal.com/{ACCOUNT_USERNAME}/{event_type_id or CAL_EVENT_TYPE_ID}"
+        
+        if not CAL_API_KEY:
+            # Fallback a URL estática si no hay API key
+            logger.warning("⚠️ CAL_API_KEY no configurada, usando URL estática")
+            return fallback_url
+        
+        event_type = self.event_types.get(event_type_id)
+        if event_type and event_type.get('booking_url'):
+            return event_type['booking_url']
+        
+        # Caché fría o tipo de evento sin URL: fallback mientras se refresca
+        logger.warning("⚠️ Tipo de evento no disponible en caché (%s), usando fallback", event_type_id)
+        return fallback_url
+    
+    def detect_language(self, text, from_number=None):
+        """Detectar idioma del mensaje (pegajoso por conversación, ver language_id.py)"""
+        sticky = self.conversation_langs.load(from_number) if from_number else None
+        with metrics.span("language_detection"):
+            lang = identify_language(text, sticky=sticky, default=None)
+        if lang is None:
+            return 'es'  # Sin pistas: idioma por defecto, sin fijarlo para la conversación
+        if from_number:
+            self.conversation_langs.save(from_number, lang)
+        return lang
+    
+    def process_message(self, message_body, from_number, tenant=None):
         """Procesar mensaje y generar respuesta apropiada"""
+        tenant = tenant or self.tenants.default
         try:
             # Detectar idioma
-            lang = self.detect_language(message_body)
-            responses = RESPONSES.get(lang, RESPONSES['es'])
+            lang = self.detect_language(message_body, tenant.session_key(from_number))
+            responses = tenant.catalog("agent", CATALOG).get(lang)
             
-            # Generar URL de reserva dinámicamente
-            booking_url = self.get_cal_booking_url()
-            booking_link = responses['booking_link'].format(booking_url)
+            # Generar URL de reserva dinámicamente (página pública del negocio si no es el de por defecto);
+            # la metadata del enlace lleva el teléfono para avisar después a esta conversación
+            booking_url = self.get_cal_booking_url() if tenant.is_default else tenant.booking_url
+            booking_url = booking_link(booking_url, from_number, None if tenant.is_default else tenant.id, lang)
             
-            # Keywords para detectar intención de agendar
-            scheduling_keywords = [
-                'appointment', 'meeting', 'schedule', 'book', 'cita', 'reunión', 
-                'agendar', 'ren', 'meeting', 'calendly', 'cal.com'
-            ]
+            # Detectar todas las intenciones en una sola pasada
+            with metrics.span("intent"):
+                intents = MESSAGE_MATCHER.match(message_body)
             
             # Verificar si es mensaje de inicio de conversación
-            if any(keyword in message_body.lower() for keyword in ['hola', 'hello', 'hi', 'start']):
-                return f"{responses['greeting']}\n\n{responses['understanding']}\n\n{booking_link}\n\n{responses['instructions']}"
+            if 'greeting' in intents:
+                return responses.join(WELCOME_REPLY, url=booking_url)
             
             # Verificar intención de agendar
-            elif any(keyword in message_body.lower() for keyword in scheduling_keywords):
-                return f"{responses['booking_received']}\n\n{booking_link}\n\n{responses['timezone_note']}"
+            elif 'scheduling' in intents:
+                return responses.join(SCHEDULING_REPLY, url=booking_url)
             
             # Respuesta para fechas/horas específicas
-            elif any(word in message_body.lower() for word in ['mañana', 'tomorrow', 'demain', 'morgen', 'domani', 'amanhã']):
-                return f"{responses['booking_received']}\n\n{booking_link}\n\n{responses['instructions']}"
+            elif 'date' in intents:
+                return responses.join(DATE_REPLY, url=booking_url)
             
             # Respuesta para otras consultas
             else:
-                return f"{responses['greeting']}\n\n{responses['understanding']}\n\n{booking_link}\n\n{responses['support']}"
+                return responses.join(DEFAULT_REPLY, url=booking_url)
                 
         except Exception as e:
-            logger.error(f"❌ Error procesando mensaje: {e}")
-            return RESPONSES['es']['error']
+            logger.error("❌ Error procesando mensaje: %s", e, extra={"phone": from_number})
+            return CATALOG.default['error']
     
     def send_whatsapp_message(self, to_number, message):
-        """Enviar mensaje de WhatsApp via Twilio"""
-        try:
-            # Limpiar número - remover prefijo whatsapp si existe
-            clean_to_number = to_number.replace('whatsapp:', '').strip()
-            
-            # URL de la API de Twilio
-            url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-            
-            # Datos del mensaje
-            data = {
-                'From': f'whatsapp:{TWILIO_PHONE_NUMBER}',
-                'To': f'whatsapp:{clean_to_number}',
-                'Body': message
-            }
-            
-            # Headers
-            auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            
-            # Log de debugging
-            logger.info(f"📤 Enviando mensaje a: {clean_to_number}")
-            logger.info(f"📤 Desde: {TWILIO_PHONE_NUMBER}")
-            
-            # Enviar mensaje
-            response = requests.post(url, data=data, auth=auth)
-            
-            if response.status_code == 201:
-                logger.info(f"✅ Mensaje enviado exitosamente a {clean_to_number}")
-                logger.info(f"📨 SID del mensaje: {response.json().get('sid', 'N/A')}")
-            else:
-                logger.error(f"❌ Error enviando mensaje a {clean_to_number}: {response.status_code}")
-                logger.error(f"📄 Respuesta completa: {response.text}")
-                
-        except Exception as e:
-            logger.error(f"❌ Error enviando mensaje de WhatsApp: {e}")
-    
-    def send_confirmation_whatsapp(self, email, name, start_time, event_type):
-        """Enviar confirmación de cita por WhatsApp"""
-        try:
-            # Formatear fecha y hora para mostrar
-            try:
-                dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                formatted_time = dt.strftime("%A, %B %d, %Y at %I:%M %p")
-            except:
-                formatted_time = start_time
-            
-            # Mensaje de confirmación
-            confirmation_message = f"""✅ ¡CITA CONFIRMADA!
-
-📋 **Detalles de tu cita:**
-👤 Nombre: {name}
-📧 Email: {email}
-📅 Fecha y Hora: {formatted_time}
-🏷️ Tipo: {event_type}
-
-¡Tu cita ha sido programada exitosamente!
-
-📧 Recibirás recordatorios automáticos por email.
-💡 Si necesitas modificar o cancelar, usa el enlace en tu email de confirmación.
-
-¡Gracias por usar nuestro servicio! 😊"""
-            
-            # Enviar a número del usuario (por ahora al número configurado)
-            self.send_whatsapp_message(WHATSAPP_PHONE, confirmation_message)
-            
-            logger.info(f"📅 Confirmación enviada para {name} - {formatted_time}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error enviando confirmación: {e}")
+        """Enviar mensaje de WhatsApp via Twilio; devuelve True si Twilio lo aceptó"""
+        return send_whatsapp_message(to_number, message)
     
     def run(self, host='0.0.0.0', port=8000):
         """Ejecutar el servidor Flask"""
-        logger.info(f"🚀 Agente WhatsApp Webhook CORREGIDO iniciado en http://{host}:{port}")
-        logger.info(f"📱 Webhook WhatsApp: http://{host}:{port}/webhook/whatsapp")
-        logger.info(f"📅 Webhook Cal.com: http://{host}:{port}/webhook/cal")
-        logger.info(f"❤️ Health check: http://{host}:{port}/health")
+        logger.info("🚀 Agente WhatsApp Webhook CORREGIDO iniciado en http://%s:%s", host, port)
+        logger.info("📱 Webhook WhatsApp: http://%s:%s/webhook/whatsapp", host, port)
+        logger.info("📅 Webhook Cal.com: http://%s:%s/webhook/cal", host, port)
+        logger.info("❤️ Health check: http://%s:%s/health", host, port)
+        logger.info("📊 Métricas: http://%s:%s/metrics", host, port)
         
         self.app.run(host=host, port=port, debug=True)
 
 def main():
     """Función principal"""
-    print("🤖 INICIANDO AGENTE WHATSAPP WEBHOOK - VERSIÓN CORREGIDA")
-    print("=" * 60)
+    logger.info("🤖 INICIANDO AGENTE WHATSAPP WEBHOOK - VERSIÓN CORREGIDA")
     
     # Verificar credenciales
     required_vars = ['TWILIO_ACCOUNT_SID', 'TWILIO_AUTH_TOKEN', 'WHATSAPP_PHONE', 'TWILIO_PHONE_NUMBER']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
-        print(f"❌ Variables de entorno faltantes: {missing_vars}")
-        print("📝 Por favor configura tu archivo .env")
+        logger.error("❌ Variables de entorno faltantes: %s", missing_vars)
+        logger.error("📝 Por favor configura tu archivo .env")
         return
     
     # Verificar CAL_API_KEY
     if os.getenv('CAL_API_KEY'):
-        print(f"✅ CAL_API_KEY configurada")
+        logger.info("✅ CAL_API_KEY configurada")
     else:
-        print(f"⚠️ CAL_API_KEY no configurada, usando URLs estáticas")
+        logger.warning("⚠️ CAL_API_KEY no configurada, usando URLs estáticas")
     
     # Crear y ejecutar agente
     agent = WhatsAppWebhookAgent()